@@ -1,121 +1,405 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import os
-from werkzeug.utils import secure_filename
+import logging
+from werkzeug.exceptions import RequestEntityTooLarge
 from openai import OpenAI
+from openai.types.chat import ChatCompletion
 from dotenv import load_dotenv
-from docx import Document
-from PyPDF2 import PdfReader
 import re
 import json
-import concurrent.futures
-from transformers import AutoModel, AutoTokenizer, pipeline
-from sentence_transformers import SentenceTransformer
+import queue
+import time
+from collections import Counter
+from contextlib import closing
 import numpy as np
-import torch
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import pdfplumber
-from sklearn.decomposition import PCA
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import normalize
+import threading
+from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from embedding_cache import EmbeddingCache, embed_with_cache
+from encoder_batcher import EncoderBatcher
+from paragraph_reuse import ParagraphReuse
+import structured_output
+from llm_cache import ResponseCache
+from llm_scheduler import LLMScheduler, parse_limits
+from jobs import JobQueue, JobStore, QueueFull
+from models import ModelRegistry
+from segmenter import segment_paragraphs
+from projection import ProjectionBasis
+import telemetry
+from prompts import PromptBuilder, TokenUsage, count_message_tokens, prompt_budget
+from chat import ChatSessions, ChatStore, chat_system_prompt
+from revisions import STATE_VERSION, GradingRecord, Revision, RevisionPlan, content_key
+from rubrics import RubricInvalid, RubricNotFound, RubricStore, validate_criteria
+from documents import DocumentConverter, UploadRejected, SUPPORTED_EXTENSIONS, read_archive, read_limited
+
+# torch, transformers, sentence-transformers, sklearn and the document parsers are
+# imported where they are used, so importing this module (and /test) stays fast
 
 # Load environment variables
 load_dotenv()
 
+# LOG_LEVEL=DEBUG adds per-stage progress lines and one JSON line per trace span
+# ("telemetry" logger); at the default INFO level those cost nothing
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)  # one INFO line per OpenAI call otherwise
+
 app = Flask(__name__)
 CORS(app)
 
-def warmup_longformer():
-    print("\n⚙️ Warming up Longformer model...")
+def warmup_longformer(longformer_tokenizer, longformer_model):
+    import torch
+
+    logger.info("Warming up Longformer model...")
     dummy_input = longformer_tokenizer("Warm-up sentence.", return_tensors="pt", truncation=True, padding="max_length", max_length=512)
+    dummy_input = {k: v.to(longformer_model.device) for k, v in dummy_input.items()}
     with torch.no_grad():
         _ = longformer_model(**dummy_input)
-    print("Warm-up complete.")
+    logger.info("Warm-up complete.")
+
+# Uploads are converted in memory. Limits apply per file while it is read, and to the
+# whole request body; PDFs of PDF_PARALLEL_MIN_PAGES+ pages are extracted by PDF_WORKERS processes
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_MAX_PAGES = int(os.getenv("UPLOAD_MAX_PAGES", "200"))
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(64 * 1024 * 1024)))
+document_converter = DocumentConverter(
+    max_bytes=UPLOAD_MAX_BYTES,
+    max_pages=UPLOAD_MAX_PAGES,
+    parallel_min_pages=int(os.getenv("PDF_PARALLEL_MIN_PAGES", "8")),
+    workers=int(os.getenv("PDF_WORKERS", "0")) or None,
+)
+
+# Longformer for full-essay encoding (handles 4,096 tokens)
+longformer_name = "allenai/longformer-large-4096"
 
-# Configure upload folder
-UPLOAD_FOLDER = 'temp_uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+# Paragraph encoding settings: "paragraph" (one pass each), "batched", "bucketed",
+# or "essay" (one pass over the whole essay, paragraphs pooled from their token spans)
+LONGFORMER_ENCODE_MODE = os.getenv("LONGFORMER_ENCODE_MODE", "bucketed")
+LONGFORMER_MAX_LENGTH = int(os.getenv("LONGFORMER_MAX_LENGTH", "512"))
+# Upper bound on padded tokens per forward pass; keeps batch activations within memory
+LONGFORMER_TOKEN_BUDGET = int(os.getenv("LONGFORMER_TOKEN_BUDGET", "4096"))
+# Essay mode reads up to 4,096 tokens per pass; longer essays use overlapping windows
+LONGFORMER_ESSAY_MAX_LENGTH = int(os.getenv("LONGFORMER_ESSAY_MAX_LENGTH", "4096"))
+LONGFORMER_ESSAY_OVERLAP = int(os.getenv("LONGFORMER_ESSAY_OVERLAP", "512"))
+
+# MiniLM for paragraph embeddings (helps track local context)
+minilm_name = 'all-MiniLM-L6-v2'
+
+# Multi-worker deployments: memory-map encoder weights from this directory so every
+# worker process on the box shares one copy (see shared_weights.py)
+SHARED_WEIGHTS_DIR = os.getenv("SHARED_WEIGHTS_DIR") or None
+
+# Encoder inference backend: "torch" (fp32), "int8" (dynamic int8 quantization of the
+# Linear layers, CPU only) or "onnx" (ONNX Runtime through sentence-transformers, which
+# needs `pip install "sentence-transformers[onnx]"`; MiniLM only, because Longformer's
+# sliding-window attention does not export cleanly, so Longformer stays on torch)
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+LONGFORMER_BACKEND = os.getenv("LONGFORMER_BACKEND", ENCODER_BACKEND if ENCODER_BACKEND != "onnx" else "torch")
+MINILM_BACKEND = os.getenv("MINILM_BACKEND", ENCODER_BACKEND)
+# Quantizing copies the memory-mapped fp32 weights into private memory in every worker,
+# which would silently undo SHARED_WEIGHTS_DIR, so the two are not combined
+if SHARED_WEIGHTS_DIR and "int8" in (LONGFORMER_BACKEND, MINILM_BACKEND):
+    raise ValueError(
+        "SHARED_WEIGHTS_DIR cannot be used with the int8 encoder backend: quantization copies the shared "
+        "weights into each worker. Unset SHARED_WEIGHTS_DIR or use ENCODER_BACKEND=torch (or onnx for MiniLM)."
+    )
+# CPU thread pools for encoder inference; 0 keeps the library defaults
+ENCODER_INTRA_OP_THREADS = int(os.getenv("ENCODER_INTRA_OP_THREADS", "0"))
+ENCODER_INTER_OP_THREADS = int(os.getenv("ENCODER_INTER_OP_THREADS", "0"))
 
-# Load Longformer for full-essay encoding (handles 4,096 tokens)
-longformer_name = "allenai/longformer-large-4096"
-longformer_tokenizer = AutoTokenizer.from_pretrained(longformer_name)
-longformer_model = AutoModel.from_pretrained(longformer_name)
+# Embeddings from different backends differ slightly, so they are cached separately
+LONGFORMER_CACHE_NAME = f"{longformer_name}:{LONGFORMER_MAX_LENGTH}" + (f":{LONGFORMER_BACKEND}" if LONGFORMER_BACKEND != "torch" else "")
+MINILM_CACHE_NAME = minilm_name + (f":{MINILM_BACKEND}" if MINILM_BACKEND != "torch" else "")
 
-# Move model to GPU if available
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-longformer_model.to(device)
-print(f"Longformer is now on device: {device}")
+_torch_threads_configured = False
 
-warmup_longformer()  # Warm it up once when app starts
 
-# Load MiniLM for paragraph embeddings (helps track local context)
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+def configure_torch_threads():
+    """Applies ENCODER_*_THREADS to torch once per process, before the first model runs."""
+    global _torch_threads_configured
+    if _torch_threads_configured:
+        return
+    _torch_threads_configured = True
 
-# Initialize OpenAI client
-client = OpenAI()
+    import torch
 
-# File conversion functions (from your existing code)
-def convert_to_text(file_path):
-    """Convert a document file to text."""
-    file_extension = os.path.splitext(file_path)[1].lower()
-    
-    try:
-        if file_extension == '.pdf':
-            return convert_pdf(file_path)
-        elif file_extension == '.docx':
-            return convert_docx(file_path)
-        elif file_extension == '.txt':
-            return convert_txt(file_path)
-        else:
-            return f"Unsupported file format: {file_extension}"
-    except Exception as e:
-        return f"Error converting file: {str(e)}"
+    if ENCODER_INTRA_OP_THREADS:
+        torch.set_num_threads(ENCODER_INTRA_OP_THREADS)
+    if ENCODER_INTER_OP_THREADS:
+        try:
+            torch.set_num_interop_threads(ENCODER_INTER_OP_THREADS)
+        except RuntimeError as e:  # only allowed before any inter-op parallel work has started
+            logger.warning("Could not set inter-op threads: %s", e)
 
 
+def quantize_int8(module):
+    """Dynamic int8 quantization: Linear weights stored as int8, activations quantized per batch."""
+    import torch
 
-def convert_pdf(file_path):
-    """Extract rubric text from a PDF while preserving structure."""
-    text = []
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
 
-    with pdfplumber.open(file_path) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text.append(page_text.strip())  # Strips unnecessary spaces
-    
-    final_text = "\n\n".join(text)  # Keep paragraphs separate
-    print(final_text)  # Debugging print
-    return final_text
-"""
-    for page in reader.pages:
-        page_text = page.extract_text()
-        if page_text:
-            text.append(page_text)  # store extracted text from each page
-    final_text = " ".join(text) # join all pages into one text block
-    print(final_text)
-    return final_text
-"""
-
-def convert_docx(file_path):
-    """Convert DOCX to text."""
-    doc = Document(file_path)
-    text = []
-    for paragraph in doc.paragraphs:
-        text.append(paragraph.text)
-    return '\n'.join(text)
-
-def convert_txt(file_path):
-    """Convert TXT to text."""
-    with open(file_path, 'r', encoding='utf-8') as file:
-        return file.read()
-
-def split_paragraphs_gpt(essay_text):
+
+def load_longformer():
+    """Loads the Longformer tokenizer and model, moves the model to the GPU if available and warms it up."""
+    import torch
+    from transformers import AutoConfig, AutoModel, AutoTokenizer
+
+    if LONGFORMER_BACKEND not in ("torch", "int8"):
+        raise ValueError(f"Unsupported Longformer backend: {LONGFORMER_BACKEND} (use torch or int8)")
+    configure_torch_threads()
+
+    longformer_tokenizer = AutoTokenizer.from_pretrained(longformer_name)
+    if SHARED_WEIGHTS_DIR:
+        from shared_weights import load_shared_module
+
+        longformer_model = load_shared_module(
+            SHARED_WEIGHTS_DIR, "longformer",
+            lambda: AutoModel.from_pretrained(longformer_name),
+            lambda: AutoModel.from_config(AutoConfig.from_pretrained(longformer_name)),
+        )
+    else:
+        longformer_model = AutoModel.from_pretrained(longformer_name)
+    longformer_model.eval()
+
+    if LONGFORMER_BACKEND == "int8":
+        # Quantized kernels are CPU-only
+        longformer_model = quantize_int8(longformer_model)
+        device = torch.device('cpu')
+    else:
+        # Move model to GPU if available
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    longformer_model.to(device)
+    logger.info("Longformer is now on device: %s", device)
+
+    warmup_longformer(longformer_tokenizer, longformer_model)
+    return longformer_tokenizer, longformer_model
+
+
+def load_minilm():
+    from sentence_transformers import SentenceTransformer
+
+    if MINILM_BACKEND not in ("torch", "int8", "onnx"):
+        raise ValueError(f"Unsupported MiniLM backend: {MINILM_BACKEND} (use torch, int8 or onnx)")
+    configure_torch_threads()
+
+    if MINILM_BACKEND == "onnx":
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = ENCODER_INTRA_OP_THREADS
+        session_options.inter_op_num_threads = ENCODER_INTER_OP_THREADS
+        return SentenceTransformer(minilm_name, device="cpu", backend="onnx", model_kwargs={
+            "provider": "CPUExecutionProvider",
+            "session_options": session_options,
+        })
+
+    if SHARED_WEIGHTS_DIR:
+        from shared_weights import load_shared_module
+
+        minilm_model = load_shared_module(SHARED_WEIGHTS_DIR, "minilm", lambda: SentenceTransformer(minilm_name, device="cpu"))
+    else:
+        minilm_model = SentenceTransformer(minilm_name, device="cpu" if MINILM_BACKEND == "int8" else None)
+    return quantize_int8(minilm_model) if MINILM_BACKEND == "int8" else minilm_model
+
+
+# Models load on first use, or in the background once the server takes its first
+# request (MODEL_WARMUP=lazy skips the background warmup)
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "background")
+model_registry = ModelRegistry()
+model_registry.register("longformer", load_longformer)
+model_registry.register("minilm", load_minilm)
+
+
+def get_longformer():
+    """Returns (tokenizer, model) for Longformer."""
+    return model_registry.get("longformer")
+
+
+def get_minilm():
+    return model_registry.get("minilm")
+
+
+def longformer_attention_window():
+    window = get_longformer()[1].config.attention_window
+    return max(window) if isinstance(window, (list, tuple)) else window
+
+
+# Encoder calls from concurrent requests are merged into micro-batches of up to
+# ENCODER_BATCH_MAX_SIZE texts, run by one thread per model (see encoder_batcher.py).
+# An idle model waits up to ENCODER_BATCH_MAX_WAIT_MS for more requests to join a batch;
+# ENCODER_BATCHING=0 encodes on each request's own thread instead
+ENCODER_BATCHING = os.getenv("ENCODER_BATCHING", "1") == "1"
+ENCODER_BATCH_MAX_SIZE = int(os.getenv("ENCODER_BATCH_MAX_SIZE", "64"))
+ENCODER_BATCH_MAX_WAIT_MS = float(os.getenv("ENCODER_BATCH_MAX_WAIT_MS", "5"))
+# Batches mix paragraphs from several essays, so Longformer batches are always length-bucketed
+longformer_batcher = EncoderBatcher(
+    "longformer", lambda texts: encode_longformer_batches(texts, "bucketed"),
+    ENCODER_BATCH_MAX_SIZE, ENCODER_BATCH_MAX_WAIT_MS / 1000,
+)
+minilm_batcher = EncoderBatcher(
+    "minilm", lambda texts: get_minilm().encode(texts),
+    ENCODER_BATCH_MAX_SIZE, ENCODER_BATCH_MAX_WAIT_MS / 1000,
+)
+
+
+def minilm_encode(texts):
+    """MiniLM embeddings of `texts`, through the micro-batcher when ENCODER_BATCHING is on."""
+    return minilm_batcher.encode(texts) if ENCODER_BATCHING else get_minilm().encode(texts)
+
+
+# Cache paragraph embeddings by content so resubmitted essays only re-encode edited paragraphs
+embedding_cache = EmbeddingCache(
+    max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")),
+    disk_dir=os.getenv("EMBEDDING_CACHE_DIR") or None,  # optional on-disk float16 tier
+    disk_max_entries=int(os.getenv("EMBEDDING_CACHE_DISK_ENTRIES", "100000")),
+)
+
+# Initialize OpenAI client (retries are handled by the LLM scheduler)
+client = OpenAI(max_retries=0)
+
+# One scheduler for every LLM call in the process: shared concurrency cap, per-model
+# rate limits (e.g. LLM_RPM_LIMITS="gpt-4o=500,gpt-4o-mini=5000"), retries with backoff
+llm_scheduler = LLMScheduler(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "16")),
+    requests_per_minute=parse_limits(os.getenv("LLM_RPM_LIMITS")),
+    tokens_per_minute=parse_limits(os.getenv("LLM_TPM_LIMITS")),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "5")),
+)
+# Spans share their request's scheduler ID as the trace ID, on worker threads too
+telemetry.set_trace_id_source(llm_scheduler.current_request_id)
+
+# Persistent cache for repeatable LLM calls (rubric parse, paragraph split, theme); LLM_CACHE_PATH= disables it
+llm_cache_path = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+llm_cache = ResponseCache(
+    llm_cache_path,
+    ttl_seconds=int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+) if llm_cache_path else None
+
+
+# Prompt and completion tokens per pipeline stage (GET /llm/usage)
+token_usage = TokenUsage()
+
+# Per-model prompt token caps (e.g. PROMPT_TOKEN_BUDGETS="gpt-4o-mini=6000"), on top of each
+# model's context window; over-budget prompts lose their lowest-value context first
+PROMPT_TOKEN_BUDGETS = {model: int(limit) for model, limit in parse_limits(os.getenv("PROMPT_TOKEN_BUDGETS")).items()}
+
+
+def estimate_request_tokens(params):
+    """Tokens/min cost of a request: its prompt tokens (counted locally) plus the completion allowance."""
+    return count_message_tokens(params.get("messages", []), params.get("model")) + params.get("max_tokens", 1000)
+
+
+def lookup_cached_completion(use_cache, params):
+    """Returns (cache key or None, cached ChatCompletion or None) for a request."""
+    key = llm_cache.key(params) if use_cache and llm_cache is not None else None
+    cached = llm_cache.get(key) if key is not None else None
+    return key, ChatCompletion.model_validate(cached) if cached is not None else None
+
+
+def store_cached_completion(key, params, response):
+    # Truncated responses are not worth replaying
+    if key is not None and response.choices and response.choices[0].finish_reason == "stop":
+        llm_cache.put(key, response.model_dump(mode="json"), model=params.get("model"))
+
+
+def record_token_usage(stage, params, response):
+    # Streamed responses report usage in their last chunk; the caller records those
+    if not params.get("stream"):
+        token_usage.record(stage, response.usage, count_message_tokens(params.get("messages", []), params.get("model")))
+        telemetry.record_llm_usage(params.get("model"), response.usage)
+
+
+def create_chat_completion(client, use_cache=False, stage=None, **params):
     """
-    Uses GPT-4o to intelligently split essay into paragraphs based on logical flow.
+    Calls client.chat.completions.create(**params) through the LLM scheduler. With
+    use_cache=True the response is served from (or stored in) the persistent response
+    cache, keyed by all params. Token usage is counted under `stage`. With stream=True
+    it returns a generator of chunks (never cached; the caller records the usage).
+    """
+    key, cached = lookup_cached_completion(use_cache, params)
+    if cached is not None:
+        token_usage.record(stage, cache_hit=True)
+        telemetry.llm_response_cache_hits.inc(stage=stage or "other")
+        return cached
+
+    if params.get("stream"):
+        # The scheduler slot is held while the caller reads the stream, not just while it opens
+        return llm_scheduler.stream(
+            lambda: client.chat.completions.create(**params),
+            model=params.get("model"),
+            estimated_tokens=estimate_request_tokens(params),
+        )
+
+    started = time.perf_counter()
+    response = llm_scheduler.call(
+        lambda: client.chat.completions.create(**params),
+        model=params.get("model"),
+        estimated_tokens=estimate_request_tokens(params),
+    )
+    telemetry.llm_seconds.observe(time.perf_counter() - started, model=params.get("model"), stage=stage or "other")
+    record_token_usage(stage, params, response)
+    store_cached_completion(key, params, response)
+    return response
+
+
+def structured_completion(client, stage, name, params):
+    """
+    create_chat_completion for a JSON reply with schema `name` (structured_output.py):
+    parsed tolerantly, with one repair call if the reply is unusable. Raises
+    StructuredOutputError when it cannot be repaired.
     """
-    print("\n Asking GPT-4o to split essay into logical paragraphs...")
+    response = create_chat_completion(client, stage=stage, **params)
+    return structured_output.parse_reply(
+        name, stage, response, lambda repair: create_chat_completion(client, stage=f"{stage}_repair", **repair)
+    )
+
+# Paragraph evaluation: "per_criterion" (one call per paragraph per criterion) or
+# "multi_criterion" (one call grades a paragraph against every criterion)
+EVALUATION_MODE = os.getenv("EVALUATION_MODE", "per_criterion")
+# Multi-criterion mode: paragraph tokens per call (0 = one paragraph per call)
+EVALUATION_GROUP_TOKEN_BUDGET = int(os.getenv("EVALUATION_GROUP_TOKEN_BUDGET", "0"))
+# A paragraph whose MiniLM embedding is within PARAGRAPH_REUSE_THRESHOLD cosine similarity
+# of one already graded against the same criterion gets that evaluation instead of an LLM
+# call (see paragraph_reuse.py). Each criterion's index keeps PARAGRAPH_REUSE_MAX_ENTRIES
+# paragraphs, for up to PARAGRAPH_REUSE_MAX_CRITERIA criteria; PARAGRAPH_REUSE=0 disables it
+PARAGRAPH_REUSE = os.getenv("PARAGRAPH_REUSE", "1") == "1"
+paragraph_reuse = ParagraphReuse(
+    threshold=float(os.getenv("PARAGRAPH_REUSE_THRESHOLD", "0.97")),
+    max_entries=int(os.getenv("PARAGRAPH_REUSE_MAX_ENTRIES", "5000")),
+    max_indexes=int(os.getenv("PARAGRAPH_REUSE_MAX_CRITERIA", "64")),
+)
+
+# Revisions (previous_analysis_id): above this share of paragraphs to re-grade, the essay
+# is graded from scratch (new theme included) instead of incrementally
+REVISION_MAX_CHANGED_SHARE = float(os.getenv("REVISION_MAX_CHANGED_SHARE", "0.5"))
+
+# Paragraph segmentation: "local" (document structure, then MiniLM topic shifts; GPT-4o
+# only if that fails), "hybrid" (document structure, GPT-4o for unstructured text) or
+# "gpt" (always GPT-4o, the original behaviour)
+PARAGRAPH_SEGMENTER = os.getenv("PARAGRAPH_SEGMENTER", "local")
+SEGMENT_MIN_SENTENCES = int(os.getenv("SEGMENT_MIN_SENTENCES", "3"))
+SEGMENT_MAX_SENTENCES = int(os.getenv("SEGMENT_MAX_SENTENCES", "10"))
+
+# Offline-fitted basis for the summary's dominant features (refit with projection.py);
+# without one, each essay falls back to its own PCA
+PROJECTION_BASIS_PATH = os.getenv("PROJECTION_BASIS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "projection_basis.npz"))
+PROJECTION_COMPONENTS = 5
 
+# File conversion functions (from your existing code)
+def convert_to_text(file_path):
+    """Convert a document file to text."""
+    try:
+        with open(file_path, 'rb') as file:
+            return document_converter.convert_stream(os.path.basename(file_path), file)
+    except UploadRejected:
+        raise
+    except Exception as e:
+        return f"Error converting file: {str(e)}"
+
+def split_paragraphs_request(essay_text):
+    """Chat completion parameters for the GPT-4o paragraph split."""
     prompt = f"""
     You are an expert essay grader.
 
@@ -132,29 +416,86 @@ def split_paragraphs_gpt(essay_text):
     Essay:
     {essay_text}
     """
+    return {
+        "model": "gpt-4o",
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.2,
+    }
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.2,
-            )
-
-    print("\n GPT-4o returned split paragraphs.")  
 
+def parse_split_paragraphs(response):
+    """
+    Parses the numbered list. A line starts a new paragraph only if it is unindented and
+    carries the next expected number, so numbered lines inside a paragraph stay part of it.
+    """
     output = response.choices[0].message.content.strip()
-    paragraphs = [p.split('. ', 1)[1] for p in output.split('\n') if p and '. ' in p]
+    paragraphs = []
+    for line in output.split('\n'):
+        match = re.match(r'(\d+)[.)]\s+(.*)', line)
+        if match and int(match.group(1)) == len(paragraphs) + 1:
+            paragraphs.append(match.group(2).strip())
+        elif paragraphs and line.strip():
+            paragraphs[-1] += '\n' + line.strip()
+    return paragraphs
+
+
+def split_paragraphs_gpt(essay_text, use_cache=True):
+    """
+    Uses GPT-4o to intelligently split essay into paragraphs based on logical flow.
+    """
+    logger.debug("Asking GPT-4o to split essay into logical paragraphs...")
+    response = create_chat_completion(client, use_cache=use_cache, stage="split", **split_paragraphs_request(essay_text))
+    return parse_split_paragraphs(response)
 
+
+def split_paragraphs_local(essay_text):
+    """
+    Splits the essay without an LLM (see segmenter.py), according to PARAGRAPH_SEGMENTER.
+    Returns None when GPT-4o should do the split instead.
+    """
+    if PARAGRAPH_SEGMENTER == "gpt":
+        return None
+    encode = minilm_encode if PARAGRAPH_SEGMENTER == "local" else None
+    try:
+        paragraphs, method = segment_paragraphs(essay_text, encode, SEGMENT_MIN_SENTENCES, SEGMENT_MAX_SENTENCES)
+    except Exception as e:
+        logger.warning("Local paragraph segmentation failed: %s", e)
+        return None
+    if not paragraphs:
+        return None
+    logger.debug("Split essay into %d paragraphs locally (%s).", len(paragraphs), method)
+    return paragraphs
+
+
+def split_paragraphs(essay_text, use_cache=True):
+    """Local segmentation first, GPT-4o as the fallback."""
+    with telemetry.span("split", method="local") as attributes:
+        paragraphs = split_paragraphs_local(essay_text)
+        if paragraphs is None:
+            attributes["method"] = "gpt"
+            paragraphs = split_paragraphs_gpt(essay_text, use_cache)
+        attributes["paragraphs"] = len(paragraphs)
     return paragraphs
 
 # META-ANALYSIS PIPLINE
-def compute_coherence_with_minilm(paragraphs):
+def minilm_embed_paragraphs(paragraphs):
+    """MiniLM embeddings of `paragraphs`, encoding only those not already cached."""
+    return embed_with_cache(embedding_cache, MINILM_CACHE_NAME, paragraphs, minilm_encode)
+
+
+@telemetry.traced("minilm_coherence")
+def compute_coherence_with_minilm(paragraphs, embeddings=None):
     """
     Compute coherence between paragraphs using MiniLM (sentence-transformers).
+    `embeddings` can be passed in when they were already encoded (e.g. in a bulk batch).
     """
+    from sklearn.metrics.pairwise import cosine_similarity
+    from sklearn.preprocessing import normalize
+
     #print("\n Computing coherence with MiniLM...")
 
-    # Generate embeddings using MiniLM
-    embeddings = embedding_model.encode(paragraphs)
+    if embeddings is None:
+        embeddings = minilm_embed_paragraphs(paragraphs)
 
     # Normalize for cosine similarity
     normalized_embeddings = normalize(embeddings)
@@ -170,29 +511,25 @@ def compute_coherence_with_minilm(paragraphs):
 
     return avg_coherence, coherence_scores
 
-def convert_context_to_text(paragraph_embeddings, context_vectors, paragraphs):
+def convert_context_to_text(paragraph_embeddings, context_vectors, paragraphs, minilm_embeddings=None):
     """
     Converts Longformer embeddings into structured, human-readable text for GPT,
     using both paragraph embeddings and accumulated context vectors.
     Also uses MiniLM for coherence checking (external to embeddings).
     """
-    print("\n Converting paragraph embeddings and context vectors into structured text...") 
+    logger.debug("Converting paragraph embeddings and context vectors into structured text...")
 
     # Combine paragraph embeddings with context vectors (mean of both)
-    combined_embeddings = [
-        (np.array(para_emb) + np.array(context_vec)) / 2
-        for para_emb, context_vec in zip(paragraph_embeddings, context_vectors)
-    ]
+    combined_embeddings = (np.asarray(paragraph_embeddings) + np.asarray(context_vectors)) / 2
 
-    # Reduce dimensions with PCA
-    pca = PCA(n_components=5)
-    reduced_vectors = pca.fit_transform(combined_embeddings)
+    # Reduce dimensions (fixed basis, so feature numbers mean the same in every essay)
+    reduced_vectors = reduce_embeddings(combined_embeddings)
 
     # Extract dominant features for each paragraph
     dominant_features = np.argmax(reduced_vectors, axis=1)
 
     # Compute coherence using MiniLM instead of Longformer embeddings
-    avg_coherence, coherence_scores = compute_coherence_with_minilm(paragraphs)
+    avg_coherence, coherence_scores = compute_coherence_with_minilm(paragraphs, minilm_embeddings)
 
     # Final accumulated context vector (last one) to be summarized
     final_context_vector = context_vectors[-1] if context_vectors else [0] * 1024
@@ -210,46 +547,260 @@ def convert_context_to_text(paragraph_embeddings, context_vectors, paragraphs):
     return summary
 
 
-def encode_paragraphs_with_longformer(paragraphs):
-    """Encodes each paragraph with Longformer and analyzes raw coherence."""
-    
-    context_dim = 1024
-    context_vector = np.zeros((context_dim,))  # Used for context building (not coherence testing)
-    context_vectors = []  # Store smoothed context vectors for other purposes
+def masked_mean_pool(last_hidden_state, attention_mask):
+    """Mean-pools token states over real tokens only, ignoring padding."""
+    mask = attention_mask.unsqueeze(-1).to(last_hidden_state.dtype)
+    summed = (last_hidden_state * mask).sum(dim=1)
+    counts = mask.sum(dim=1).clamp(min=1e-9)
+    return summed / counts
 
-    paragraph_embeddings = []  # Store raw embeddings for coherence
 
-    for idx, para in enumerate(paragraphs):
-        print(f"\n🔹 Processing Paragraph {idx + 1}: {para[:60]}...")  
+def plan_longformer_batches(lengths, mode, window=None):
+    """
+    Groups paragraph indices into forward-pass batches.
 
-        tokens = longformer_tokenizer(para, return_tensors="pt", truncation=True, padding="max_length", max_length=512)
-        tokens = {k: v.to(device) for k, v in tokens.items()}  #  Move to GPU
+    - "paragraph": one paragraph per pass (the original behaviour).
+    - "batched": paragraphs in essay order, as many per pass as the token budget allows.
+    - "bucketed": paragraphs sorted by length first, so each pass pads to a similar size.
+
+    Longformer pads every input to a multiple of its attention window internally, so
+    batch cost is estimated from the window-rounded length (`window` defaults to the
+    loaded model's attention window).
+    """
+    window = window or longformer_attention_window()
+
+    def padded(length):
+        return -(-length // window) * window
+
+    if mode == "paragraph":
+        return [[i] for i in range(len(lengths))]
+
+    order = list(range(len(lengths)))
+    if mode == "bucketed":
+        order.sort(key=lambda i: lengths[i])
+    elif mode != "batched":
+        raise ValueError(f"Unknown Longformer encode mode: {mode}")
+
+    batches, current, current_len = [], [], 0
+    for i in order:
+        new_len = max(current_len, padded(lengths[i]))
+        if current and new_len * (len(current) + 1) > LONGFORMER_TOKEN_BUDGET:
+            batches.append(current)
+            current, new_len = [], padded(lengths[i])
+        current.append(i)
+        current_len = new_len
+    if current:
+        batches.append(current)
+    return batches
+
+
+@telemetry.traced("longformer_encode")
+def longformer_embed_paragraphs(paragraphs, mode=None, use_cache=True):
+    """
+    Encodes paragraphs with Longformer and returns an (N, hidden_size) array of
+    mask-aware mean-pooled embeddings, in the same order as `paragraphs`. An explicit
+    `mode` is always honored; only the default mode goes through the micro-batcher,
+    which buckets every batch.
+    """
+    explicit = mode is not None
+    mode = mode or LONGFORMER_ENCODE_MODE
+    if not paragraphs:
+        return np.zeros((0, get_longformer()[1].config.hidden_size), dtype=np.float32)
+    if mode == "essay":
+        # Essay-mode embeddings depend on the surrounding paragraphs, so they are not cached per paragraph
+        return longformer_embed_essay(paragraphs)
+
+    if ENCODER_BATCHING and not explicit and mode in ("batched", "bucketed"):
+        encode = longformer_batcher.encode
+    else:
+        encode = lambda texts: encode_longformer_batches(texts, mode)
+    return embed_with_cache(embedding_cache if use_cache else None, LONGFORMER_CACHE_NAME, paragraphs, encode)
+
+
+def encode_longformer_batches(paragraphs, mode):
+    """Runs the Longformer forward passes for `paragraphs`, grouped according to `mode`."""
+    import torch
+
+    longformer_tokenizer, longformer_model = get_longformer()
+    hidden_size = longformer_model.config.hidden_size
+
+    # Tokenize without padding; each batch is padded only to its own longest member
+    encoded = longformer_tokenizer(paragraphs, truncation=True, max_length=LONGFORMER_MAX_LENGTH)
+    lengths = [len(ids) for ids in encoded["input_ids"]]
+    batches = plan_longformer_batches(lengths, mode)
+
+    embeddings = np.zeros((len(paragraphs), hidden_size), dtype=np.float32)
+    for batch in batches:
+        features = [{"input_ids": encoded["input_ids"][i], "attention_mask": encoded["attention_mask"][i]} for i in batch]
+        tokens = longformer_tokenizer.pad(features, padding=True, return_tensors="pt")
+        tokens = {k: v.to(longformer_model.device) for k, v in tokens.items()}  #  Move to GPU
 
         with torch.no_grad():
             outputs = longformer_model(**tokens)
 
-        # Use mean pooling for better representation of paragraph
-        para_embedding = outputs.last_hidden_state.mean(dim=1).squeeze().numpy()
+        pooled = masked_mean_pool(outputs.last_hidden_state, tokens["attention_mask"])
+        embeddings[batch] = pooled.cpu().numpy()
 
-        # Save raw paragraph embeddings for coherence
-        paragraph_embeddings.append(para_embedding.tolist())
+    logger.debug("Encoded %d paragraphs in %d Longformer pass(es) (%s)", len(paragraphs), len(batches), mode)
+    return embeddings
 
-        # Also build smoothed context vector (for other context analysis purposes)
-        alpha = 0.7  
-        context_vector = alpha * context_vector + (1 - alpha) * para_embedding # recursive context formula
-        context_vectors.append(context_vector.tolist())  
 
-    # Convert raw paragraph embeddings to GPT-readable summary
-    context_summary = convert_context_to_text(paragraph_embeddings, context_vectors, paragraphs)
+def map_tokens_to_paragraphs(offsets, spans):
+    """Returns the paragraph index of every token (-1 for separators and special tokens)."""
+    token_paragraph = np.full(len(offsets), -1, dtype=np.int64)
+    j = 0
+    for t, (start, end) in enumerate(offsets):
+        if end <= start:
+            continue
+        while j < len(spans) and spans[j][1] <= start:
+            j += 1
+        if j < len(spans) and start < spans[j][1] and end > spans[j][0]:
+            token_paragraph[t] = j
+    return token_paragraph
 
-    return context_summary  # Return both context and summary
 
-def extract_essay_theme_gpt(essay_text):
+def longformer_embed_essay(paragraphs):
     """
-    Uses GPT to extract a clear, single-sentence essay theme.
+    Encodes the whole essay in a single Longformer pass (when it fits) so every paragraph
+    is read in the context of the others. Paragraph-start tokens get global attention, and
+    each paragraph embedding is mean-pooled from its own token span.
+
+    Essays longer than LONGFORMER_ESSAY_MAX_LENGTH are read in overlapping windows; tokens
+    covered by more than one window average their hidden states.
     """
-    print("\n🔄 Asking GPT to extract essay theme...")  # Debug print
+    import torch
+
+    longformer_tokenizer, longformer_model = get_longformer()
+    device = longformer_model.device
+    hidden_size = longformer_model.config.hidden_size
+
+    # Join paragraphs and remember each one's character span
+    separator = "\n\n"
+    text, spans = "", []
+    for para in paragraphs:
+        if text:
+            text += separator
+        spans.append((len(text), len(text) + len(para)))
+        text += para
+
+    encoded = longformer_tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+    input_ids = encoded["input_ids"]
+    token_paragraph = map_tokens_to_paragraphs(encoded["offset_mapping"], spans)
+
+    embeddings = np.zeros((len(paragraphs), hidden_size), dtype=np.float32)
+    if not input_ids:
+        return embeddings
+
+    paragraph_starts = set()
+    for j in range(len(paragraphs)):
+        positions = np.flatnonzero(token_paragraph == j)
+        if len(positions):
+            paragraph_starts.add(int(positions[0]))
+
+    window = LONGFORMER_ESSAY_MAX_LENGTH - 2  # room for <s> and </s>
+    stride = max(1, window - LONGFORMER_ESSAY_OVERLAP)
+    token_states = np.zeros((len(input_ids), hidden_size), dtype=np.float32)
+    token_hits = np.zeros(len(input_ids), dtype=np.float32)
+
+    passes, begin = 0, 0
+    while True:
+        end = min(begin + window, len(input_ids))
+        chunk = [longformer_tokenizer.cls_token_id] + input_ids[begin:end] + [longformer_tokenizer.sep_token_id]
+
+        global_attention = [0] * len(chunk)
+        global_attention[0] = 1
+        for t in range(begin, end):
+            # A paragraph cut by the window edge gets its first visible token as its start
+            if t in paragraph_starts or (t == begin and token_paragraph[t] >= 0):
+                global_attention[t - begin + 1] = 1
+
+        tokens = {
+            "input_ids": torch.tensor([chunk], device=device),
+            "attention_mask": torch.ones((1, len(chunk)), dtype=torch.long, device=device),
+            "global_attention_mask": torch.tensor([global_attention], device=device),
+        }
+        with torch.no_grad():
+            outputs = longformer_model(**tokens)
+
+        token_states[begin:end] += outputs.last_hidden_state[0, 1:-1].cpu().numpy()
+        token_hits[begin:end] += 1
+        passes += 1
+
+        if end == len(input_ids):
+            break
+        begin += stride
+
+    token_states /= np.maximum(token_hits, 1)[:, None]
+    for j in range(len(paragraphs)):
+        mask = token_paragraph == j
+        if mask.any():
+            embeddings[j] = token_states[mask].mean(axis=0)
+
+    logger.debug("Encoded %d paragraphs from %d essay tokens in %d Longformer pass(es) (essay)", len(paragraphs), len(input_ids), passes)
+    return embeddings
+
+
+@lru_cache(maxsize=1)
+def get_projection_basis():
+    """The offline projection basis, or None if there is no usable one."""
+    if not os.path.exists(PROJECTION_BASIS_PATH):
+        logger.warning("No projection basis at %s; using per-essay PCA", PROJECTION_BASIS_PATH)
+        return None
+    basis = ProjectionBasis.load(PROJECTION_BASIS_PATH)
+    if basis.model and basis.model != longformer_name:
+        logger.warning("Projection basis was fitted for %s, not %s; using per-essay PCA", basis.model, longformer_name)
+        return None
+    return basis
+
+
+def reduce_embeddings(vectors):
+    """Projects (n, dim) vectors onto the offline basis, or fits a per-essay PCA when there is none."""
+    if len(vectors) == 0:
+        return np.zeros((0, PROJECTION_COMPONENTS), dtype=np.float32)
+    basis = get_projection_basis()
+    if basis is not None and basis.dim == vectors.shape[1]:
+        return basis.project(vectors)
+
+    from sklearn.decomposition import PCA
+
+    # An essay cannot have more components than paragraphs
+    return PCA(n_components=min(PROJECTION_COMPONENTS, *vectors.shape)).fit_transform(vectors)
+
 
+def combined_paragraph_vectors(paragraphs):
+    """The vectors convert_context_to_text reduces: mean of each paragraph embedding and its context vector."""
+    paragraph_embeddings = longformer_embed_paragraphs(paragraphs)
+    return (paragraph_embeddings + np.asarray(build_context_vectors(paragraph_embeddings))) / 2
+
+
+def build_context_vectors(paragraph_embeddings, alpha=0.7):
+    """Builds the smoothed (EMA) context vector after each paragraph."""
+    context_vector = np.zeros((paragraph_embeddings.shape[1],))
+    context_vectors = []
+    for para_embedding in paragraph_embeddings:
+        context_vector = alpha * context_vector + (1 - alpha) * para_embedding  # recursive context formula
+        context_vectors.append(context_vector.tolist())
+    return context_vectors
+
+
+def encode_paragraphs_with_longformer(paragraphs, paragraph_embeddings=None, minilm_embeddings=None):
+    """
+    Encodes each paragraph with Longformer and analyzes raw coherence. Embeddings
+    that were already encoded (e.g. in a bulk batch) can be passed in.
+    """
+
+    # Raw paragraph embeddings (for coherence) and smoothed context vectors (for other context analysis purposes)
+    if paragraph_embeddings is None:
+        paragraph_embeddings = longformer_embed_paragraphs(paragraphs)
+    context_vectors = build_context_vectors(paragraph_embeddings)
+
+    # Convert raw paragraph embeddings to GPT-readable summary
+    context_summary = convert_context_to_text(paragraph_embeddings.tolist(), context_vectors, paragraphs, minilm_embeddings)
+
+    return context_summary  # Return both context and summary
+
+def essay_theme_request(essay_text):
+    """Chat completion parameters for the one-sentence essay theme."""
     prompt = f"""
     You are an expert essay evaluator.
 
@@ -260,43 +811,86 @@ def extract_essay_theme_gpt(essay_text):
     Essay:
     {essay_text}
     """
+    return {
+        "model": "gpt-4o",
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.2,
+    }
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.2,
-    )
 
+@telemetry.traced("theme")
+def extract_essay_theme_gpt(essay_text, use_cache=True):
+    """
+    Uses GPT to extract a clear, single-sentence essay theme.
+    """
+    logger.debug("Asking GPT to extract essay theme...")
+
+    response = create_chat_completion(client, use_cache=use_cache, stage="theme", **essay_theme_request(essay_text))
     return response.choices[0].message.content.strip()
 
-def process_rubric_and_pipeline(essay_text, rubric_text):
+def completed_future(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def emit_when_done(future, on_event, event, to_data):
+    """Calls on_event(event, to_data(result)) as soon as `future` succeeds."""
+    if on_event is None:
+        return
+
+    def callback(done):
+        if done.exception() is None:
+            on_event(event, to_data(done.result()))
+    future.add_done_callback(callback)
+
+
+def process_rubric_and_pipeline(essay_text, rubric_text, on_event=None, paragraphs=None, theme=None, rubric=None):
     """
     Runs the full pipeline with parallelized meta-analysis:
-    1. Splits essay into paragraphs (GPT-4o)
+    1. Splits essay into paragraphs (locally, GPT-4o as fallback)
     2. Extracts essay theme (GPT-4o)
     3. Encodes paragraphs with Longformer
     4. Generates structured summary
     
     Args:
         essay_text (str): Full essay text.
+        on_event (callable, optional): Called as on_event(name, data) as each stage finishes
+            ("rubric_parsed", "paragraphs", "theme", "structured_summary").
+        paragraphs, theme (optional): Already known (e.g. for a revision), so not redone.
+        rubric (optional): A rubric library version (RubricStore.get), used instead of
+            parsing `rubric_text`; its precompiled criteria are passed on in the result.
         
     Returns:
         dict: Full pipeline output including structured summary, GPT theme, and paragraphs.
     """
     
-    # Step 1: Parallel execution of paragraph splitting and theme extraction
-    with ThreadPoolExecutor(max_workers=3) as executor:
-        future_rubric = executor.submit(extract_rubric_from_text, rubric_text)
-        future_split = executor.submit(split_paragraphs_gpt, essay_text)
-        future_theme = executor.submit(extract_essay_theme_gpt, essay_text)
-
-        # Collect both results when ready
-        rubric_parsed = future_rubric.result()
-        paragraphs = future_split.result()
-        theme = future_theme.result()
+    # Step 1: Rubric parsing and theme extraction run on the LLM scheduler while the
+    # paragraphs are split locally (falling back to GPT-4o) on this thread
+    if rubric is None:
+        future_rubric = llm_scheduler.submit(lambda: extract_rubric_from_text(rubric_text))
+    else:
+        future_rubric = completed_future(json.dumps({"Criteria": rubric["criteria"]}))
+    if theme is None:
+        future_theme = llm_scheduler.submit(lambda: extract_essay_theme_gpt(essay_text))
+    else:
+        future_theme = completed_future(theme)
+    emit_when_done(future_rubric, on_event, "rubric_parsed", lambda parsed: {"criteria": parse_rubric_sections(parsed)})
+    emit_when_done(future_theme, on_event, "theme", lambda theme: {"theme": theme})
+
+    if paragraphs is None:
+        paragraphs = split_paragraphs(essay_text)
+    if on_event is not None:
+        on_event("paragraphs", {"paragraphs": paragraphs})
+
+    # Collect all results when ready
+    rubric_parsed = future_rubric.result()
+    theme = future_theme.result()
  
     # Step 2: Encode paragraphs using Longformer (contextual embeddings)
-    context_summary = encode_paragraphs_with_longformer(paragraphs) 
+    context_summary = encode_paragraphs_with_longformer(paragraphs)
+    if on_event is not None:
+        on_event("structured_summary", context_summary)
 
     # Step 3: Return structured output
     result = {
@@ -305,12 +899,13 @@ def process_rubric_and_pipeline(essay_text, rubric_text):
         "gpt_summary": theme,
         "paragraphs": paragraphs
     }
+    if rubric is not None:
+        result["compiled_criteria"] = rubric["compiled"]
 
     return result
 
-def extract_rubric_from_text(rubric_text):
-    """Uses OpenAI API to extract and structure the rubric properly."""
-
+def rubric_extraction_request(rubric_text):
+    """Chat completion parameters for the structured rubric extraction."""
     prompt = f"""
     You are an AI trained to analyze essay grading rubrics. Your task is to extract 
     and structure the grading criteria and their respective scoring levels EXACTLY as they appear in the original rubric.
@@ -345,201 +940,439 @@ def extract_rubric_from_text(rubric_text):
         ]
     }}
     """
-    
-    print("\nDEBUG: Sending rubric extraction prompt to OpenAI...")
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Consider using gpt-4o for complex rubrics
-            messages=[
-                {"role": "system", "content": "You are a precise document structure analyzer specializing in educational rubrics. Your task is to extract the exact criteria and scoring levels from rubrics without adding, splitting, or modifying the original structure. Return only valid JSON with no explanatory text."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1,  # Lower temperature for more deterministic results
-            response_format={"type": "json_object"}
-        )
+    return {
+        "model": "gpt-4o-mini",  # Consider using gpt-4o for complex rubrics
+        "messages": [
+            {"role": "system", "content": "You are a precise document structure analyzer specializing in educational rubrics. Your task is to extract the exact criteria and scoring levels from rubrics without adding, splitting, or modifying the original structure. Return only valid JSON with no explanatory text."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.1,  # Lower temperature for more deterministic results
+        "response_format": {"type": "json_object"}
+    }
 
-        structured_rubric = response.choices[0].message.content
-        
-        # Validate JSON
-        try:
-            parsed_json = json.loads(structured_rubric)
-            
-            # Log the extracted criteria for debugging
-            criteria = parsed_json.get("Criteria", [])
-            print(f"\nDEBUG: Successfully extracted {len(criteria)} criteria")
-            
-            if criteria:
-                # Print names of extracted criteria
-                criteria_names = [criterion.get("Name", "Unnamed") for criterion in criteria]
-                print(f"\nDEBUG: Extracted criteria: {', '.join(criteria_names)}")
-                
-                # Check if Value field exists in all scores
-                for criterion in criteria:
-                    scores = criterion.get("Scores", [])
-                    if not all("Value" in score for score in scores):
-                        print(f"\nDEBUG: Missing Value field in criterion: {criterion.get('Name')}")
-                        # Add Value field if missing
-                        for i, score in enumerate(scores):
-                            if "Value" not in score and "Score" in score:
-                                try:
-                                    # Try to extract numeric value from Score field
-                                    score_text = score["Score"]
-                                    numeric_val = int(''.join(filter(str.isdigit, score_text))) if any(c.isdigit() for c in score_text) else (len(scores) - i)
-                                    score["Value"] = numeric_val
-                                    print(f"Added Value {numeric_val} to {score_text}")
-                                except:
-                                    # Fallback to position-based value
-                                    score["Value"] = len(scores) - i
-            
-            return json.dumps(parsed_json)
-            
-        except json.JSONDecodeError as e:
-            print(f"\nDEBUG: Invalid JSON from OpenAI: {e}")
-            return json.dumps({
-                "Criteria": [
-                    {
-                        "Name": "Error in Rubric Extraction",
-                        "Scores": [
-                            {"Score": "Error", "Description": "Could not parse rubric format", "Value": 0}
-                        ]
-                    }
+
+def rubric_error_json(name, description):
+    return json.dumps({
+        "Criteria": [
+            {
+                "Name": name,
+                "Scores": [
+                    {"Score": "Error", "Description": description, "Value": 0}
                 ]
-            })
+            }
+        ]
+    })
+
+
+def parse_rubric_response(response):
+    """Validates the extracted rubric JSON, filling in missing score Values. Returns a JSON string."""
+    structured_rubric = response.choices[0].message.content
+
+    # Validate JSON
+    try:
+        parsed_json = json.loads(structured_rubric)
+        
+        # Log the extracted criteria for debugging
+        criteria = parsed_json.get("Criteria", [])
+        logger.debug("Successfully extracted %d criteria", len(criteria))
+        
+        if criteria:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Extracted criteria: %s", ", ".join(criterion.get("Name", "Unnamed") for criterion in criteria))
             
+            # Check if Value field exists in all scores
+            for criterion in criteria:
+                scores = criterion.get("Scores", [])
+                if not all("Value" in score for score in scores):
+                    logger.debug("Missing Value field in criterion: %s", criterion.get("Name"))
+                    # Add Value field if missing
+                    for i, score in enumerate(scores):
+                        if "Value" not in score and "Score" in score:
+                            try:
+                                # Try to extract numeric value from Score field
+                                score_text = score["Score"]
+                                numeric_val = int(''.join(filter(str.isdigit, score_text))) if any(c.isdigit() for c in score_text) else (len(scores) - i)
+                                score["Value"] = numeric_val
+                                logger.debug("Added Value %s to %s", numeric_val, score_text)
+                            except:
+                                # Fallback to position-based value
+                                score["Value"] = len(scores) - i
+        
+        return json.dumps(parsed_json)
+        
+    except json.JSONDecodeError as e:
+        logger.warning("Invalid rubric JSON from OpenAI: %s", e)
+        return rubric_error_json("Error in Rubric Extraction", "Could not parse rubric format")
+
+
+@telemetry.traced("rubric_parse")
+def extract_rubric_from_text(rubric_text, use_cache=True):
+    """Uses OpenAI API to extract and structure the rubric properly."""
+
+    logger.debug("Sending rubric extraction prompt to OpenAI...")
+    try:
+        # use_cache: one parse per distinct rubric, not per submission
+        response = create_chat_completion(client, use_cache=use_cache, stage="rubric", **rubric_extraction_request(rubric_text))
     except Exception as e:
-        print(f"\nDEBUG: Error calling OpenAI: {e}")
-        return json.dumps({
-            "Criteria": [
-                {
-                    "Name": "API Error",
-                    "Scores": [
-                        {"Score": "Error", "Description": f"API error: {str(e)}", "Value": 0}
-                    ]
-                }
-            ]
-        })
+        logger.error("Error calling OpenAI for the rubric: %s", e)
+        return rubric_error_json("API Error", f"API error: {str(e)}")
 
-        
+    return parse_rubric_response(response)
 
-def evaluate_criterion(section, meta_result, client):
-    criterion_name = section.get("Name", "Unnamed Criterion")
+
+def compile_criterion(section):
+    """Precomputes the prompt fragments and score range for one rubric criterion."""
     scores = section.get("Scores", [])
-    paragraphs = meta_result["paragraphs"]
 
     # Format rubric as readable list
     rubric_formatted = "\n".join([
         f"- **Score {len(scores) - idx}:** {score.get('Description', 'No description')}"
         for idx, score in enumerate(scores) if isinstance(score, dict)
-    ]) 
-
+    ])
 
     score_values = sorted([
         score.get("Value") for score in scores if isinstance(score, dict) and isinstance(score.get("Value"), (int, float))
     ])
     min_score, max_score = (score_values[0], score_values[-1]) if score_values else (1, len(scores))
 
-    theme = meta_result["gpt_summary"]
+    return {
+        "name": section.get("Name", "Unnamed Criterion"),
+        "rubric_formatted": rubric_formatted,
+        "min_score": min_score,
+        "max_score": max_score,
+    }
 
-    # Function to evaluate a single paragraph
-    def evaluate_paragraph(idx, paragraph, paragraphs):
-        # Extract meta elements safely
-        dominant_feature = meta_result["structured_summary"]['dominant_features'][idx]
-        coherence_issue = (
-            meta_result["structured_summary"]['coherence_issues'][idx - 1]
-            if idx > 0 and (idx - 1) < len(meta_result["structured_summary"]['coherence_issues']) and meta_result["structured_summary"]['coherence_issues'][idx - 1] != ""
-            else "None"
-        )
-        prev_paragraph_summary = paragraphs[idx - 1][:150] + "..." if idx > 0 else "None"
-
-        # GPT prompt for paragraph evaluation
-        paragraph_prompt = f"""
-        You are an AI trained to evaluate essays using a structured grading rubric.
-
-        ### Essay Meta-Summary (your context):
-        - **Theme**: {theme}
-        - **Dominant Feature of this paragraph**: {dominant_feature}
-        - **Previous Paragraph Summary**: {prev_paragraph_summary}
-        - **Coherence Issue with previous paragraph**: {coherence_issue}
-
-        ### Paragraph {idx + 1} to Evaluate:
-        {paragraph}
-
-        ### Grading Criterion:
-        {criterion_name}
-
-        ### Scoring Rubric:
-        {rubric_formatted}
-
-        ### TASK:
-        Focus ONLY on evaluating **this paragraph** for the **'{criterion_name}'** criterion.
-
-        DO NOT:
-        - Evaluate other aspects of the essay.
-        - Comment on overall essay quality or unrelated sections.
-
-        DO:
-        1. Give a score between {min_score} and {max_score}.
-        2. Provide clear, focused feedback justifying the score.
-        3. Suggest 1 specific actionable improvements, quoting from the essay text, tied to this criterion.
-
-        ### RESPOND IN THIS JSON FORMAT ONLY:
-        {{
-            "paragraph": {idx + 1},
-            "criterion": "{criterion_name}",
-            "score": (number between {min_score}-{max_score}),
-            "feedback": "Focused feedback for this paragraph and criterion.",
-            "suggestions": [
-                "Specific actionable suggestion 1."
-            ]
-        }}
-        """
 
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are an expert essay evaluator. Stay strictly on task."},
-                    {"role": "user", "content": paragraph_prompt}
-                ],
-                temperature=0.2,
-                max_tokens=600
-            )
-            return json.loads(response.choices[0].message.content)
+def compiled_criterion(section, meta_result):
+    """The criterion's prompt fragments: precompiled when the analysis uses a library rubric, else compiled now."""
+    precompiled = (meta_result.get("compiled_criteria") or {}).get(section.get("Name", "Unnamed Criterion"))
+    return precompiled or compile_criterion(section)
 
-        except Exception as e:
-            print(f"Error on paragraph {idx + 1}: {e}")
-            return {
-                "paragraph": idx + 1,
-                "criterion": criterion_name,
-                "score": None,
-                "feedback": f"Error analyzing paragraph: {e}"
-            }
 
-    # Parallel processing of paragraph evaluations
-    paragraph_feedback = []
-    with ThreadPoolExecutor(max_workers=5) as executor:  # Adjust as needed
-        futures = [executor.submit(evaluate_paragraph, idx, paragraph, paragraphs) for idx, paragraph in enumerate(paragraphs)]
-        for future in as_completed(futures): 
-            paragraph_feedback.append(future.result())
- 
-    # Final summary aggregation using the paragraph feedback
-    final_summary_prompt = f"""
-You are an expert essay evaluator. Based on the following paragraph-by-paragraph evaluations for the criterion '{criterion_name}', write a final overall score and detailed summary for the entire essay under this criterion.
+def paragraph_context(meta_result, idx):
+    """Returns (dominant_feature, coherence_issue, prev_paragraph_summary) for paragraph `idx`."""
+    paragraphs = meta_result["paragraphs"]
+    summary = meta_result["structured_summary"]
+
+    # Extract meta elements safely
+    dominant_feature = summary['dominant_features'][idx]
+    coherence_issue = (
+        summary['coherence_issues'][idx - 1]
+        if idx > 0 and (idx - 1) < len(summary['coherence_issues']) and summary['coherence_issues'][idx - 1] != ""
+        else "None"
+    )
+    prev_paragraph_summary = paragraphs[idx - 1][:150] + "..." if idx > 0 else "None"
+    return dominant_feature, coherence_issue, prev_paragraph_summary
 
-### Essay Meta-Summary (Context for Reference):
+
+def paragraph_prompt_keys(meta_result):
+    """
+    One key per paragraph: a hash of what its evaluation prompt says about it apart from
+    its number (theme, dominant feature, coherence issue, previous paragraph and text).
+    Feedback kept from a previous draft is reused only while the key is unchanged.
+    """
+    keys = []
+    for idx, paragraph in enumerate(meta_result["paragraphs"]):
+        context = [re.sub(r"Paragraph \d+( and \d+)?", "Paragraph", part) for part in paragraph_context(meta_result, idx)]
+        keys.append(content_key([meta_result["gpt_summary"], context, paragraph]))
+    return keys
+
+
+def paragraph_vectors(meta_result):
+    """
+    The paragraphs' MiniLM embeddings for paragraph_reuse (already in the embedding
+    cache once the pipeline ran), or None when reuse is off.
+    """
+    if not PARAGRAPH_REUSE or not meta_result["paragraphs"]:
+        return None
+    try:
+        return minilm_embed_paragraphs(meta_result["paragraphs"])
+    except Exception as e:
+        logger.warning("Paragraph reuse skipped: %s", e)
+        return None
+
+
+def paragraph_error(idx, criterion_name, error):
+    return {
+        "paragraph": idx + 1,
+        "criterion": criterion_name,
+        "score": None,
+        "feedback": f"Error analyzing paragraph: {error}"
+    }
+
+
+def plan_paragraph_groups(paragraphs, token_budget):
+    """Groups consecutive paragraphs so each multi-criterion call stays within `token_budget` paragraph tokens."""
+    groups, current, current_tokens = [], [], 0
+    for idx, paragraph in enumerate(paragraphs):
+        tokens = len(paragraph) // 4  # rough token estimate
+        if current and current_tokens + tokens > token_budget:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(idx)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def multi_criterion_request(criteria, meta_result, group):
+    """
+    Chat completion parameters for grading the paragraphs in `group` against every compiled
+    criterion. Instructions, criteria and theme come first, so every group of the essay
+    shares that prefix; the paragraphs come last.
+    """
+    model, max_tokens = "gpt-4o-mini", min(16000, 300 * len(group) * max(1, len(criteria)))
+    system = "You are an expert essay evaluator. Stay strictly on task."
+    paragraphs = meta_result["paragraphs"]
+    criteria_formatted = "\n\n".join(
+        f"#### Criterion: {c['name']} (score between {c['min_score']} and {c['max_score']})\n{c['rubric_formatted']}"
+        for c in criteria
+    )
+
+    prompt = PromptBuilder(model, prompt_budget(model, max_tokens, PROMPT_TOKEN_BUDGETS))
+    prompt.add(f"""
+You are an AI trained to evaluate essays using a structured grading rubric.
+
+### TASK:
+Evaluate EACH paragraph below against EACH criterion below, independently. For each paragraph and criterion:
+1. Give a score within that criterion's range.
+2. Provide clear, focused feedback justifying the score, about that criterion only.
+3. Suggest 1 specific actionable improvement, quoting from the essay text, tied to that criterion.
+
+DO NOT comment on overall essay quality or unrelated sections.
+
+### RESPOND IN THIS JSON FORMAT ONLY (one entry per paragraph and criterion):
+{{
+"evaluations": [
+    {{
+        "paragraph": (paragraph number),
+        "criterion": "Exact criterion name",
+        "score": (number within the criterion's range),
+        "feedback": "Focused feedback for this paragraph and criterion.",
+        "suggestions": ["Specific actionable suggestion 1."]
+    }}
+]
+}}
+
+### Grading Criteria and Scoring Rubrics:
+{criteria_formatted}
+
+### Essay Meta-Summary (your context):
 - **Theme**: {meta_result["gpt_summary"]}
-- **Dominant Features by Paragraph**: {', '.join(meta_result["structured_summary"]['dominant_features'])}
-- **Coherence Issues Noted**: {', '.join([issue for issue in meta_result["structured_summary"]['coherence_issues'] if issue]) if any(meta_result["structured_summary"]['coherence_issues']) else "None"}
-- **Logical Flow (Average Coherence Score)**: {meta_result["structured_summary"]['logical_flow']}
 
-### Paragraph Evaluations:
-{json.dumps(paragraph_feedback, indent=2)}
+### Paragraphs to Evaluate:""")
+
+    for idx in group:
+        dominant_feature, coherence_issue, prev_paragraph_summary = paragraph_context(meta_result, idx)
+        prompt.add(f"\n\n#### Paragraph {idx + 1}")
+        prompt.add(f"\n- **Dominant Feature of this paragraph**: {dominant_feature}", priority=1, name=f"paragraph {idx + 1} dominant feature")
+        prompt.add(f"\n- **Previous Paragraph Summary**: {prev_paragraph_summary}", priority=2, name=f"paragraph {idx + 1} previous summary")
+        prompt.add(f"\n- **Coherence Issue with previous paragraph**: {coherence_issue}", priority=3, name=f"paragraph {idx + 1} coherence issue")
+        prompt.add("\n\n")
+        prompt.add(paragraphs[idx], trim=True, name=f"paragraph {idx + 1}")
+    prompt.add("\n")
+
+    return structured_output.with_response_format({
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt.build(overhead=count_message_tokens([{"content": system}], model))}
+        ],
+        "temperature": 0.2,
+        "max_tokens": max_tokens,
+    }, "multi_criterion_evaluation")
+
+
+def fan_out_multi_criterion(criteria, paragraph_count, group_results):
+    """
+    Maps (group, evaluations, error) results from multi-criterion calls back into
+    criterion name -> per-paragraph feedback lists, filling gaps with error entries.
+    """
+    by_criterion = {c["name"]: {} for c in criteria}
+    names = {c["name"].strip().casefold(): c["name"] for c in criteria}
+    errors = {}
+
+    for group, evaluations, error in group_results:
+        for idx in group:
+            errors[idx] = error or "missing from model response"
+        for evaluation in evaluations:
+            name = names.get(str(evaluation.get("criterion", "")).strip().casefold())
+            try:
+                idx = int(evaluation.get("paragraph")) - 1
+            except (TypeError, ValueError):
+                continue
+            if name is not None and idx in group:
+                by_criterion[name][idx] = evaluation
 
----
+    return {
+        name: [found.get(idx) or paragraph_error(idx, name, errors.get(idx)) for idx in range(paragraph_count)]
+        for name, found in by_criterion.items()
+    }
+
+
+@telemetry.traced("multi_criterion_evaluation")
+def evaluate_paragraphs_multi_criterion(rubric_sections, meta_result, client, on_event=None, indices=None):
+    """
+    Grades paragraphs against ALL criteria in one structured-JSON call per paragraph
+    (or per group of paragraphs within EVALUATION_GROUP_TOKEN_BUDGET), then fans the
+    results back out into the per-criterion `paragraph_feedback` lists that
+    evaluate_criterion expects. With `indices`, only those paragraphs are graded
+    (the others get error entries, for the caller to fill in).
+
+    Returns:
+        dict: criterion name -> list of paragraph feedback dicts.
+    """
+    criteria = [compiled_criterion(section, meta_result) for section in rubric_sections]
+
+    def evaluate_group(group):
+        try:
+            evaluations = structured_completion(
+                client, "multi_criterion", "multi_criterion_evaluation", multi_criterion_request(criteria, meta_result, group)
+            )["evaluations"]
+        except Exception as e:
+            logger.error("Error on paragraphs %s: %s", [idx + 1 for idx in group], e)
+            return group, [], e
+
+        if on_event is not None:
+            for evaluation in evaluations:
+                on_event("paragraph_result", {"criterion": evaluation.get("criterion"), "feedback": evaluation})
+        return group, evaluations, None
+
+    paragraphs = meta_result["paragraphs"]
+    indices = list(range(len(paragraphs))) if indices is None else indices
+    groups = [
+        [indices[position] for position in group]
+        for group in plan_paragraph_groups([paragraphs[idx] for idx in indices], EVALUATION_GROUP_TOKEN_BUDGET)
+    ]
+    futures = [llm_scheduler.submit(lambda group=group: evaluate_group(group)) for group in groups]
+    return fan_out_multi_criterion(criteria, len(meta_result["paragraphs"]), [future.result() for future in futures])
+
+
+def paragraph_evaluation_request(compiled, meta_result, idx):
+    """
+    Chat completion parameters for evaluating paragraph `idx` against one compiled criterion.
+    The instructions come first (the same for every call), then the criterion and rubric,
+    then the theme; the paragraph and its context come last.
+    """
+    model, max_tokens = "gpt-4o-mini", 600
+    system = "You are an expert essay evaluator. Stay strictly on task."
+    criterion_name = compiled["name"]
+    rubric_formatted = compiled["rubric_formatted"]
+    min_score, max_score = compiled["min_score"], compiled["max_score"]
+    theme = meta_result["gpt_summary"]
+    paragraph = meta_result["paragraphs"][idx]
+    dominant_feature, coherence_issue, prev_paragraph_summary = paragraph_context(meta_result, idx)
+
+    # GPT prompt for paragraph evaluation
+    prompt = PromptBuilder(model, prompt_budget(model, max_tokens, PROMPT_TOKEN_BUDGETS))
+    prompt.add(f"""
+You are an AI trained to evaluate essays using a structured grading rubric.
+
+### TASK:
+Focus ONLY on evaluating **the paragraph below** for **the grading criterion below**.
+
+DO NOT:
+- Evaluate other aspects of the essay.
+- Comment on overall essay quality or unrelated sections.
+
+DO:
+1. Give a score within the criterion's score range.
+2. Provide clear, focused feedback justifying the score.
+3. Suggest 1 specific actionable improvements, quoting from the essay text, tied to this criterion.
+
+### RESPOND IN THIS JSON FORMAT ONLY:
+{{
+    "paragraph": (paragraph number),
+    "criterion": "Exact criterion name",
+    "score": (number within the score range),
+    "feedback": "Focused feedback for this paragraph and criterion.",
+    "suggestions": [
+        "Specific actionable suggestion 1."
+    ]
+}}
+
+### Grading Criterion:
+{criterion_name} (score between {min_score} and {max_score})
+
+### Scoring Rubric:
+{rubric_formatted}
+
+### Essay Meta-Summary (your context):
+- **Theme**: {theme}""")
+    prompt.add(f"\n- **Dominant Feature of this paragraph**: {dominant_feature}", priority=1, name="dominant feature")
+    prompt.add(f"\n- **Previous Paragraph Summary**: {prev_paragraph_summary}", priority=2, name="previous paragraph summary")
+    prompt.add(f"\n- **Coherence Issue with previous paragraph**: {coherence_issue}", priority=3, name="coherence issue")
+    prompt.add(f"\n\n### Paragraph {idx + 1} to Evaluate:\n")
+    prompt.add(paragraph, trim=True, name=f"paragraph {idx + 1}")
+    prompt.add("\n")
+
+    return structured_output.with_response_format({
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt.build(overhead=count_message_tokens([{"content": system}], model))}
+        ],
+        "temperature": 0.2,
+        "max_tokens": max_tokens
+    }, "paragraph_evaluation")
+
+
+@telemetry.traced("paragraph_evaluation")
+def evaluate_paragraph(compiled, meta_result, idx, client):
+    """Evaluates a single paragraph for one compiled criterion."""
+    try:
+        return structured_completion(client, "paragraph", "paragraph_evaluation", paragraph_evaluation_request(compiled, meta_result, idx))
+
+    except Exception as e:
+        logger.error("Error on paragraph %d: %s", idx + 1, e)
+        return paragraph_error(idx, compiled["name"], e)
+
+
+def compact_paragraph_feedback(paragraph_feedback):
+    """
+    The paragraph evaluations as (paragraph number, line) pairs in paragraph order: number,
+    score, feedback and suggestions on one line each, instead of indented JSON.
+    """
+    lines = []
+    for position, item in enumerate(paragraph_feedback):
+        if not isinstance(item, dict):
+            lines.append((position + 1, f"P{position + 1}: {item}", ""))
+            continue
+        number = item.get("paragraph", position + 1)
+        suggestions = item.get("suggestions") or []
+        if isinstance(suggestions, str):
+            suggestions = [suggestions]
+        lines.append((
+            number,
+            f"P{number} (score {item.get('score')}): {item.get('feedback', '')}",
+            f" Suggestions: {' '.join(str(suggestion) for suggestion in suggestions)}" if suggestions else "",
+        ))
+    return sorted(lines, key=lambda line: line[0] if isinstance(line[0], int) else 0)
+
+
+def criterion_summary_request(compiled, meta_result, paragraph_feedback):
+    """
+    Chat completion parameters for a criterion's final summary. The instructions come
+    first (the same for every call), then the criterion and rubric, then the essay's
+    meta-summary, then the (compacted) paragraph evaluations. Over budget, dominant
+    features go first, then coherence issues and the paragraph suggestions.
+    """
+    model, max_tokens = "gpt-4", 600
+    system = "You are a structured essay evaluator based off of meta-summary."
+    criterion_name = compiled["name"]
+    rubric_formatted = compiled["rubric_formatted"]
+    structured_summary = meta_result["structured_summary"]
+    coherence_issues = [issue for issue in structured_summary['coherence_issues'] if issue]
+
+    # Final summary aggregation using the paragraph feedback
+    prompt = PromptBuilder(model, prompt_budget(model, max_tokens, PROMPT_TOKEN_BUDGETS))
+    prompt.add(f"""
+You are an expert essay evaluator. Based on the paragraph-by-paragraph evaluations below for the grading criterion below, write a final overall score and detailed summary for the entire essay under this criterion.
 
 ### TASK — Follow **strictly and deeply**:
 
-1. **Evaluate how well the essay meets '{criterion_name}' using the Scoring Rubric: {rubric_formatted}**. Focus entirely on what the rubric defines for this criterion and analyze how well the essay fulfills that. (DO NOT inclue score in summary)
+1. **Evaluate how well the essay meets the criterion using its Scoring Rubric below**. Focus entirely on what the rubric defines for this criterion and analyze how well the essay fulfills that. (DO NOT inclue score in summary)
 2. **Use meta-summary insights (coherence, flow) ONLY if directly relevant to this criterion and scoring rubric**. Avoid addressing unrelated issues (e.g., don’t address organization when grading focus).
 3. Provide **2-3 actionable, deeply text-based suggestions**:
     - Quote **precise phrases or moments** from at least 2-3 different paragraphs. 
@@ -559,112 +1392,1134 @@ You are an expert essay evaluator. Based on the following paragraph-by-paragraph
 
 ### **Respond ONLY in this JSON (DO NOT inclue score in summary):**
 {{
-    "criterion": "{criterion_name}",
+    "criterion": "Exact criterion name",
     "summary_feedback": "Detailed, meta-aware analysis following all points above. Concrete examples from essay text required. (Escape all quotes, no line breaks inside this string)."
 }}
-""" 
+
+---
+
+### Grading Criterion:
+{criterion_name}
+
+### Scoring Rubric:
+{rubric_formatted}
+
+### Essay Meta-Summary (Context for Reference):
+- **Theme**: {meta_result["gpt_summary"]}
+- **Logical Flow (Average Coherence Score)**: {structured_summary['logical_flow']}""")
+    prompt.add(f"\n- **Coherence Issues Noted**: {', '.join(coherence_issues) if coherence_issues else 'None'}", priority=2, name="coherence issues")
+    prompt.add(f"\n- **Dominant Features by Paragraph**: {', '.join(structured_summary['dominant_features'])}", priority=1, name="dominant features")
+    prompt.add("\n\n### Paragraph Evaluations (P = paragraph number):")
+    for number, evaluation, suggestions in compact_paragraph_feedback(paragraph_feedback):
+        prompt.add(f"\n{evaluation}", trim=True, name=f"P{number} feedback")
+        if suggestions:
+            prompt.add(suggestions, priority=3, name=f"P{number} suggestions")
+    prompt.add("\n")
+
+    return structured_output.with_response_format({
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt.build(overhead=count_message_tokens([{"content": system}], model))}
+        ],
+        "temperature": 0.2,
+        "max_tokens": max_tokens
+    }, "criterion_summary")
+
+
+def criterion_summary_key(compiled, meta_result, paragraph_feedback):
+    """
+    Hash of a criterion's summary request, for reusing the summary in a revision. The
+    dominant features are left out: they are low-priority context, and without the
+    offline projection basis they change with almost any edit.
+    """
+    structured_summary = dict(meta_result["structured_summary"], dominant_features=[])
+    request = criterion_summary_request(compiled, dict(meta_result, structured_summary=structured_summary), paragraph_feedback)
+    return content_key(request["messages"])
+
+
+def summary_error(criterion_name, error):
+    logger.error("Final summary issue for criterion '%s': %s", criterion_name, error)
+    return {
+        "criterion": criterion_name,
+        "overall_score": None,
+        "summary_feedback": f"Error during final summary: {error}"
+    }
+
+
+@telemetry.traced("criterion_summary")
+def summarize_criterion(compiled, meta_result, paragraph_feedback, client):
+    """Aggregates the paragraph feedback for one criterion into its final summary."""
     # GPT API Call for final criterion summary
     try:
-        final_response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a structured essay evaluator based off of meta-summary."},
-                {"role": "user", "content": final_summary_prompt}
-            ],
-            temperature=0.2,
-            max_tokens=600 
-        ) 
-        final_feedback = json.loads(final_response.choices[0].message.content)
+        final_feedback = structured_completion(
+            client, "summary", "criterion_summary", criterion_summary_request(compiled, meta_result, paragraph_feedback)
+        )
     except Exception as e:
-        print(f"[ERROR] Final summary issue for criterion '{criterion_name}': {e}")
-        final_feedback = { 
-            "criterion": criterion_name,
-            "overall_score": None,
-            "summary_feedback": f"Error during final summary: {e}"
-        }
+        final_feedback = summary_error(compiled["name"], e)
 
     # Return final structured output
     return {
-        "criterion": criterion_name, 
+        "criterion": compiled["name"],
         "final_summary": final_feedback
-    } 
+    }
+
+
+def forward_result(source, target):
+    """Copies a finished future's outcome into `target`."""
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+def submit_criterion_evaluation(section, meta_result, client, paragraph_feedback=None, on_event=None,
+                                revision=None, record=None):
+    """
+    Queues one criterion on the LLM scheduler without blocking: every paragraph
+    evaluation is submitted at once, and the final summary is submitted as soon as
+    the last of them finishes. If `paragraph_feedback` is given (multi-criterion
+    mode), only the final summary is requested. `on_event("paragraph_result", ...)`
+    is called as each paragraph evaluation lands.
+
+    With a `revision` (revisions.Revision), paragraph feedback and the final summary
+    still valid from the previous analysis are reused instead of requested. So is the
+    evaluation of a near-identical paragraph graded before (paragraph_reuse). A `record`
+    (revisions.GradingRecord) is given the criterion's feedback and summary.
+
+    Returns:
+        Future: resolves to {"criterion": ..., "final_summary": ...}.
+    """
+    compiled = compiled_criterion(section, meta_result)
+    result = Future()
+
+    def finish(feedback, summary_key, source):
+        if source.exception() is None and record is not None:
+            record.add_criterion(compiled["name"], section, feedback, summary_key, source.result()["final_summary"])
+        forward_result(source, result)
+
+    def submit_summary(feedback):
+        summary_key = None
+        if revision is not None or record is not None:
+            summary_key = criterion_summary_key(compiled, meta_result, feedback)
+        final_summary = revision.reusable_summary(compiled["name"], summary_key) if revision is not None else None
+        if final_summary is not None:
+            summary_future = Future()
+            summary_future.set_result({"criterion": compiled["name"], "final_summary": final_summary})
+        else:
+            summary_future = llm_scheduler.submit(lambda: summarize_criterion(compiled, meta_result, feedback, client))
+        summary_future.add_done_callback(lambda f: finish(feedback, summary_key, f))
+
+    paragraph_count = len(meta_result["paragraphs"])
+    if paragraph_feedback is not None or paragraph_count == 0:
+        submit_summary(paragraph_feedback or [])
+        return result
+
+    # Paragraph feedback in paragraph order, whatever order the evaluations finish in
+    feedback = [None] * paragraph_count
+    reused = revision.reusable_feedback(compiled["name"], section, paragraph_prompt_keys(meta_result)) if revision is not None else {}
+    vectors = paragraph_vectors(meta_result)
+    if vectors is not None:
+        reuse_key = content_key(section)
+        reused.update(paragraph_reuse.lookup(reuse_key, vectors, [idx for idx in range(paragraph_count) if idx not in reused]))
+    pending = [paragraph_count - len(reused)]
+    lock = threading.Lock()
+
+    def collect(idx, future):
+        # Runs as a done-callback: whatever fails here, the paragraph must still be counted
+        # or the criterion's future never resolves
+        try:
+            item = future.result()
+        except Exception as e:
+            item = paragraph_error(idx, compiled["name"], e)
+        try:
+            if vectors is not None:
+                paragraph_reuse.add(reuse_key, vectors[idx], item)
+            if on_event is not None:
+                on_event("paragraph_result", {"criterion": compiled["name"], "feedback": item})
+        except Exception:
+            logger.exception("Paragraph %d result handling failed for %s", idx + 1, compiled["name"])
+        with lock:
+            feedback[idx] = item
+            pending[0] -= 1
+            done = pending[0] == 0
+        if done:
+            submit_summary(feedback)
+
+    for idx, item in reused.items():
+        feedback[idx] = item
+        if on_event is not None:
+            on_event("paragraph_result", {"criterion": compiled["name"], "feedback": item})
+    if pending[0] == 0:
+        submit_summary(feedback)
+        return result
+
+    for idx in range(paragraph_count):
+        if idx not in reused:
+            llm_scheduler.submit(lambda idx=idx: evaluate_paragraph(compiled, meta_result, idx, client)).add_done_callback(
+                lambda future, idx=idx: collect(idx, future)
+            )
+
+    return result
+
+
+def evaluate_criterion(section, meta_result, client, paragraph_feedback=None):
+    """
+    Evaluates every paragraph for one criterion, then writes the criterion's final summary.
+    If `paragraph_feedback` is given (multi-criterion mode), only the final summary is requested.
+    """
+    return submit_criterion_evaluation(section, meta_result, client, paragraph_feedback).result()
+
+
+def parse_rubric_sections(rubric_parsed):
+    """Returns the rubric's "Criteria" list, or [] if the parsed rubric is not valid JSON."""
+    try:
+        rubric_json = json.loads(rubric_parsed)  # Parse the JSON
+        return rubric_json.get("Criteria", [])  # Extract "Criteria" safely
+    except json.JSONDecodeError as e:
+        logger.warning("Failed to parse rubric JSON: %s", e)
+        return []  # Handle parsing failure
+
+
+def evaluate_multi_criterion_reusing(rubric_sections, meta_result, client, on_event=None, revision=None):
+    """
+    evaluate_paragraphs_multi_criterion, but only the paragraphs some criterion cannot
+    reuse feedback for are graded. Feedback is reused from the `revision`, or from
+    near-identical paragraphs graded before (paragraph_reuse).
+    """
+    vectors = paragraph_vectors(meta_result)
+    if revision is None and vectors is None:
+        return evaluate_paragraphs_multi_criterion(rubric_sections, meta_result, client, on_event)
+
+    paragraph_count = len(meta_result["paragraphs"])
+    prompt_keys = paragraph_prompt_keys(meta_result) if revision is not None else None
+    reused = {}
+    for section in rubric_sections:
+        name = section.get("Name", "Unnamed Criterion")
+        found = revision.reusable_feedback(name, section, prompt_keys) if revision is not None else {}
+        if vectors is not None:
+            found.update(paragraph_reuse.lookup(content_key(section), vectors, [idx for idx in range(paragraph_count) if idx not in found]))
+        reused[name] = found
+    indices = [idx for idx in range(paragraph_count) if any(idx not in found for found in reused.values())]
+    if on_event is not None:
+        for name, found in reused.items():
+            for idx in sorted(set(found) - set(indices)):
+                on_event("paragraph_result", {"criterion": name, "feedback": found[idx]})
+    graded = evaluate_paragraphs_multi_criterion(rubric_sections, meta_result, client, on_event, indices) if indices else {}
+    if vectors is not None and graded:
+        for section in rubric_sections:
+            for idx in indices:
+                paragraph_reuse.add(content_key(section), vectors[idx], graded[section.get("Name", "Unnamed Criterion")][idx])
+    return {
+        name: [found[idx] if idx in found and idx not in indices else graded[name][idx] for idx in range(paragraph_count)]
+        for name, found in reused.items()
+    }
+
+
+def evaluate_rubric(rubric_sections, meta_result, client, mode=None, on_event=None, revision=None, record=None):
+    """
+    Evaluates the essay against every rubric section and returns the criterion results.
+
+    Modes:
+    - "per_criterion": one call per paragraph per criterion (the original behaviour)
+    - "multi_criterion": one call grades a paragraph (or group) against all criteria
+
+    `on_event` is called with "paragraph_result" and "criterion_result" events as they land.
+    `revision` and `record` are passed on to submit_criterion_evaluation.
+    """
+    mode = mode or EVALUATION_MODE
+    if mode not in ("per_criterion", "multi_criterion"):
+        raise ValueError(f"Unknown evaluation mode: {mode}")
+
+    feedback_by_criterion = {}
+    if mode == "multi_criterion" and rubric_sections:
+        feedback_by_criterion = evaluate_multi_criterion_reusing(rubric_sections, meta_result, client, on_event, revision)
+
+    # All criteria are queued on the shared LLM scheduler at once
+    futures = [
+        submit_criterion_evaluation(
+            section, meta_result, client,
+            feedback_by_criterion.get(section.get("Name", "Unnamed Criterion")),
+            on_event, revision, record
+        )
+        for section in rubric_sections
+    ]
+
+    feedback_responses = []
+    for future in as_completed(futures):
+        try:
+            result = future.result()
+            feedback_responses.append(result)
+            if on_event is not None:
+                on_event("criterion_result", result)
+        except Exception as e:
+            logger.error("Error during criterion evaluation: %s", e)
+
+    return feedback_responses
 
 
 @app.route('/test', methods=['GET'])
 def test():
     return jsonify({'message': 'API is working!'})
 
-@app.route('/analyze', methods=['POST'])
-def analyze_essay():
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: 200 once every model is loaded, 503 while they are still loading (/test is liveness)."""
+    ready = model_registry.is_ready()
+    return jsonify({'ready': ready, 'models': model_registry.status()}), 200 if ready else 503
+
+@app.route('/llm/usage', methods=['GET'])
+def llm_usage():
+    """Calls and prompt/cached/completion tokens per stage since startup."""
+    return jsonify(token_usage.stats())
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        'embeddings': embedding_cache.stats(),
+        'llm_responses': llm_cache.stats() if llm_cache is not None else None,
+        'paragraph_reuse': paragraph_reuse.stats(),
+    })
+
+@app.route('/llm/stats', methods=['GET'])
+def llm_stats():
+    return jsonify(llm_scheduler.stats())
+
+
+@app.route('/encoder/stats', methods=['GET'])
+def encoder_stats():
+    return jsonify({'batching': ENCODER_BATCHING, 'longformer': longformer_batcher.stats(), 'minilm': minilm_batcher.stats()})
+
+@telemetry.traced("convert")
+def convert_upload(file_storage):
+    """Converts an uploaded file straight from its stream. Raises UploadRejected past the limits."""
     try:
-        if 'essay' not in request.files or 'rubric' not in request.files:
-            return jsonify({'error': 'Missing files'}), 400
+        return document_converter.convert_stream(file_storage.filename, file_storage.stream)
+    except UploadRejected:
+        raise
+    except Exception as e:
+        return f"Error converting file: {str(e)}"
 
-        essay_file = request.files['essay']
-        rubric_file = request.files['rubric']
 
-        # Save files temporarily
-        essay_path = os.path.join(UPLOAD_FOLDER, secure_filename(essay_file.filename))
-        rubric_path = os.path.join(UPLOAD_FOLDER, secure_filename(rubric_file.filename))
-        
-        essay_file.save(essay_path)
-        rubric_file.save(rubric_path)
+def has_rubric():
+    return 'rubric' in request.files or bool(request.form.get('rubric_id'))
 
-        essay_text = convert_to_text(essay_path)
-        rubric_text = convert_to_text(rubric_path)
 
-        if os.path.exists(essay_path):
-            os.remove(essay_path)
-        if os.path.exists(rubric_path):
-            os.remove(rubric_path)
+def read_rubric_choice():
+    """
+    (rubric text, library rubric) for a request: the text of the 'rubric' upload, or the
+    library rubric named by 'rubric_id' (at 'rubric_version', default latest). Raises RubricNotFound.
+    """
+    if request.form.get('rubric_id'):
+        return None, rubric_store.get(request.form['rubric_id'], request.form.get('rubric_version') or None)
+    return convert_upload(request.files['rubric']), None
 
-        meta_result = process_rubric_and_pipeline(essay_text, rubric_text)
 
-        rubric_parsed = meta_result["rubric_parsed"]
+def read_uploaded_texts():
+    """Returns the extracted text of the 'essay' upload, and the rubric (see read_rubric_choice)."""
+    return (convert_upload(request.files['essay']), *read_rubric_choice())
 
-        try:
-            rubric_json = json.loads(rubric_parsed)  # Parse the JSON
-            rubric_sections = rubric_json.get("Criteria", [])  # Extract "Criteria" safely
-        except json.JSONDecodeError as e:
-            print("\nDEBUG: Failed to parse rubric JSON:", str(e))
-            rubric_sections = []  # Handle parsing failure
 
-        feedback_responses = []
-        print("DEBUG: Analyzing Essay Based on Rubric")
+def upload_rejected(error):
+    message = error.description if isinstance(error, RequestEntityTooLarge) else str(error)
+    return jsonify({'success': False, 'error': message}), 413
 
-        print("DEBUG: Analyzing Essay Based on Rubric and Meta-Analysis")
 
-        # Parallel processing of rubric sections
-        feedback_responses = [] 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor: 
-            futures = [executor.submit(evaluate_criterion, section, meta_result, client) for section in rubric_sections]
+# Rubric library (/rubrics): parsed, validated and precompiled rubrics in SQLite (RUBRICS_DB_PATH),
+# which /analyze, /analyze/stream, /analyze/bulk and /jobs accept by 'rubric_id' instead of a file
+rubric_store = RubricStore(os.getenv("RUBRICS_DB_PATH", "rubrics.sqlite3"))
+
+
+def read_rubric_definition():
+    """
+    (name, validated criteria, source text) of a rubric sent to the library: a 'rubric'
+    file upload (parsed like an /analyze rubric), or a JSON body with "criteria" in the
+    parsed format. Raises RubricInvalid.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        criteria, source_text = data.get("criteria", data.get("Criteria")), None
+        name = data.get("name")
+    elif 'rubric' in request.files:
+        upload = request.files['rubric']
+        source_text = convert_upload(upload)
+        criteria = parse_rubric_sections(extract_rubric_from_text(source_text))
+        name = request.form.get('name') or os.path.splitext(upload.filename or "")[0]
+    else:
+        raise RubricInvalid("Missing rubric file or criteria")
+    validate_criteria(criteria)
+    return name or "Untitled rubric", criteria, source_text
+
+
+def rubric_body(rubric):
+    return {
+        'success': True,
+        'rubric_id': rubric["id"],
+        'name': rubric["name"],
+        'version': rubric["version"],
+        'latest_version': rubric["latest_version"],
+        'criteria': rubric["criteria"],
+    }
+
+
+def store_rubric(rubric_id=None):
+    """Parses, validates and compiles the request's rubric, storing it as a new rubric or a new version of `rubric_id`."""
+    try:
+        name, criteria, source_text = read_rubric_definition()
+        compiled = {criterion["Name"]: compile_criterion(criterion) for criterion in criteria}
+        if rubric_id is None:
+            rubric_id, version = rubric_store.create(name, criteria, compiled, source_text), 1
+        else:
+            version = rubric_store.add_version(rubric_id, criteria, compiled, source_text)
+    except (UploadRejected, RequestEntityTooLarge) as e:
+        return upload_rejected(e)
+    except RubricInvalid as e:
+        return jsonify({'success': False, 'error': str(e)}), 422
+    except RubricNotFound as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    return jsonify(rubric_body(rubric_store.get(rubric_id, version))), 201
+
+
+@app.route('/rubrics', methods=['POST'])
+def create_rubric():
+    """Adds a rubric to the library ('rubric' file and optional 'name', or JSON {"name", "criteria"})."""
+    return store_rubric()
+
+
+@app.route('/rubrics', methods=['GET'])
+def list_rubrics():
+    return jsonify({'success': True, 'rubrics': rubric_store.list()})
+
+
+@app.route('/rubrics/<rubric_id>', methods=['GET'])
+def get_rubric(rubric_id):
+    """The latest version of a rubric, or ?version=N."""
+    try:
+        return jsonify(rubric_body(rubric_store.get(rubric_id, request.args.get('version'))))
+    except RubricNotFound as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+
+
+@app.route('/rubrics/<rubric_id>/versions', methods=['POST'])
+def add_rubric_version(rubric_id):
+    """Stores a revised rubric as the next version; analyses already run keep theirs."""
+    return store_rubric(rubric_id)
+
+
+def plan_revision(essay_text, previous_analysis_id):
+    """
+    (paragraphs, revision, report) for a resubmission of `previous_analysis_id`. `revision`
+    is None when the essay should be graded in full: the previous analysis is unknown or
+    has no grading state, or too much of the essay changed.
+    """
+    previous = chat_store.get_analysis_state(previous_analysis_id)
+    if previous is None:
+        return None, None, {'previous_analysis_id': previous_analysis_id, 'incremental': False, 'reason': 'unknown analysis'}
+    if previous.get("version") != STATE_VERSION:
+        return None, None, {'previous_analysis_id': previous_analysis_id, 'incremental': False, 'reason': 'outdated grading state'}
+
+    paragraphs = split_paragraphs(essay_text)
+    plan = RevisionPlan(previous["paragraphs"], paragraphs)
+    report = {'previous_analysis_id': previous_analysis_id, **plan.summary()}
+    if plan.changed_share > REVISION_MAX_CHANGED_SHARE:
+        return paragraphs, None, {**report, 'incremental': False, 'reason': 'too much changed'}
+    return paragraphs, Revision(previous, plan), {**report, 'incremental': True}
+
+
+def run_analysis(essay_text, rubric_text, evaluation_mode=None, on_event=None, previous_analysis_id=None, rubric=None):
+    """
+    Runs the whole analysis for one essay and returns the /analyze response body. With
+    `previous_analysis_id` (an earlier draft's analysis), only what the revision changed
+    is graded again; the body then also has a "revision" report. With `rubric` (a rubric
+    library version), `rubric_text` is not used.
+    """
+    paragraphs = theme = revision = report = None
+    # Tag this request's LLM calls so the scheduler queues them fairly against other requests
+    with llm_scheduler.request_context(), telemetry.span("analysis", incremental=False) as attributes:
+        if previous_analysis_id:
+            paragraphs, revision, report = plan_revision(essay_text, previous_analysis_id)
+            if revision is not None:
+                theme = revision.state["theme"]  # a small revision keeps the essay's theme
+                attributes["incremental"] = True
+        meta_result = process_rubric_and_pipeline(essay_text, rubric_text, on_event, paragraphs, theme, rubric)
+        rubric_sections = parse_rubric_sections(meta_result["rubric_parsed"])
+
+        logger.debug("Analyzing essay based on rubric and meta-analysis")
+        record = GradingRecord(meta_result, evaluation_mode or EVALUATION_MODE, paragraph_prompt_keys(meta_result))
+        feedback_responses = evaluate_rubric(rubric_sections, meta_result, client, evaluation_mode, on_event, revision, record)
+
+    response = {
+        'success': True,
+        'results': feedback_responses,
+        'essay_text': essay_text,  #original essay text
+        'paragraphs': meta_result["paragraphs"],
+        'analysis_id': chat_store.save_analysis(essay_text, feedback_responses, record.state())  # for /chat/sessions and revisions
+    }
+    if report is not None:
+        response['revision'] = report
+    if rubric is not None:
+        response['rubric'] = {'id': rubric["id"], 'version': rubric["version"]}
+    return response
+
+
+# Bulk grading (/analyze/bulk): essays per upload, essays encoded together per chunk,
+# and essays whose LLM evaluation runs at once
+BULK_MAX_ESSAYS = int(os.getenv("BULK_MAX_ESSAYS", "200"))
+# Bytes of all essays in one bulk upload once archives are decompressed
+BULK_MAX_TOTAL_BYTES = int(os.getenv("BULK_MAX_TOTAL_BYTES", str(256 * 1024 * 1024)))
+BULK_ENCODE_CHUNK = int(os.getenv("BULK_ENCODE_CHUNK", "16"))
+BULK_ESSAY_CONCURRENCY = int(os.getenv("BULK_ESSAY_CONCURRENCY", "8"))
+
+
+def encode_essays(paragraph_lists):
+    """
+    Longformer and MiniLM embeddings for several essays, encoded together so forward
+    passes are filled with paragraphs from every essay. Returns [(longformer, minilm)] per essay.
+    """
+    all_paragraphs = [paragraph for paragraphs in paragraph_lists for paragraph in paragraphs]
+    offsets = np.cumsum([len(paragraphs) for paragraphs in paragraph_lists])[:-1]
+    if LONGFORMER_ENCODE_MODE == "essay":
+        # Essay-mode embeddings depend on the rest of their essay, so each essay is its own pass
+        longformer = [longformer_embed_paragraphs(paragraphs) for paragraphs in paragraph_lists]
+    else:
+        longformer = np.split(longformer_embed_paragraphs(all_paragraphs), offsets)
+    minilm = np.split(minilm_embed_paragraphs(all_paragraphs), offsets)
+    return list(zip(longformer, minilm))
+
+
+def run_bulk_analysis(essays, rubric_text, evaluation_mode=None, on_event=None, rubric=None):
+    """
+    Grades a class set against one rubric.
+
+    The rubric is parsed once. Essays are split and encoded BULK_ENCODE_CHUNK at a
+    time, and each essay is handed to a pool of BULK_ESSAY_CONCURRENCY evaluations as
+    soon as its chunk is encoded, so the encoder keeps working while earlier essays
+    are graded.
+
+    Args:
+        essays (list): (filename, text) pairs; text may be an Exception for a file
+            that could not be read, which is reported as that essay's error.
+        rubric (optional): A rubric library version, used instead of parsing `rubric_text`.
+        on_event (callable, optional): Called with "rubric_parsed", then one "essay_result"
+            ({"index", "filename"} plus the /analyze response body) or "essay_error"
+            ({"index", "filename", "error"}) per essay, in the order they finish.
+
+    Returns:
+        dict: counts of graded and failed essays and the elapsed time.
+    """
+    start = time.perf_counter()
+    counts = Counter()
+    lock = threading.Lock()
+
+    def emit(event, data):
+        with lock:
+            counts[event] += 1
+        if on_event is not None:
+            on_event(event, data)
+
+    def fail(index, filename, error):
+        logger.warning("Bulk essay %s failed: %s", filename, error)
+        emit("essay_error", {"index": index, "filename": filename, "error": str(error)})
+
+    # The whole set is one request to the LLM scheduler, so it gets a fair share of the
+    # workers next to interactive /analyze requests rather than one share per essay
+    with llm_scheduler.request_context() as bulk_id:
+        if rubric is None:
+            future_rubric = llm_scheduler.submit(lambda: extract_rubric_from_text(rubric_text))
+        else:
+            future_rubric = completed_future(json.dumps({"Criteria": rubric["criteria"]}))
+        rubric_sections = None
+
+        def evaluate(index, filename, essay_text, meta_result):
+            try:
+                record = GradingRecord(meta_result, evaluation_mode or EVALUATION_MODE, paragraph_prompt_keys(meta_result))
+                with llm_scheduler.request_context(bulk_id):
+                    results = evaluate_rubric(rubric_sections, meta_result, client, evaluation_mode, record=record)
+                emit("essay_result", {
+                    'index': index,
+                    'filename': filename,
+                    'success': True,
+                    'results': results,
+                    'essay_text': essay_text,
+                    'paragraphs': meta_result["paragraphs"],
+                    'analysis_id': chat_store.save_analysis(essay_text, results, record.state())
+                })
+            except Exception as e:
+                fail(index, filename, e)
+
+        with ThreadPoolExecutor(max_workers=BULK_ESSAY_CONCURRENCY, thread_name_prefix="bulk") as pool:
+            for chunk_start in range(0, len(essays), BULK_ENCODE_CHUNK):
+                chunk = []
+                for index, (filename, essay_text) in enumerate(essays[chunk_start:chunk_start + BULK_ENCODE_CHUNK], chunk_start):
+                    if isinstance(essay_text, Exception):
+                        fail(index, filename, essay_text)
+                    else:
+                        chunk.append((index, filename, essay_text))
+
+                themes = [llm_scheduler.submit(lambda text=essay_text: extract_essay_theme_gpt(text)) for _, _, essay_text in chunk]
+
+                # Local splits here; essays that need GPT-4o are queued on the scheduler together
+                splits = [split_paragraphs_local(essay_text) for _, _, essay_text in chunk]
+                fallbacks = {
+                    i: llm_scheduler.submit(lambda text=essay_text: split_paragraphs_gpt(text))
+                    for i, (paragraphs, (_, _, essay_text)) in enumerate(zip(splits, chunk)) if paragraphs is None
+                }
+                ready = []
+                for i, (index, filename, essay_text) in enumerate(chunk):
+                    try:
+                        paragraphs = fallbacks[i].result() if i in fallbacks else splits[i]
+                        ready.append((index, filename, essay_text, paragraphs, themes[i]))
+                    except Exception as e:
+                        fail(index, filename, e)
+                if not ready:
+                    continue
 
-            for future in concurrent.futures.as_completed(futures):
                 try:
-                    result = future.result()
-                    feedback_responses.append(result)
+                    encodings = encode_essays([paragraphs for _, _, _, paragraphs, _ in ready])
                 except Exception as e:
-                    print(f"Error during criterion evaluation: {e}")
+                    for index, filename, *_ in ready:
+                        fail(index, filename, e)
+                    continue
+
+                if rubric_sections is None:
+                    rubric_parsed = future_rubric.result()
+                    rubric_sections = parse_rubric_sections(rubric_parsed)
+                    emit("rubric_parsed", {"criteria": rubric_sections})
+
+                for (index, filename, essay_text, paragraphs, theme), (longformer, minilm) in zip(ready, encodings):
+                    try:
+                        meta_result = {
+                            'rubric_parsed': rubric_parsed,
+                            "structured_summary": encode_paragraphs_with_longformer(paragraphs, longformer, minilm),
+                            "gpt_summary": theme.result(),
+                            "paragraphs": paragraphs
+                        }
+                        if rubric is not None:
+                            meta_result["compiled_criteria"] = rubric["compiled"]
+                    except Exception as e:
+                        fail(index, filename, e)
+                        continue
+                    pool.submit(evaluate, index, filename, essay_text, meta_result)
 
-        print("\nDEBUG: Final Combined Feedback JSON:")
-        print(json.dumps(feedback_responses, indent=4))
+    return {
+        'success': True,
+        'essays': len(essays),
+        'graded': counts["essay_result"],
+        'failed': counts["essay_error"],
+        'seconds': round(time.perf_counter() - start, 3)
+    }
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-        return jsonify({
-            'success': True,
-            'results': feedback_responses,
-            'essay_text': essay_text,  #original essay text
-            'paragraphs': meta_result["paragraphs"]
-        })
 
+def run_analysis_job(job, store):
+    """
+    JobQueue runner: run_analysis for a persisted job. The pipeline output and each
+    finished criterion are saved as they land, so a resumed job skips straight to
+    the criteria that were still missing. The grading state saved for revisions covers
+    the criteria graded by this run; a revision re-grades the others in full.
+    """
+    job_id = job["id"]
+    params = job["params"]
+
+    def on_event(event, data):
+        store.add_event(job_id, event, data)
+        if event == "criterion_result":
+            store.add_criterion(job_id, data)
+
+    with llm_scheduler.request_context(job_id):
+        meta_result = job["meta_result"]
+        if meta_result is None:
+            rubric = rubric_store.get(params["rubric"]["id"], params["rubric"]["version"]) if params.get("rubric") else None
+            meta_result = process_rubric_and_pipeline(params["essay_text"], params["rubric_text"], on_event, rubric=rubric)
+            store.save_meta_result(job_id, meta_result)
+
+        # Skip criteria already finished before a restart (one per stored result, in case names repeat)
+        finished = Counter(result.get("criterion") for result in store.criteria(job_id))
+        remaining = []
+        for section in parse_rubric_sections(meta_result["rubric_parsed"]):
+            name = section.get("Name", "Unnamed Criterion")
+            if finished[name] > 0:
+                finished[name] -= 1
+            else:
+                remaining.append(section)
+
+        record = GradingRecord(meta_result, params.get("evaluation_mode") or EVALUATION_MODE, paragraph_prompt_keys(meta_result))
+        evaluate_rubric(remaining, meta_result, client, params.get("evaluation_mode"), on_event, record=record)
+
+    results = store.criteria(job_id)
+    return {
+        'success': True,
+        'results': results,
+        'essay_text': params["essay_text"],
+        'paragraphs': meta_result["paragraphs"],
+        'analysis_id': chat_store.save_analysis(params["essay_text"], results, record.state())
+    }
+
+
+# Background /jobs mode: jobs live in SQLite (JOBS_DB_PATH) and survive restarts
+job_queue = JobQueue(
+    JobStore(os.getenv("JOBS_DB_PATH", "jobs.sqlite3")),
+    run_analysis_job,
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_queued=int(os.getenv("JOB_QUEUE_SIZE", "32")),
+    retention_seconds=int(os.getenv("JOB_RETENTION_SECONDS", str(24 * 3600))),
+    lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "120")),
+)
+
+def start_background_work():
+    """Starts the job workers and the model warmup. Idempotent."""
+    job_queue.start()
+    if MODEL_WARMUP == "background":
+        model_registry.start_warmup()
+
+@app.before_request
+def start_on_first_request():
+    # Started on the first request (not at import) so that only the serving process
+    # resumes jobs and loads models, after it is already answering health checks
+    start_background_work()
+
+
+# HTTP metrics, labelled by route pattern (not path) so IDs don't explode the series
+http_requests = telemetry.registry.counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+http_seconds = telemetry.registry.histogram("http_request_seconds", "HTTP request latency until the response is returned (streams keep going).", ("route",))
+http_in_flight = telemetry.registry.gauge("http_requests_in_flight", "HTTP requests being handled.")
+telemetry.registry.gauge(
+    "llm_scheduler_tasks", "LLM scheduler tasks by state.", ("state",),
+    callback=lambda: {(state,): llm_scheduler.stats()[key] for state, key in (("running", "in_flight"), ("queued", "queue_depth"))},
+)
+telemetry.registry.gauge(
+    "paragraph_reuse_entries", "Graded paragraphs held in the paragraph reuse indexes.",
+    callback=lambda: {(): paragraph_reuse.stats()["entries"]},
+)
+telemetry.registry.gauge(
+    "analysis_jobs", "Background analysis jobs by state.", ("state",),
+    callback=lambda: {(state,): job_queue.stats()[state] for state in ("queued", "running")},
+)
+
+
+@app.before_request
+def start_request_timer():
+    request.environ["metrics.start"] = time.perf_counter()
+    http_in_flight.inc()
+
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    http_requests.inc(method=request.method, route=route, status=response.status_code)
+    started = request.environ.get("metrics.start")
+    if started is not None:  # unset if an earlier before_request hook failed
+        http_seconds.observe(time.perf_counter() - started, route=route)
+    return response
+
+
+@app.teardown_request
+def end_request_timer(error=None):
+    if "metrics.start" in request.environ:
+        http_in_flight.dec()
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text-format metrics: stage and LLM latency histograms, token and cost counters, gauges."""
+    return Response(telemetry.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/analyze', methods=['POST'])
+def analyze_essay():
+    try:
+        if 'essay' not in request.files or not has_rubric():
+            return jsonify({'error': 'Missing files'}), 400
+
+        essay_text, rubric_text, rubric = read_uploaded_texts()
+        evaluation_mode = request.form.get('evaluation_mode', EVALUATION_MODE)
+        # A revised draft: previous_analysis_id is the analysis_id of the earlier draft
+        response = run_analysis(
+            essay_text, rubric_text, evaluation_mode,
+            previous_analysis_id=request.form.get('previous_analysis_id'), rubric=rubric
+        )
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Final combined feedback JSON: %s", json.dumps(response['results']))
+
+        return jsonify(response)
+
+    except (UploadRejected, RequestEntityTooLarge) as e:
+        return upload_rejected(e)
+    except RubricNotFound as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
     except Exception as e:
-        print(f"Server Error: {str(e)}")  
+        logger.exception("Server error: %s", e)  
         return jsonify({
             'success': True,  
             'error': str(e)
         })
 
+@app.route('/analyze/stream', methods=['POST'])
+def analyze_essay_stream():
+    """
+    Same analysis as /analyze, streamed as Server-Sent Events while it runs:
+    rubric_parsed, paragraphs, theme, structured_summary, paragraph_result (one per
+    paragraph per criterion), criterion_result (one per criterion), then "done"
+    with exactly the /analyze response body (or "error").
+    """
+    if 'essay' not in request.files or not has_rubric():
+        return jsonify({'error': 'Missing files'}), 400
+
+    try:
+        essay_text, rubric_text, rubric = read_uploaded_texts()
+    except UploadRejected as e:
+        return upload_rejected(e)
+    except RubricNotFound as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e:
+        logger.exception("Server error: %s", e)
+        return jsonify({'success': True, 'error': str(e)})
+    evaluation_mode = request.form.get('evaluation_mode', EVALUATION_MODE)
+    previous_analysis_id = request.form.get('previous_analysis_id')
+
+    events = queue.Queue()
+
+    def emit(event, data):
+        events.put((event, data))
+
+    def worker():
+        try:
+            emit("done", run_analysis(essay_text, rubric_text, evaluation_mode, emit, previous_analysis_id, rubric))
+        except Exception as e:
+            logger.exception("Server error: %s", e)
+            emit("error", {'success': True, 'error': str(e)})
+        finally:
+            events.put(None)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+    def generate():
+        while True:
+            item = events.get()
+            if item is None:
+                break
+            yield format_sse(*item)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # don't let a reverse proxy buffer the stream
+    })
+
+def read_bulk_essays():
+    """
+    (filename, text or Exception) for every essay in a /analyze/bulk request: the
+    'essays' files and the documents inside any 'archive' .zip files. Bytes are read
+    here, within the upload limits (BULK_MAX_TOTAL_BYTES for everything once
+    decompressed); conversion happens later, on the worker thread.
+    """
+    uploads = []
+    for file in request.files.getlist('essays'):
+        uploads.append((file.filename, read_limited(file.stream, UPLOAD_MAX_BYTES, file.filename)))
+    for file in request.files.getlist('archive'):
+        data = read_limited(file.stream, UPLOAD_MAX_BYTES, file.filename)
+        remaining = BULK_MAX_TOTAL_BYTES - sum(len(content) for _, content in uploads)
+        if remaining <= 0:
+            raise UploadRejected(f"Essays expand past the {BULK_MAX_TOTAL_BYTES / (1024 * 1024):g} MB limit")
+        uploads.extend(read_archive(data, UPLOAD_MAX_BYTES, BULK_MAX_ESSAYS, remaining))
+    if len(uploads) > BULK_MAX_ESSAYS:
+        raise UploadRejected(f"{len(uploads)} essays uploaded; the limit is {BULK_MAX_ESSAYS}")
+    return uploads
+
+
+def convert_bulk_essays(uploads):
+    essays = []
+    for filename, data in uploads:
+        extension = os.path.splitext(filename or "")[1].lower()
+        try:
+            if extension not in SUPPORTED_EXTENSIONS:
+                raise ValueError(f"Unsupported file format: {extension}")
+            with telemetry.span("convert"):
+                essays.append((filename, document_converter.convert(filename, data)))
+        except Exception as e:
+            essays.append((filename, e))
+    return essays
+
+
+@app.route('/analyze/bulk', methods=['POST'])
+def analyze_essays_bulk():
+    """
+    Grades a class set against one rubric. Form fields: 'rubric' (or 'rubric_id'), plus any number of
+    'essays' files and/or 'archive' .zip files of .pdf/.docx/.txt essays. Streamed as
+    Server-Sent Events: "essays" (the accepted filenames, by index), "rubric_parsed",
+    one "essay_result" or "essay_error" per essay as each finishes, then "done" with
+    the counts (or "error").
+    """
+    if not has_rubric() or not (request.files.getlist('essays') or request.files.getlist('archive')):
+        return jsonify({'error': 'Missing files'}), 400
+
+    try:
+        uploads = read_bulk_essays()
+        rubric_text, rubric = read_rubric_choice()
+    except (UploadRejected, RequestEntityTooLarge) as e:
+        return upload_rejected(e)
+    except RubricNotFound as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    evaluation_mode = request.form.get('evaluation_mode', EVALUATION_MODE)
+
+    events = queue.Queue()
+
+    def emit(event, data):
+        events.put((event, data))
+
+    def worker():
+        try:
+            essays = convert_bulk_essays(uploads)
+            emit("done", run_bulk_analysis(essays, rubric_text, evaluation_mode, emit, rubric))
+        except Exception as e:
+            logger.exception("Server error: %s", e)
+            emit("error", {'success': False, 'error': str(e)})
+        finally:
+            events.put(None)
+
+    emit("essays", {"essays": [{"index": index, "filename": filename} for index, (filename, _) in enumerate(uploads)]})
+    threading.Thread(target=worker, daemon=True).start()
+
+    def generate():
+        while True:
+            item = events.get()
+            if item is None:
+                break
+            yield format_sse(*item)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/jobs', methods=['POST'])
+def submit_analysis_job():
+    """
+    Same form fields as /analyze, but returns 202 with a job ID immediately. Poll
+    GET /jobs/<id> or stream GET /jobs/<id>/events for progress and the result.
+    """
+    if 'essay' not in request.files or not has_rubric():
+        return jsonify({'error': 'Missing files'}), 400
+
+    try:
+        essay_text, rubric_text, rubric = read_uploaded_texts()
+        job_id = job_queue.submit({
+            'essay_text': essay_text,
+            'rubric_text': rubric_text,
+            # A library rubric is pinned to the version current at submission
+            'rubric': {'id': rubric["id"], 'version': rubric["version"]} if rubric is not None else None,
+            'evaluation_mode': request.form.get('evaluation_mode', EVALUATION_MODE),
+        })
+    except RubricNotFound as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except QueueFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
+    except UploadRejected as e:
+        return upload_rejected(e)
+    except Exception as e:
+        logger.exception("Server error: %s", e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    return jsonify({'success': True, 'job_id': job_id, 'status': 'queued'}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """
+    Job status plus the criteria finished so far. Events after ?after=<seq> are
+    included; when status is "done", "result" is the /analyze response body.
+    """
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+
+    return jsonify({
+        'job_id': job_id,
+        'status': job['status'],
+        'created': job['created'],
+        'updated': job['updated'],
+        'results': job_queue.store.criteria(job_id),
+        'events': job_queue.store.events(job_id, request.args.get('after', 0, type=int)),
+        'result': job['result'],
+        'error': job['error'],
+    })
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_analysis_job(job_id):
+    """
+    Server-Sent Events for a job: replays stored events (after ?after=<seq> or the
+    Last-Event-ID header), then follows new ones until "done" or "error".
+    """
+    if job_queue.store.get(job_id) is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    after = request.headers.get('Last-Event-ID', request.args.get('after', 0), type=int)
+
+    def generate():
+        seq = after
+        while True:
+            # Read the status first: the final event is stored with the finished status, in one transaction
+            finished = job_queue.store.get(job_id)["status"] in ("done", "failed")
+            for item in job_queue.store.events(job_id, seq):
+                seq = item["seq"]
+                yield f"id: {seq}\n" + format_sse(item["event"], item["data"])
+            if finished:
+                return
+            time.sleep(0.5)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/jobs/stats', methods=['GET'])
+def job_stats():
+    return jsonify(job_queue.stats())
+
+# Chat sessions (/chat/sessions) live in SQLite (CHAT_DB_PATH). Once a session has more than
+# CHAT_HISTORY_MAX_MESSAGES unsummarized messages, all but the newest CHAT_HISTORY_KEEP_MESSAGES
+# are folded into a running summary
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
+
+
+def chat_summary_request(summary, messages):
+    """Chat completion parameters for folding older chat turns into the running summary."""
+    transcript = "\n\n".join(f"{message['role'].upper()}: {message['content']}" for message in messages)
+    prompt = f"""
+    You are keeping a running summary of a conversation between a student and an essay feedback assistant.
+
+    Update the summary with the new turns below. Keep the student's questions, the advice and examples
+    given, and anything the student said they would change. Write at most 200 words.
+
+    Current summary:
+    {summary or "(none yet)"}
+
+    New turns:
+    {transcript}
+    """
+    return {
+        "model": CHAT_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.2,
+        "max_tokens": 400,
+    }
+
+
+def summarize_chat_history(summary, messages):
+    response = create_chat_completion(client, stage="chat_summary", **chat_summary_request(summary, messages))
+    return response.choices[0].message.content.strip()
+
+
+chat_store = ChatStore(os.getenv("CHAT_DB_PATH", "chat.sqlite3"))
+chat_sessions = ChatSessions(
+    chat_store,
+    summarize_chat_history,
+    max_messages=int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "12")),
+    keep_messages=int(os.getenv("CHAT_HISTORY_KEEP_MESSAGES", "6")),
+    retention_seconds=int(os.getenv("CHAT_RETENTION_SECONDS", str(7 * 24 * 3600))),
+)
+
+
+@app.route('/chat/sessions', methods=['POST'])
+def create_chat_session():
+    """
+    Opens a chat session on an analysis: {"analysis_id": ...} from an /analyze result,
+    or {"essay_text": ..., "feedback": ...} for a result without one.
+    """
+    data = request.json or {}
+    analysis_id = data.get('analysis_id')
+    if not analysis_id:
+        if 'feedback' not in data:
+            return jsonify({'error': 'Missing analysis_id'}), 400
+        analysis_id = chat_store.save_analysis(data.get('essay_text', ''), data['feedback'])
+
+    session_id = chat_sessions.start(analysis_id)
+    if session_id is None:
+        return jsonify({'success': False, 'error': 'Unknown analysis'}), 404
+    return jsonify({'success': True, 'session_id': session_id, 'analysis_id': analysis_id})
+
+
+@app.route('/chat/sessions/<session_id>', methods=['GET'])
+def get_chat_session(session_id):
+    session = chat_store.get_session(session_id)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Unknown chat session'}), 404
+    return jsonify({
+        'success': True,
+        'analysis_id': session["analysis_id"],
+        'summary': session["summary"],
+        'messages': chat_store.messages(session_id)
+    })
+
+
+@app.route('/chat/sessions/<session_id>/messages', methods=['POST'])
+def send_chat_session_message(session_id):
+    """
+    Sends {"message": ...} and streams the reply as Server-Sent Events: "token" events
+    ({"text": ...}) as the model writes, then "done" with the full response and the
+    turn's token usage (or "error").
+    """
+    data = request.json
+    if not data or not data.get('message'):
+        return jsonify({'error': 'Missing message'}), 400
+    session = chat_store.get_session(session_id)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Unknown chat session'}), 404
+
+    user_message = data['message']
+    messages = chat_sessions.prompt(session, user_message)
+
+    def generate():
+        start = time.perf_counter()
+        parts, usage, stream_usage, first_token_seconds = [], None, None, None
+        try:
+            stream = create_chat_completion(
+                client,
+                stage="chat",
+                model=CHAT_MODEL,
+                messages=messages,
+                temperature=0.7,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            # Closing the stream (also when the client disconnects) frees its scheduler slot
+            with closing(stream):
+                for chunk in stream:
+                    if chunk.usage is not None:
+                        stream_usage = chunk.usage
+                        usage = chunk.usage.model_dump(exclude_none=True)
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    if text:
+                        if first_token_seconds is None:
+                            first_token_seconds = time.perf_counter() - start
+                        parts.append(text)
+                        yield format_sse("token", {"text": text})
+
+            response = "".join(parts)
+            token_usage.record("chat", stream_usage, count_message_tokens(messages, CHAT_MODEL))
+            telemetry.record_llm_usage(CHAT_MODEL, stream_usage)
+            if chat_sessions.record_turn(session_id, user_message, response):
+                llm_scheduler.submit(lambda: chat_sessions.compact(session_id))
+            yield format_sse("done", {
+                'success': True,
+                'response': response,
+                'usage': usage,
+                'time_to_first_token': first_token_seconds
+            })
+        except Exception as e:
+            logger.exception("Error in chat handler: %s", e)
+            yield format_sse("error", {'success': False, 'error': str(e)})
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
 @app.route('/chat', methods=['POST'])
 def handle_chat_message():
+    """Stateless chat (the client resends everything each turn); /chat/sessions replaces it."""
     try:
         data = request.json
         if not data or 'message' not in data:
@@ -682,30 +2537,15 @@ def handle_chat_message():
             formatted_history.append({"role": role, "content": msg['message']})
 
         # prompt with both feedback and essay context
-        system_prompt = f"""You are an expert essay evaluator assistant providing personalized feedback.
-
-FEEDBACK CONTEXT:
-{feedback_context}
-
-ESSAY CONTEXT:
-{essay_text}
-
-Your task is to:
-1. Provide helpful, concise explanations about the feedback
-2. If asked about specific parts of the essay, reference both the feedback and relevant essay content
-3. Give specific, actionable advice based on the feedback context
-4. When suggesting improvements, provide examples of better phrasing or structure
-5. Be encouraging but honest about areas that need improvement
-6. Focus on helping the student understand how to implement the feedback
-
-Keep responses clear, specific, and directly related to the student's question.
-"""
+        system_prompt = chat_system_prompt(essay_text, feedback_context)
         messages = [{"role": "system", "content": system_prompt}]
         messages.extend(formatted_history)
         messages.append({"role": "user", "content": user_message})
 
-        completion = client.chat.completions.create(
-            model="gpt-4o-mini",
+        completion = create_chat_completion(
+            client,
+            stage="chat",
+            model=CHAT_MODEL,
             messages=messages,
             temperature=0.7, 
         )
@@ -717,7 +2557,7 @@ Keep responses clear, specific, and directly related to the student's question.
         })
 
     except Exception as e:
-        print(f"Error in chat handler: {str(e)}")
+        logger.exception("Error in chat handler: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -0,0 +1,80 @@
+"""
+ASGI entry point:
+
+    uvicorn asgi:app --host 127.0.0.1 --port 5000
+
+POST /analyze is served by the asyncio pipeline (async_pipeline.py), so one worker
+process can carry hundreds of concurrent essays. Every other route falls through
+to the Flask app unchanged.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+import app as flask_backend
+import async_pipeline
+from documents import UploadRejected
+from rubrics import RubricNotFound
+
+logger = logging.getLogger(__name__)
+
+
+def cors_json(content, status_code=200):
+    # Matches flask-cors' default for the Flask routes
+    return JSONResponse(content, status_code=status_code, headers={"Access-Control-Allow-Origin": "*"})
+
+
+async def analyze_essay(request):
+    try:
+        form = await request.form()
+        if 'essay' not in form or not ('rubric' in form or form.get('rubric_id')):
+            return cors_json({'error': 'Missing files'}, 400)
+
+        essay_file = form['essay']
+        essay_text = await async_pipeline.convert_upload_async(essay_file)
+        rubric_text = rubric = None
+        if form.get('rubric_id'):
+            rubric = await asyncio.to_thread(
+                flask_backend.rubric_store.get, form['rubric_id'], form.get('rubric_version') or None
+            )
+        else:
+            rubric_text = await async_pipeline.convert_upload_async(form['rubric'])
+
+        evaluation_mode = form.get('evaluation_mode', flask_backend.EVALUATION_MODE)
+        previous_analysis_id = form.get('previous_analysis_id')
+        if previous_analysis_id:
+            # Revisions are re-graded incrementally by the threaded pipeline
+            return cors_json(await asyncio.to_thread(
+                flask_backend.run_analysis, essay_text, rubric_text, evaluation_mode, None, previous_analysis_id, rubric
+            ))
+        return cors_json(await async_pipeline.analyze_texts_async(essay_text, rubric_text, evaluation_mode, rubric))
+
+    except UploadRejected as e:
+        return cors_json({'success': False, 'error': str(e)}, 413)
+    except RubricNotFound as e:
+        return cors_json({'success': False, 'error': str(e)}, 404)
+    except Exception as e:
+        logger.exception("Server error: %s", e)
+        return cors_json({
+            'success': True,
+            'error': str(e)
+        })
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # The server is accepting connections from here on; models load in the background
+    flask_backend.start_background_work()
+    yield
+
+
+app = Starlette(lifespan=lifespan, routes=[
+    Route('/analyze', analyze_essay, methods=['POST']),
+    Mount('/', app=WSGIMiddleware(flask_backend.app)),
+])
@@ -0,0 +1,268 @@
+"""
+Asyncio-native version of the analysis pipeline.
+
+Uses the same prompts, parsing and caches as app.py, but LLM calls go through
+AsyncOpenAI and are awaited concurrently, so a single event loop can carry many
+essays without an OS thread per in-flight call. CPU-bound work (file conversion,
+Longformer, MiniLM) runs in a small executor so the event loop never stalls.
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from openai import AsyncOpenAI
+
+import app
+import structured_output
+import telemetry
+from documents import UploadRejected, too_large
+
+logger = logging.getLogger(__name__)
+
+# AsyncOpenAI's connection pool is bound to the event loop it was first used on
+_aclients = weakref.WeakKeyDictionary()
+
+
+def get_aclient():
+    """Returns the AsyncOpenAI client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    aclient = _aclients.get(loop)
+    if aclient is None:
+        # Retries are handled by the LLM scheduler, as with the sync client
+        aclient = _aclients[loop] = AsyncOpenAI(max_retries=0)
+    return aclient
+
+# Encoders release the GIL inside torch, but running several at once only contends for cores
+cpu_executor = ThreadPoolExecutor(max_workers=int(os.getenv("ENCODER_THREADS", "2")), thread_name_prefix="encoder")
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """Runs blocking work in the encoder executor, in this task's context (so its spans join the trace)."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, partial(context.run, fn, *args, **kwargs))
+
+
+@telemetry.traced("convert")
+async def convert_upload_async(upload):
+    """
+    Reads an uploaded file (a Starlette UploadFile) within the byte limit and converts
+    it to text off the event loop. Raises UploadRejected past the limits.
+    """
+    chunks, total = [], 0
+    while chunk := await upload.read(1024 * 1024):
+        total += len(chunk)
+        if total > app.UPLOAD_MAX_BYTES:
+            raise too_large(upload.filename, app.UPLOAD_MAX_BYTES)
+        chunks.append(chunk)
+
+    try:
+        return await run_cpu(app.document_converter.convert, upload.filename, b"".join(chunks))
+    except UploadRejected:
+        raise
+    except Exception as e:
+        return f"Error converting file: {str(e)}"
+
+
+async def acreate_chat_completion(aclient, use_cache=False, stage=None, **params):
+    """Async counterpart of app.create_chat_completion (same cache, rate limits and usage counts)."""
+    key, cached = app.lookup_cached_completion(use_cache, params)
+    if cached is not None:
+        app.token_usage.record(stage, cache_hit=True)
+        telemetry.llm_response_cache_hits.inc(stage=stage or "other")
+        return cached
+
+    started = time.perf_counter()
+    response = await app.llm_scheduler.acall(
+        lambda: aclient.chat.completions.create(**params),
+        model=params.get("model"),
+        estimated_tokens=app.estimate_request_tokens(params),
+        request_id=telemetry.current_trace_id(),  # one fair-queuing slot per analysis
+    )
+    telemetry.llm_seconds.observe(time.perf_counter() - started, model=params.get("model"), stage=stage or "other")
+    app.record_token_usage(stage, params, response)
+    app.store_cached_completion(key, params, response)
+    return response
+
+
+async def astructured_completion(stage, name, params):
+    """Async counterpart of app.structured_completion."""
+    aclient = get_aclient()
+    response = await acreate_chat_completion(aclient, stage=stage, **params)
+    return await structured_output.aparse_reply(
+        name, stage, response, lambda repair: acreate_chat_completion(aclient, stage=f"{stage}_repair", **repair)
+    )
+
+
+async def split_paragraphs_async(essay_text, use_cache=True):
+    with telemetry.span("split", method="local") as attributes:
+        paragraphs = await run_cpu(app.split_paragraphs_local, essay_text)
+        if paragraphs is None:
+            attributes["method"] = "gpt"
+            response = await acreate_chat_completion(get_aclient(), use_cache=use_cache, stage="split", **app.split_paragraphs_request(essay_text))
+            paragraphs = app.parse_split_paragraphs(response)
+        attributes["paragraphs"] = len(paragraphs)
+    return paragraphs
+
+
+@telemetry.traced("theme")
+async def extract_essay_theme_async(essay_text, use_cache=True):
+    response = await acreate_chat_completion(get_aclient(), use_cache=use_cache, stage="theme", **app.essay_theme_request(essay_text))
+    return response.choices[0].message.content.strip()
+
+
+@telemetry.traced("rubric_parse")
+async def extract_rubric_from_text_async(rubric_text, use_cache=True):
+    try:
+        response = await acreate_chat_completion(get_aclient(), use_cache=use_cache, stage="rubric", **app.rubric_extraction_request(rubric_text))
+    except Exception as e:
+        logger.error("Error calling OpenAI for the rubric: %s", e)
+        return app.rubric_error_json("API Error", f"API error: {str(e)}")
+    return app.parse_rubric_response(response)
+
+
+async def library_rubric_parsed(rubric):
+    return json.dumps({"Criteria": rubric["criteria"]})
+
+
+async def process_rubric_and_pipeline_async(essay_text, rubric_text, rubric=None):
+    """Async version of app.process_rubric_and_pipeline; returns the same dict."""
+    rubric_parsed, paragraphs, theme = await asyncio.gather(
+        extract_rubric_from_text_async(rubric_text) if rubric is None else library_rubric_parsed(rubric),
+        split_paragraphs_async(essay_text),
+        extract_essay_theme_async(essay_text),
+    )
+
+    context_summary = await run_cpu(app.encode_paragraphs_with_longformer, paragraphs)
+
+    result = {
+        'rubric_parsed': rubric_parsed,
+        "structured_summary": context_summary,
+        "gpt_summary": theme,
+        "paragraphs": paragraphs
+    }
+    if rubric is not None:
+        result["compiled_criteria"] = rubric["compiled"]
+    return result
+
+
+@telemetry.traced("paragraph_evaluation")
+async def evaluate_paragraph_async(compiled, meta_result, idx):
+    try:
+        return await astructured_completion("paragraph", "paragraph_evaluation", app.paragraph_evaluation_request(compiled, meta_result, idx))
+    except Exception as e:
+        logger.error("Error on paragraph %d: %s", idx + 1, e)
+        return app.paragraph_error(idx, compiled["name"], e)
+
+
+@telemetry.traced("criterion_summary")
+async def summarize_criterion_async(compiled, meta_result, paragraph_feedback):
+    try:
+        final_feedback = await astructured_completion(
+            "summary", "criterion_summary", app.criterion_summary_request(compiled, meta_result, paragraph_feedback)
+        )
+    except Exception as e:
+        final_feedback = app.summary_error(compiled["name"], e)
+
+    return {
+        "criterion": compiled["name"],
+        "final_summary": final_feedback
+    }
+
+
+async def evaluate_criterion_async(section, meta_result, paragraph_feedback=None, record=None):
+    """
+    Async version of app.evaluate_criterion, with the same paragraph reuse (app.paragraph_reuse).
+    A `record` (revisions.GradingRecord) is given the criterion's feedback and summary.
+    """
+    compiled = app.compiled_criterion(section, meta_result)
+    if paragraph_feedback is None:
+        indices = list(range(len(meta_result["paragraphs"])))
+        vectors = await run_cpu(app.paragraph_vectors, meta_result)
+        reused = {}
+        if vectors is not None:
+            reuse_key = app.content_key(section)
+            reused = app.paragraph_reuse.lookup(reuse_key, vectors, indices)
+        graded = [idx for idx in indices if idx not in reused]
+        evaluations = await asyncio.gather(*[evaluate_paragraph_async(compiled, meta_result, idx) for idx in graded])
+        for idx, evaluation in zip(graded, evaluations):
+            reused[idx] = evaluation
+            if vectors is not None:
+                app.paragraph_reuse.add(reuse_key, vectors[idx], evaluation)
+        paragraph_feedback = [reused[idx] for idx in indices]
+    result = await summarize_criterion_async(compiled, meta_result, paragraph_feedback)
+    if record is not None:
+        summary_key = app.criterion_summary_key(compiled, meta_result, paragraph_feedback)
+        record.add_criterion(compiled["name"], section, paragraph_feedback, summary_key, result["final_summary"])
+    return result
+
+
+@telemetry.traced("multi_criterion_evaluation")
+async def evaluate_paragraphs_multi_criterion_async(rubric_sections, meta_result):
+    criteria = [app.compiled_criterion(section, meta_result) for section in rubric_sections]
+
+    async def evaluate_group(group):
+        try:
+            evaluations = (await astructured_completion(
+                "multi_criterion", "multi_criterion_evaluation", app.multi_criterion_request(criteria, meta_result, group)
+            ))["evaluations"]
+            return group, evaluations, None
+        except Exception as e:
+            logger.error("Error on paragraphs %s: %s", [idx + 1 for idx in group], e)
+            return group, [], e
+
+    groups = app.plan_paragraph_groups(meta_result["paragraphs"], app.EVALUATION_GROUP_TOKEN_BUDGET)
+    results = await asyncio.gather(*[evaluate_group(group) for group in groups])
+    return app.fan_out_multi_criterion(criteria, len(meta_result["paragraphs"]), results)
+
+
+async def evaluate_rubric_async(rubric_sections, meta_result, mode=None, record=None):
+    """Async version of app.evaluate_rubric; results are returned in completion order."""
+    mode = mode or app.EVALUATION_MODE
+    if mode not in ("per_criterion", "multi_criterion"):
+        raise ValueError(f"Unknown evaluation mode: {mode}")
+
+    feedback_by_criterion = {}
+    if mode == "multi_criterion" and rubric_sections:
+        feedback_by_criterion = await evaluate_paragraphs_multi_criterion_async(rubric_sections, meta_result)
+
+    tasks = [
+        evaluate_criterion_async(section, meta_result, feedback_by_criterion.get(section.get("Name", "Unnamed Criterion")), record)
+        for section in rubric_sections
+    ]
+    feedback_responses = []
+    for next_result in asyncio.as_completed(tasks):
+        try:
+            feedback_responses.append(await next_result)
+        except Exception as e:
+            logger.error("Error during criterion evaluation: %s", e)
+    return feedback_responses
+
+
+async def analyze_texts_async(essay_text, rubric_text, mode=None, rubric=None):
+    """
+    Runs the whole analysis for already-extracted texts and returns the /analyze response
+    body. With `rubric` (a rubric library version), `rubric_text` is not used.
+    """
+    with telemetry.trace(), telemetry.span("analysis"):
+        meta_result = await process_rubric_and_pipeline_async(essay_text, rubric_text, rubric)
+        rubric_sections = app.parse_rubric_sections(meta_result["rubric_parsed"])
+        record = app.GradingRecord(meta_result, mode or app.EVALUATION_MODE, app.paragraph_prompt_keys(meta_result))
+        feedback_responses = await evaluate_rubric_async(rubric_sections, meta_result, mode, record)
+
+    response = {
+        'success': True,
+        'results': feedback_responses,
+        'essay_text': essay_text,  #original essay text
+        'paragraphs': meta_result["paragraphs"],
+        'analysis_id': await asyncio.to_thread(app.chat_store.save_analysis, essay_text, feedback_responses, record.state())
+    }
+    if rubric is not None:
+        response['rubric'] = {'id': rubric["id"], 'version': rubric["version"]}
+    return response
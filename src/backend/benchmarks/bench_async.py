@@ -0,0 +1,129 @@
+"""
+Load test: N concurrent essays through the threaded pipeline vs the asyncio
+pipeline, against the local mock OpenAI server. Each path runs in its own
+subprocess so peak RSS and thread counts are not shared.
+
+Run from src/backend:
+    python -m benchmarks.bench_async --essays 50 --latency 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.synthetic import make_essays
+
+RUBRIC_TEXT = "Focus: 4 clear / 1 unclear\nEvidence: 4 strong / 1 missing\nOrganization: 4 logical / 1 random"
+
+
+class ThreadSampler:
+    """Samples the process's thread count in the background and keeps the peak."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_path(path, essays):
+    import app
+    import async_pipeline
+
+    texts = ["\n\n".join(essay) for essay in essays]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def analyze_threaded(essay_text):
+        with app.llm_scheduler.request_context():
+            meta_result = app.process_rubric_and_pipeline(essay_text, RUBRIC_TEXT)
+            rubric_sections = app.parse_rubric_sections(meta_result["rubric_parsed"])
+            return app.evaluate_rubric(rubric_sections, meta_result, app.client)
+
+    async def analyze_async():
+        return await asyncio.gather(*[async_pipeline.analyze_texts_async(text, RUBRIC_TEXT) for text in texts])
+
+    with ThreadSampler() as sampler:
+        start = time.perf_counter()
+        if path == "threaded":
+            # One request thread per concurrent essay, as under a threaded WSGI server
+            with ThreadPoolExecutor(max_workers=len(texts)) as executor:
+                list(executor.map(analyze_threaded, texts))
+        else:
+            asyncio.run(analyze_async())
+        elapsed = time.perf_counter() - start
+
+    return {
+        "path": path,
+        "essays": len(texts),
+        "seconds": elapsed,
+        "essays_per_second": len(texts) / elapsed,
+        "peak_threads": sampler.peak,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rss_growth_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+        "llm_stats": app.llm_scheduler.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays", type=int, default=50)
+    parser.add_argument("--paragraphs", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.3, help="mock seconds per completion")
+    parser.add_argument("--concurrency", type=int, default=64, help="LLM_MAX_CONCURRENCY for both paths")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--child", choices=["threaded", "async"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    essays = make_essays(args.essays, min_paragraphs=max(5, args.paragraphs // 2), max_paragraphs=args.paragraphs)
+    if args.child:
+        print(json.dumps(run_path(args.child, essays)))
+        return
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_openai_server", "--port", str(args.port), "--latency", str(args.latency)],
+        stdout=subprocess.DEVNULL,
+    )
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.port}/v1",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-mock"),
+        "LLM_CACHE_PATH": "",
+        "LLM_MAX_CONCURRENCY": str(args.concurrency),
+    }
+    try:
+        time.sleep(1.0)
+        for path in ("threaded", "async"):
+            child = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_async", "--child", path,
+                 "--essays", str(args.essays), "--paragraphs", str(args.paragraphs)],
+                env=env, capture_output=True, text=True, check=True,
+            )
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            print(f"{path:>9}: {result['seconds']:7.2f}s  {result['essays_per_second']:6.2f} essays/s  "
+                  f"peak threads {result['peak_threads']:4d}  peak RSS {result['peak_rss_mb']:8.1f} MB "
+                  f"(+{result['rss_growth_mb']:.1f} MB)  LLM calls {result['llm_stats']['completed']}")
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
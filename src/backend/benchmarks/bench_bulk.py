@@ -0,0 +1,116 @@
+"""
+Class-set throughput: one /analyze/bulk upload of N essays vs N sequential /analyze
+calls with the same rubric, both through the Flask test client with a stubbed LLM
+(fixed latency per call). Reports wall time, essays/minute, LLM calls and Longformer
+forward passes for each path, and checks that both paths grade every essay the same.
+
+The response cache and the embedding cache are disabled so every path does its full
+work. The encoders are the configured ones (see ENCODER_BACKEND etc.).
+
+Run from src/backend:
+    python -m benchmarks.bench_bulk --essays 100 --latency 0.05
+"""
+
+import argparse
+import io
+import json
+import os
+import time
+
+os.environ.setdefault("EMBEDDING_CACHE_SIZE", "0")
+os.environ.setdefault("EMBEDDING_CACHE_DIR", "")
+os.environ.setdefault("LLM_CACHE_PATH", "")
+os.environ.setdefault("MODEL_WARMUP", "lazy")
+os.environ.setdefault("PARAGRAPH_REUSE", "0")  # the same paragraphs are graded repeatedly
+
+import app
+from benchmarks.stub_openai import StubOpenAI
+from benchmarks.synthetic import make_essays
+
+RUBRIC_TEXT = "Focus: 4 clear / 1 unclear\nEvidence: 4 strong / 1 missing\nOrganization: 4 logical / 1 random"
+
+
+def count_forward_passes():
+    """Wraps the loaded Longformer so its forward passes are counted."""
+    model = app.get_longformer()[1]
+    counter = {"passes": 0}
+    original = model.forward
+
+    def forward(*args, **kwargs):
+        counter["passes"] += 1
+        return original(*args, **kwargs)
+
+    model.forward = forward
+    return counter
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        events.append((lines.get("event"), json.loads(lines.get("data", "null"))))
+    return events
+
+
+def run_sequential(client, texts):
+    results = []
+    for i, text in enumerate(texts):
+        response = client.post("/analyze", data={
+            "essay": (io.BytesIO(text.encode()), f"essay_{i:03d}.txt"),
+            "rubric": (io.BytesIO(RUBRIC_TEXT.encode()), "rubric.txt"),
+        }, content_type="multipart/form-data")
+        results.append(response.get_json())
+    return results
+
+
+def run_bulk(client, texts):
+    response = client.post("/analyze/bulk", data={
+        "essays": [(io.BytesIO(text.encode()), f"essay_{i:03d}.txt") for i, text in enumerate(texts)],
+        "rubric": (io.BytesIO(RUBRIC_TEXT.encode()), "rubric.txt"),
+    }, content_type="multipart/form-data")
+    events = parse_sse(response.get_data(as_text=True))
+    results = [None] * len(texts)
+    for event, data in events:
+        if event in ("essay_result", "essay_error"):
+            results[data["index"]] = data
+    return results, dict(events).get("done")
+
+
+def fingerprint(result):
+    """What must match between the paths: paragraphs and every criterion's scores."""
+    if not result or not result.get("success") or "results" not in result:
+        return None
+    return result["paragraphs"], sorted(json.dumps(r, sort_keys=True) for r in result["results"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated seconds per LLM call")
+    args = parser.parse_args()
+
+    texts = ["\n\n".join(essay) for essay in make_essays(args.essays, min_paragraphs=4, max_paragraphs=8, seed=3)]
+    client = app.app.test_client()
+    app.get_minilm()
+    passes = count_forward_passes()
+
+    report = {}
+    for label, run in (("sequential /analyze", run_sequential), ("/analyze/bulk", run_bulk)):
+        app.client = StubOpenAI(latency=args.latency)
+        passes["passes"] = 0
+        start = time.perf_counter()
+        output = run(client, texts)
+        elapsed = time.perf_counter() - start
+        results = output[0] if isinstance(output, tuple) else output
+        report[label] = [fingerprint(result) for result in results]
+        print(f"{label:>20}: {elapsed:7.2f}s  {args.essays / elapsed * 60:7.1f} essays/min  "
+              f"{app.client.call_count():5d} LLM calls  {passes['passes']:4d} Longformer passes")
+
+    sequential, bulk = report.values()
+    failed = sum(result is None for result in bulk)
+    mismatched = sum(a != b for a, b in zip(sequential, bulk))
+    print(f"bulk failed essays: {failed}; essays graded differently: {mismatched}")
+
+
+if __name__ == "__main__":
+    main()
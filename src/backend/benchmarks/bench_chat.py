@@ -0,0 +1,125 @@
+"""
+Long-conversation chat benchmark: the stateless /chat (client resends essay, feedback
+and full history every turn) vs /chat/sessions (server-side history, streamed reply).
+Reports request payload bytes, prompt tokens and time to first token per turn, using a
+stubbed LLM whose time to first token grows with prompt length.
+
+Run from src/backend:
+    python -m benchmarks.bench_chat --turns 30 --paragraphs 12
+"""
+
+import argparse
+import json
+import os
+import time
+
+os.environ.setdefault("LLM_CACHE_PATH", "")
+os.environ.setdefault("CHAT_DB_PATH", ":memory:")
+os.environ.setdefault("MODEL_WARMUP", "lazy")
+os.environ.setdefault("PARAGRAPH_REUSE", "0")  # the same paragraphs are graded repeatedly
+
+import app
+from benchmarks.bench_evaluation import make_meta_result
+from benchmarks.stub_openai import StubOpenAI, make_rubric
+from benchmarks.synthetic import make_essay
+
+QUESTIONS = [
+    "Why did my second paragraph lose points on evidence?",
+    "Can you show me a better way to introduce the quotation?",
+    "How should I restructure the conclusion?",
+    "Is my thesis specific enough?",
+    "What is one thing I should fix first?",
+]
+
+
+def make_analysis(paragraphs, criteria):
+    """An /analyze response body graded by the stub."""
+    meta_result = make_meta_result(make_essay(paragraphs, seed=11))
+    results = app.evaluate_rubric(make_rubric(criteria)["Criteria"], meta_result, StubOpenAI())
+    essay_text = "\n\n".join(meta_result["paragraphs"])
+    return {
+        "success": True,
+        "results": results,
+        "essay_text": essay_text,
+        "paragraphs": meta_result["paragraphs"],
+        "analysis_id": app.chat_store.save_analysis(essay_text, results),
+    }
+
+
+def wait_for_scheduler():
+    """Lets background work (history summaries) finish before the next turn."""
+    while True:
+        stats = app.llm_scheduler.stats()
+        if stats["submitted"] == stats["completed"] + stats["failed"]:
+            return
+        time.sleep(0.005)
+
+
+def run_stateless(client, analysis, turns):
+    rows, history = [], []
+    for turn in range(turns):
+        message = QUESTIONS[turn % len(QUESTIONS)]
+        body = json.dumps({
+            "message": message,
+            "feedback": json.dumps(analysis),  # what the results page sends
+            "chatHistory": history,
+            "essay_text": analysis["essay_text"],
+        })
+        start = time.perf_counter()
+        response = client.post("/chat", data=body, content_type="application/json").get_json()
+        first_token = time.perf_counter() - start  # nothing arrives before the whole reply
+        history += [{"user": True, "message": message}, {"user": False, "message": response["response"]}]
+        rows.append((len(body), app.client.calls[-1]["prompt_tokens"], first_token))
+    return rows
+
+
+def run_sessions(client, analysis, turns):
+    session_id = client.post("/chat/sessions", json={"analysis_id": analysis["analysis_id"]}).get_json()["session_id"]
+    rows = []
+    for turn in range(turns):
+        body = json.dumps({"message": QUESTIONS[turn % len(QUESTIONS)]})
+        start = time.perf_counter()
+        response = client.post(f"/chat/sessions/{session_id}/messages", data=body, content_type="application/json", buffered=False)
+        first_token, prompt_tokens = None, None
+        for piece in response.response:
+            piece = piece.decode() if isinstance(piece, bytes) else piece
+            if first_token is None and piece.startswith("event: token"):
+                first_token = time.perf_counter() - start
+            if piece.startswith("event: done"):
+                prompt_tokens = json.loads(piece.split("data: ", 1)[1])["usage"]["prompt_tokens"]
+        response.close()
+        wait_for_scheduler()
+        rows.append((len(body), prompt_tokens, first_token))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--paragraphs", type=int, default=12)
+    parser.add_argument("--criteria", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.15, help="stub seconds before the first token")
+    parser.add_argument("--prefill", type=float, default=0.03, help="stub seconds per 1k prompt tokens before the first token")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="stub seconds per generated chunk")
+    args = parser.parse_args()
+
+    analysis = make_analysis(args.paragraphs, args.criteria)
+    client = app.app.test_client()
+    results = {}
+    for label, run in (("stateless /chat", run_stateless), ("/chat/sessions", run_sessions)):
+        app.client = StubOpenAI(latency=args.latency, prefill_latency_per_1k=args.prefill, token_latency=args.token_latency)
+        results[label] = run(client, analysis, args.turns)
+
+    shown = sorted({1, 5, 10, 20, args.turns} & set(range(1, args.turns + 1)))
+    print(f"{'turn':>4} | {'payload bytes':>27} | {'prompt tokens':>19} | {'first token ms':>19}")
+    print(f"{'':>4} | {'stateless':>13} {'session':>13} | {'stateless':>9} {'session':>9} | {'stateless':>9} {'session':>9}")
+    for turn in shown:
+        (a_bytes, a_tokens, a_ttft), (b_bytes, b_tokens, b_ttft) = (rows[turn - 1] for rows in results.values())
+        print(f"{turn:4d} | {a_bytes:13d} {b_bytes:13d} | {a_tokens:9d} {b_tokens:9d} | {a_ttft * 1000:9.0f} {b_ttft * 1000:9.0f}")
+
+    for label, rows in results.items():
+        print(f"{label}: {sum(row[0] for row in rows)} payload bytes, {sum(row[1] for row in rows)} prompt tokens in total")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+End-to-end benchmark suite, fully offline. It starts the mock OpenAI server (with
+latency, jitter and injected 429s) and grades a synthetic corpus against a
+synthetic rubric. Each combination of target and essay size is one scenario:
+
+- pipeline: process_rubric_and_pipeline + evaluate_rubric, called directly;
+- route: POST /analyze with .txt uploads, through the Flask test client.
+
+Each scenario runs in its own subprocess, so peak RSS is its own, and sends
+`--concurrency` requests at a time. For each it reports p50/p95/p99 request
+latency, throughput, peak RSS, and LLM calls by stage, retries and 429s.
+
+Results are written as JSON (--output). A later run can be compared with a
+saved file (--baseline), or two saved files diffed without running anything:
+
+Run from src/backend:
+    python -m benchmarks.bench_e2e --essays 20 --concurrency 4 --output baseline.json
+    python -m benchmarks.bench_e2e --essays 20 --concurrency 4 --baseline baseline.json
+    python -m benchmarks.bench_e2e --diff old.json new.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.mock_openai_server import start_in_thread
+from benchmarks.synthetic import ESSAY_SIZES, make_corpus, make_rubric_text
+
+TARGETS = ("pipeline", "route")
+
+# Metrics compared between runs, and whether lower is better
+COMPARED = {
+    "latency_p50": True,
+    "latency_p95": True,
+    "latency_p99": True,
+    "essays_per_second": False,
+    "peak_rss_mb": True,
+    "llm_calls": True,
+}
+
+
+def mock_stats():
+    with urllib.request.urlopen(os.environ["OPENAI_BASE_URL"] + "/stats") as response:
+        return json.load(response)
+
+
+def run_scenario(target, size, essays, concurrency, criteria, seed):
+    """Runs one scenario in this process and returns its results."""
+    import app
+
+    texts = make_corpus(essays, size, seed)
+    rubric_text = make_rubric_text(criteria, seed=seed)
+    client = app.app.test_client()
+
+    def analyze(essay_text):
+        if target == "pipeline":
+            with app.llm_scheduler.request_context():
+                meta_result = app.process_rubric_and_pipeline(essay_text, rubric_text)
+                rubric_sections = app.parse_rubric_sections(meta_result["rubric_parsed"])
+                results = app.evaluate_rubric(rubric_sections, meta_result, app.client)
+            return len(results) == len(rubric_sections)
+        response = client.post("/analyze", content_type="multipart/form-data", data={
+            "essay": (io.BytesIO(essay_text.encode("utf-8")), "essay.txt"),
+            "rubric": (io.BytesIO(rubric_text.encode("utf-8")), "rubric.txt"),
+        })
+        body = response.get_json()
+        return response.status_code == 200 and "error" not in body
+
+    def timed(essay_text):
+        start = time.perf_counter()
+        try:
+            ok = analyze(essay_text)
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    # One untimed essay loads the models, so the first measured requests don't pay for it
+    warmup_seconds, _ = timed(make_corpus(1, "small", seed + 10000)[0])
+
+    app.token_usage.reset()
+    retries_before = app.llm_scheduler.stats()["retries"]
+    mock_before = mock_stats()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed, texts))
+    elapsed = time.perf_counter() - start
+    mock_after = mock_stats()
+
+    latencies = np.array([seconds for seconds, _ in outcomes])
+    calls_by_stage = {stage: totals["calls"] for stage, totals in app.token_usage.stats().items()}
+    return {
+        "essays": essays,
+        "failed": sum(1 for _, ok in outcomes if not ok),
+        "seconds": elapsed,
+        "essays_per_second": essays / elapsed,
+        "latency_p50": float(np.percentile(latencies, 50)),
+        "latency_p95": float(np.percentile(latencies, 95)),
+        "latency_p99": float(np.percentile(latencies, 99)),
+        "latency_max": float(latencies.max()),
+        "warmup_seconds": warmup_seconds,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "llm_calls": sum(calls_by_stage.values()),
+        "llm_calls_by_stage": calls_by_stage,
+        "llm_retries": app.llm_scheduler.stats()["retries"] - retries_before,
+        "rate_limited": mock_after["rate_limited"] - mock_before["rate_limited"],
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args):
+    server = start_in_thread(
+        latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit,
+        retry_after=args.retry_after, criteria=args.criteria, seed=args.seed,
+    )
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": server.base_url,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-mock"),
+        "LLM_CACHE_PATH": "",
+        "CHAT_DB_PATH": ":memory:",
+        "MODEL_WARMUP": "lazy",
+        "LLM_MAX_CONCURRENCY": str(args.llm_concurrency),
+    }
+    scenarios = {}
+    try:
+        for target in args.targets:
+            for size in args.sizes:
+                child = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_e2e", "--child", target, size,
+                     "--essays", str(args.essays), "--concurrency", str(args.concurrency),
+                     "--criteria", str(args.criteria), "--seed", str(args.seed)],
+                    env=env, capture_output=True, text=True,
+                )
+                if child.returncode != 0:
+                    raise SystemExit(f"{target}/{size} failed:\n{child.stderr}")
+                result = json.loads(child.stdout.strip().splitlines()[-1])
+                scenarios[f"{target}/{size}"] = result
+                print(f"{target + '/' + size:<16} p50 {result['latency_p50']:7.2f}s  p95 {result['latency_p95']:7.2f}s  "
+                      f"p99 {result['latency_p99']:7.2f}s  {result['essays_per_second']:6.2f} essays/s  "
+                      f"RSS {result['peak_rss_mb']:7.1f} MB  LLM calls {result['llm_calls']:5d}  "
+                      f"429s {result['rate_limited']:3d}  failed {result['failed']}")
+    finally:
+        server.shutdown()
+
+    return {
+        "version": 1,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {key: getattr(args, key) for key in (
+            "essays", "sizes", "targets", "concurrency", "llm_concurrency", "criteria",
+            "latency", "jitter", "rate_limit", "retry_after", "seed",
+        )},
+        "scenarios": scenarios,
+    }
+
+
+def diff(old, new, tolerance):
+    """Prints each compared metric's change per scenario; returns the regressions past `tolerance`."""
+    if old.get("config") != new.get("config"):
+        print("Note: the runs used different configs; changes may not be comparable.")
+    regressions = []
+    print(f"{'scenario':<16} {'metric':<18} {'old':>10} {'new':>10} {'change':>8}")
+    for name in sorted(set(old["scenarios"]) & set(new["scenarios"])):
+        for metric, lower_is_better in COMPARED.items():
+            before, after = old["scenarios"][name][metric], new["scenarios"][name][metric]
+            change = (after - before) / before if before else 0.0
+            worse = change > tolerance if lower_is_better else change < -tolerance
+            if worse:
+                regressions.append((name, metric))
+            print(f"{name:<16} {metric:<18} {before:10.3f} {after:10.3f} {change:+8.1%}{'  worse' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays", type=int, default=20, help="essays per scenario")
+    parser.add_argument("--sizes", nargs="+", choices=list(ESSAY_SIZES), default=list(ESSAY_SIZES))
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight at once")
+    parser.add_argument("--llm-concurrency", type=int, default=16, help="LLM_MAX_CONCURRENCY")
+    parser.add_argument("--criteria", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2, help="mock seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.1, help="mock +/- seconds per completion")
+    parser.add_argument("--rate-limit", type=float, default=0.02, help="fraction of mock calls answered 429")
+    parser.add_argument("--retry-after", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare the results with this earlier JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="relative change reported as worse")
+    parser.add_argument("--diff", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    parser.add_argument("--child", nargs=2, metavar=("TARGET", "SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_scenario(*args.child, args.essays, args.concurrency, args.criteria, args.seed)))
+        return
+
+    if args.diff:
+        with open(args.diff[0]) as old, open(args.diff[1]) as new:
+            regressions = diff(json.load(old), json.load(new), args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+    results = run_suite(args)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = diff(json.load(file), results, args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Simulates a resubmission with one edited paragraph and checks that the encoders
+are run on exactly one paragraph per model (Longformer and MiniLM). Texts are
+counted where they reach the encoders, not as cache misses, so a mode that
+bypasses the cache (LONGFORMER_ENCODE_MODE=essay) shows up as a failure.
+
+Run from src/backend:
+    python -m benchmarks.bench_embedding_cache --paragraphs 12
+"""
+
+import argparse
+import sys
+import time
+from collections import Counter
+
+import app
+from benchmarks.synthetic import make_essay
+
+
+encoded = Counter()  # texts that reached each encoder
+
+
+def counting(model, fn):
+    def wrapper(texts, *args, **kwargs):
+        encoded[model] += len(texts)
+        return fn(texts, *args, **kwargs)
+    return wrapper
+
+
+def encode_revision(paragraphs):
+    app.longformer_embed_paragraphs(paragraphs)
+    app.compute_coherence_with_minilm(paragraphs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=12)
+    args = parser.parse_args()
+
+    app.encode_longformer_batches = counting("longformer", app.encode_longformer_batches)
+    app.longformer_embed_essay = counting("longformer", app.longformer_embed_essay)
+    app.minilm_encode = counting("minilm", app.minilm_encode)
+
+    draft = make_essay(args.paragraphs, seed=42)
+    revision = list(draft)
+    revision[len(revision) // 2] += " The author adds one new sentence in this draft."
+
+    start = time.perf_counter()
+    encode_revision(draft)
+    first = time.perf_counter() - start
+    before = Counter(encoded)
+
+    start = time.perf_counter()
+    encode_revision(revision)
+    second = time.perf_counter() - start
+
+    print(f"first draft: {first:.2f}s  revision: {second:.2f}s")
+    ok = True
+    for model in ("longformer", "minilm"):
+        count = encoded[model] - before[model]
+        print(f"{model}: {count} paragraph(s) re-encoded for the revision")
+        ok = ok and count == 1
+    print(app.embedding_cache.stats())
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
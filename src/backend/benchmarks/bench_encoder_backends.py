@@ -0,0 +1,119 @@
+"""
+Compares encoder inference backends (torch fp32, int8, onnx) on a synthetic corpus:
+paragraphs/sec for Longformer and MiniLM, plus an accuracy check against fp32.
+The check covers the per-paragraph cosine similarity of Longformer embeddings and
+the absolute difference of compute_coherence_with_minilm scores. Each backend runs
+in its own interpreter, so thread settings and model loading do not interfere.
+
+Run from src/backend:
+    python -m benchmarks.bench_encoder_backends --backends torch int8 onnx --threads 4
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_essays
+
+
+def child(output_path, essays, paragraphs, seed):
+    import app
+
+    corpus = make_essays(essays, paragraphs, paragraphs, seed=seed)
+    app.get_longformer()
+    app.get_minilm()
+
+    start = time.perf_counter()
+    embeddings = [app.longformer_embed_paragraphs(essay, use_cache=False) for essay in corpus]
+    longformer_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for essay in corpus:
+        app.get_minilm().encode(essay)
+    minilm_seconds = time.perf_counter() - start
+
+    coherence = [app.compute_coherence_with_minilm(essay)[1] for essay in corpus]
+    np.savez(
+        output_path,
+        embeddings=np.vstack(embeddings),
+        coherence=np.asarray([score for scores in coherence for score in scores], dtype=np.float32),
+        longformer_seconds=longformer_seconds,
+        minilm_seconds=minilm_seconds,
+    )
+
+
+def run_backend(backend, args, backend_dir, output_path):
+    env = {
+        **os.environ,
+        "ENCODER_BACKEND": backend,
+        "LONGFORMER_BACKEND": "torch" if backend == "onnx" else backend,
+        "MINILM_BACKEND": backend,
+        "MODEL_WARMUP": "lazy",
+        "EMBEDDING_CACHE_SIZE": "0",
+        "EMBEDDING_CACHE_DIR": "",
+        "SHARED_WEIGHTS_DIR": "",  # not allowed with int8
+    }
+    if args.threads:
+        env["ENCODER_INTRA_OP_THREADS"] = str(args.threads)
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_encoder_backends", "--child", output_path,
+         "--essays", str(args.essays), "--paragraphs", str(args.paragraphs)],
+        cwd=backend_dir, env=env, check=True, stdout=subprocess.DEVNULL,
+    )
+    return np.load(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "int8", "onnx"])
+    parser.add_argument("--essays", type=int, default=10)
+    parser.add_argument("--paragraphs", type=int, default=6)
+    parser.add_argument("--threads", type=int, default=0, help="ENCODER_INTRA_OP_THREADS for every backend")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="lowest acceptable embedding cosine vs fp32")
+    parser.add_argument("--max-coherence-diff", type=float, default=0.02, help="largest acceptable coherence score change")
+    parser.add_argument("--child", metavar="OUTPUT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.essays, args.paragraphs, seed=0)
+        return
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paragraph_count = args.essays * args.paragraphs
+    backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+    ok = True
+    with tempfile.TemporaryDirectory() as directory:
+        results = {}
+        for backend in backends:
+            try:
+                results[backend] = run_backend(backend, args, backend_dir, os.path.join(directory, f"{backend}.npz"))
+            except subprocess.CalledProcessError:
+                print(f"{backend}: failed to run (is its runtime installed?)")
+                ok = False
+
+        reference = results.get("torch")
+        print(f"{'backend':8} {'longformer para/s':>18} {'minilm para/s':>14} {'min cosine':>11} {'max coh diff':>13}")
+        for backend, result in results.items():
+            longformer_rate = paragraph_count / float(result["longformer_seconds"])
+            minilm_rate = paragraph_count / float(result["minilm_seconds"])
+            min_cosine = max_diff = float("nan")
+            if reference is not None:
+                a, b = result["embeddings"], reference["embeddings"]
+                cosines = (a * b).sum(axis=1) / np.maximum(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12)
+                min_cosine = float(cosines.min())
+                max_diff = float(np.abs(result["coherence"] - reference["coherence"]).max()) if len(reference["coherence"]) else 0.0
+                if min_cosine < args.min_cosine or max_diff > args.max_coherence_diff:
+                    ok = False
+            print(f"{backend:8} {longformer_rate:18.1f} {minilm_rate:14.1f} {min_cosine:11.4f} {max_diff:13.4f}")
+
+    print("accuracy within tolerance" if ok else "accuracy check FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
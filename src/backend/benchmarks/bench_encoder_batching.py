@@ -0,0 +1,77 @@
+"""
+Encoder micro-batching under concurrency. For each concurrency level, the same
+essays are encoded (Longformer paragraph embeddings and MiniLM embeddings, as the
+pipeline does, caches bypassed) from that many threads at once. This runs once with
+ENCODER_BATCHING off, where every thread runs its own forward passes, and once with
+it on, where the batchers merge them. It reports essays per second, p50/p95/p99
+latency per essay, and the mean batch the batchers formed.
+
+Run from src/backend:
+    python -m benchmarks.bench_encoder_batching --essays 32 --concurrency 1 2 4 8 16 32 64
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+os.environ.setdefault("MODEL_WARMUP", "lazy")
+
+import app
+from benchmarks.synthetic import make_essays
+
+
+def encode_essay(paragraphs):
+    start = time.perf_counter()
+    app.longformer_embed_paragraphs(paragraphs, use_cache=False)
+    app.minilm_encode(paragraphs)
+    return time.perf_counter() - start
+
+
+def run(essays, concurrency, batching):
+    app.ENCODER_BATCHING = batching
+    before = {name: batcher.stats() for name, batcher in (("longformer", app.longformer_batcher), ("minilm", app.minilm_batcher))}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = np.array(list(executor.map(encode_essay, essays)))
+    elapsed = time.perf_counter() - start
+
+    batches = {}
+    for name, batcher in (("longformer", app.longformer_batcher), ("minilm", app.minilm_batcher)):
+        after = batcher.stats()
+        count = after["batches"] - before[name]["batches"]
+        batches[name] = (after["encoded_texts"] - before[name]["encoded_texts"]) / count if count else 0.0
+    return {
+        "essays_per_second": len(essays) / elapsed,
+        "p50": float(np.percentile(latencies, 50)),
+        "p95": float(np.percentile(latencies, 95)),
+        "p99": float(np.percentile(latencies, 99)),
+        "batch_texts": batches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays", type=int, default=32)
+    parser.add_argument("--paragraphs", type=int, default=8, help="max paragraphs per essay")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    essays = make_essays(args.essays, min_paragraphs=max(1, args.paragraphs // 2), max_paragraphs=args.paragraphs)
+    run(essays[:2], 1, batching=False)  # loads the models
+    run(essays[:2], 2, batching=True)  # starts the batcher threads
+
+    print(f"batch limits: {app.ENCODER_BATCH_MAX_SIZE} texts, {app.ENCODER_BATCH_MAX_WAIT_MS} ms wait")
+    print(f"{'concurrency':>11} {'batching':>8} {'essays/s':>9} {'p50':>8} {'p95':>8} {'p99':>8}  mean batch (Longformer / MiniLM texts)")
+    for concurrency in args.concurrency:
+        for batching in (False, True):
+            result = run(essays, concurrency, batching)
+            batch = f"{result['batch_texts']['longformer']:6.1f} / {result['batch_texts']['minilm']:6.1f}" if batching else ""
+            print(f"{concurrency:11d} {'on' if batching else 'off':>8} {result['essays_per_second']:9.2f} "
+                  f"{result['p50']:7.3f}s {result['p95']:7.3f}s {result['p99']:7.3f}s  {batch}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Counts LLM calls and prompt tokens per essay for each evaluation mode, using a
+stubbed OpenAI client (no network, no encoder models needed for the counts).
+
+Run from src/backend:
+    python -m benchmarks.bench_evaluation --paragraphs 10 --criteria 6
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("PARAGRAPH_REUSE", "0")  # the same paragraphs are graded in every mode
+
+import app
+from benchmarks.stub_openai import StubOpenAI, make_rubric
+from benchmarks.synthetic import make_essay
+
+
+def make_meta_result(paragraphs):
+    """A meta_result shaped like process_rubric_and_pipeline's output."""
+    return {
+        "paragraphs": paragraphs,
+        "gpt_summary": "The essay explores how memory and language shape identity.",
+        "structured_summary": {
+            "dominant_features": [f"Paragraph {i + 1} focuses on feature {i % 5}" for i in range(len(paragraphs))],
+            "coherence_issues": ["" for _ in range(len(paragraphs) - 1)],
+            "logical_flow": "Average coherence (MiniLM-based): 0.62",
+        },
+    }
+
+
+def run(mode, meta_result, rubric_sections, latency, group_budget):
+    stub = StubOpenAI(latency=latency)
+    app.EVALUATION_GROUP_TOKEN_BUDGET = group_budget
+    start = time.perf_counter()
+    results = app.evaluate_rubric(rubric_sections, meta_result, stub, mode)
+    elapsed = time.perf_counter() - start
+    return stub.call_count(), stub.prompt_tokens(), elapsed, len(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=10)
+    parser.add_argument("--criteria", type=int, default=6)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per LLM call")
+    parser.add_argument("--group-budget", type=int, default=600, help="paragraph tokens per grouped call")
+    args = parser.parse_args()
+
+    meta_result = make_meta_result(make_essay(args.paragraphs, seed=7))
+    rubric_sections = make_rubric(args.criteria)["Criteria"]
+
+    runs = [
+        ("per_criterion", "per_criterion", 0),
+        ("multi_criterion", "multi_criterion", 0),
+        (f"multi_criterion (group {args.group_budget} tok)", "multi_criterion", args.group_budget),
+    ]
+    for label, mode, budget in runs:
+        calls, tokens, elapsed, criteria = run(mode, meta_result, rubric_sections, args.latency, budget)
+        print(f"{label:>34}: {calls:4d} calls  {tokens:7d} prompt tokens  {elapsed:6.2f}s  ({criteria} criteria)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Replays a class uploading the same rubric many times against a stubbed OpenAI
+client and reports how many LLM calls the response cache saves.
+
+Run from src/backend:
+    python -m benchmarks.bench_llm_cache --submissions 30
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+import app
+from benchmarks.stub_openai import StubOpenAI
+from benchmarks.synthetic import make_essays
+from llm_cache import ResponseCache
+
+RUBRIC_TEXT = "Focus: 4 clear / 1 unclear\nEvidence: 4 strong / 1 missing\nOrganization: 4 logical / 1 random"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--submissions", type=int, default=30)
+    args = parser.parse_args()
+
+    app.client = StubOpenAI()
+    app.llm_cache = ResponseCache(os.path.join(tempfile.mkdtemp(), "llm_cache.sqlite3"))
+
+    essays = ["\n\n".join(essay) for essay in make_essays(args.submissions)]
+    for essay_text in essays:
+        app.extract_rubric_from_text(RUBRIC_TEXT)
+        app.split_paragraphs_gpt(essay_text)
+        app.extract_essay_theme_gpt(essay_text)
+    # A resubmission of the first essay is fully served from the cache
+    app.split_paragraphs_gpt(essays[0])
+    app.extract_essay_theme_gpt(essays[0])
+    # Opting out always reaches the client
+    app.extract_rubric_from_text(RUBRIC_TEXT, use_cache=False)
+
+    rubric_calls = app.client.call_count("gpt-4o-mini")
+    print(f"{args.submissions} submissions: {app.client.call_count()} LLM calls "
+          f"(uncached: {3 * args.submissions + 3}), rubric parses: {rubric_calls}")
+    print(app.llm_cache.stats())
+    sys.exit(0 if rubric_calls == 2 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Compares Longformer paragraph-encoding throughput and per-essay latency across
+encode modes, including the single-pass whole-essay mode.
+
+Run from src/backend:
+    python -m benchmarks.bench_longformer --essays 5 --paragraphs 12
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import app
+from benchmarks.synthetic import make_essays
+
+MODES = ["paragraph", "batched", "bucketed", "essay"]
+
+
+def normalize_rows(matrix):
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays", type=int, default=5)
+    parser.add_argument("--paragraphs", type=int, default=12, help="max paragraphs per essay")
+    parser.add_argument("--repeats", type=int, default=1)
+    args = parser.parse_args()
+
+    essays = make_essays(args.essays, min_paragraphs=max(1, args.paragraphs // 2), max_paragraphs=args.paragraphs)
+    total_paragraphs = sum(len(essay) for essay in essays)
+
+    reference = None
+    for mode in MODES:
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            embeddings = [app.longformer_embed_paragraphs(essay, mode=mode, use_cache=False) for essay in essays]
+        elapsed = time.perf_counter() - start
+
+        # Masked pooling makes the paragraph/batched/bucketed modes agree up to float noise;
+        # essay mode adds cross-paragraph context, so it is expected to drift further
+        stacked = np.vstack(embeddings)
+        reference = stacked if reference is None else reference
+        cosine = np.sum(normalize_rows(stacked) * normalize_rows(reference), axis=1).mean()
+
+        rate = total_paragraphs * args.repeats / elapsed
+        latency_ms = 1000 * elapsed / (len(essays) * args.repeats)
+        print(f"{mode:>10}: {elapsed:8.2f}s  {rate:7.2f} paragraphs/s  {latency_ms:8.1f} ms/essay  "
+              f"mean cosine vs paragraph mode: {cosine:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Paragraph reuse on a synthetic class set. The essays share a boilerplate intro (with the
+student's name changed), a quoted passage, and some are resubmitted unchanged; the
+rest of each essay is its own. The set is graded essay by essay with paragraph reuse
+off and on (stubbed LLM), comparing paragraph LLM calls, the index hit rate and wall
+time. It also times one essay's lookup against a full index.
+
+Run from src/backend:
+    python -m benchmarks.bench_paragraph_reuse --essays 30 --criteria 4
+"""
+
+import argparse
+import os
+import random
+import time
+
+import numpy as np
+
+os.environ.setdefault("LLM_CACHE_PATH", "")
+os.environ.setdefault("CHAT_DB_PATH", ":memory:")
+os.environ.setdefault("MODEL_WARMUP", "lazy")
+
+import app
+from benchmarks.stub_openai import StubOpenAI, default_responder
+from benchmarks.synthetic import make_essay, make_paragraph, make_rubric_text
+from paragraph_reuse import ParagraphReuse
+
+NAMES = ["Avery", "Jordan", "Riley", "Morgan", "Casey", "Quinn", "Rowan", "Emerson"]
+
+
+def make_class_set(count, resubmitted, seed=0):
+    rng = random.Random(seed)
+    intro = make_paragraph(random.Random(seed + 1))
+    passage = '"' + make_paragraph(random.Random(seed + 2), 4, 4) + '"'
+    essays = []
+    for i in range(count - resubmitted):
+        own = make_essay(rng.randint(3, 6), seed=seed + 100 + i)
+        essays.append([f"My name is {rng.choice(NAMES)}. {intro}", passage] + own)
+    essays += [list(rng.choice(essays)) for _ in range(resubmitted)]
+    rng.shuffle(essays)
+    return ["\n\n".join(essay) for essay in essays]
+
+
+def grade_set(essays, rubric_text, criteria, mode, latency, reuse):
+    app.PARAGRAPH_REUSE = reuse
+    app.paragraph_reuse = ParagraphReuse(app.paragraph_reuse.threshold, app.paragraph_reuse.max_entries, app.paragraph_reuse.max_indexes)
+    app.client = StubOpenAI(lambda messages, model: default_responder(messages, model, criteria), latency=latency)
+    app.token_usage.reset()
+    start = time.perf_counter()
+    for essay_text in essays:
+        app.run_analysis(essay_text, rubric_text, mode)
+    elapsed = time.perf_counter() - start
+    stats = app.token_usage.stats()
+    calls = sum(stats.get(stage, {}).get("calls", 0) for stage in ("paragraph", "multi_criterion"))
+    return calls, elapsed, app.paragraph_reuse.stats()
+
+
+def time_lookup(entries, dim=384, paragraphs=12):
+    """Milliseconds for one essay's lookup against an index of `entries` paragraphs."""
+    reuse = ParagraphReuse(max_entries=entries)
+    rng = np.random.default_rng(0)
+    for vector in rng.standard_normal((entries, dim)).astype(np.float32):
+        reuse.add("criterion", vector, {"score": 1})
+    queries = rng.standard_normal((paragraphs, dim)).astype(np.float32)
+    start = time.perf_counter()
+    for _ in range(100):
+        reuse.lookup("criterion", queries, list(range(paragraphs)))
+    return (time.perf_counter() - start) * 10
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays", type=int, default=30)
+    parser.add_argument("--resubmitted", type=int, default=3)
+    parser.add_argument("--criteria", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.01, help="stub seconds per LLM call")
+    args = parser.parse_args()
+
+    essays = make_class_set(args.essays, args.resubmitted)
+    rubric_text = make_rubric_text(args.criteria)
+    print(f"{args.essays} essays ({args.resubmitted} resubmitted), {args.criteria} criteria, "
+          f"threshold {app.paragraph_reuse.threshold}")
+    for mode in ("per_criterion", "multi_criterion"):
+        off_calls, off_seconds, _ = grade_set(essays, rubric_text, args.criteria, mode, args.latency, reuse=False)
+        on_calls, on_seconds, stats = grade_set(essays, rubric_text, args.criteria, mode, args.latency, reuse=True)
+        print(f"{mode:<16} paragraph LLM calls {off_calls:5d} -> {on_calls:5d} ({on_calls / off_calls:.0%})   "
+              f"{off_seconds:6.2f}s -> {on_seconds:6.2f}s   hit rate {stats['hit_rate']:.0%}   index entries {stats['entries']}")
+
+    for entries in (1000, 5000, 20000):
+        print(f"lookup, 12 paragraphs vs {entries:6d} indexed: {time_lookup(entries):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
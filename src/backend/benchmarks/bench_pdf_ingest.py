@@ -0,0 +1,103 @@
+"""
+Upload conversion benchmark: time to text for 1-, 20- and 100-page PDFs with serial
+and parallel page extraction. It also checks that uploads over the byte and page
+limits are rejected while they are read. PDFs are generated here from synthetic essay
+text, so no sample files or PDF-writing library are needed.
+
+Run from src/backend:
+    python -m benchmarks.bench_pdf_ingest --pages 1 20 100 --workers 4
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+from benchmarks.synthetic import make_essay
+from documents import DocumentConverter, UploadRejected
+
+
+def make_pdf(page_texts, lines_per_page=40, chars_per_line=90):
+    """A minimal PDF with one Helvetica text page per entry of `page_texts` (text is wrapped and clipped)."""
+
+    def escape(line):
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in page_texts:
+        lines, line = [], ""
+        for word in text.split():
+            if len(line) + len(word) + 1 > chars_per_line:
+                lines.append(line)
+                line = ""
+            line = f"{line} {word}".strip()
+        lines = (lines + [line])[:lines_per_page]
+        stream = "BT /F1 10 Tf 12 TL 50 780 Td " + " ".join(f"({escape(l)}) '" for l in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def time_convert(converter, data, repeats):
+    best, text = float("inf"), ""
+    for _ in range(repeats):
+        start = time.perf_counter()
+        text = converter.convert_stream("essay.pdf", io.BytesIO(data))
+        best = min(best, time.perf_counter() - start)
+    return best, text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 20, 100])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    serial = DocumentConverter(max_pages=0, workers=1)
+    parallel = DocumentConverter(max_pages=0, parallel_min_pages=2, workers=args.workers)
+    parallel.convert("warmup.pdf", make_pdf(["warm up"] * 4))  # start the pool outside the timings
+
+    ok = True
+    print(f"{'pages':>6} {'size KB':>8} {'serial ms':>10} {f'parallel x{args.workers} ms':>18} {'speedup':>8}")
+    for pages in args.pages:
+        data = make_pdf([" ".join(make_essay(4, seed=page)) for page in range(pages)])
+        serial_seconds, serial_text = time_convert(serial, data, args.repeats)
+        parallel_seconds, parallel_text = time_convert(parallel, data, args.repeats)
+        if parallel_text != serial_text or serial_text.count("\n\n") != pages - 1:
+            print(f"{pages}-page PDF: parallel text differs from serial")
+            ok = False
+        print(f"{pages:6d} {len(data) / 1024:8.1f} {serial_seconds * 1000:10.1f} "
+              f"{parallel_seconds * 1000:18.1f} {serial_seconds / parallel_seconds:7.2f}x")
+
+    limited = DocumentConverter(max_bytes=64 * 1024, max_pages=50, workers=1)
+    for label, data in (("byte limit", b"x" * (65 * 1024)), ("page limit", make_pdf(["page"] * 51))):
+        try:
+            limited.convert_stream("essay.pdf" if label == "page limit" else "essay.txt", io.BytesIO(data))
+            print(f"{label}: not enforced")
+            ok = False
+        except UploadRejected as e:
+            print(f"{label}: rejected ({e})")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
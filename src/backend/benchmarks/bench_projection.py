@@ -0,0 +1,66 @@
+"""
+Per-request cost and label stability of the summary's dimensionality reduction:
+a per-essay PCA fit versus projecting onto a fixed, offline-fitted basis. The
+stability test reads the same paragraphs inside two different essays and
+reports how often they get the same "dominant feature".
+
+Uses random low-rank vectors shaped like Longformer-large paragraph vectors, so
+no model is needed. Run from src/backend:
+    python -m benchmarks.bench_projection --dim 1024 --repeats 200
+"""
+
+import argparse
+import time
+
+import numpy as np
+from sklearn.decomposition import PCA
+
+from projection import fit_basis
+
+
+def make_vectors(rng, count, mixing, noise=0.1):
+    latent = rng.normal(size=(count, mixing.shape[0]))
+    return latent @ mixing + noise * rng.normal(size=(count, mixing.shape[1]))
+
+
+def per_essay_pca(vectors, components=5):
+    return PCA(n_components=min(components, *vectors.shape)).fit_transform(vectors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    mixing = rng.normal(size=(16, args.dim))
+    basis = fit_basis(make_vectors(rng, 5000, mixing), 5)
+
+    print(f"{'paragraphs':>10} {'PCA fit ms':>11} {'basis ms':>9} {'speedup':>8}")
+    for count in (3, 5, 8, 12, 20):
+        essays = [make_vectors(rng, count, mixing) for _ in range(args.repeats)]
+        start = time.perf_counter()
+        for vectors in essays:
+            per_essay_pca(vectors)
+        pca_ms = (time.perf_counter() - start) * 1000 / args.repeats
+        start = time.perf_counter()
+        for vectors in essays:
+            basis.project(vectors)
+        basis_ms = (time.perf_counter() - start) * 1000 / args.repeats
+        print(f"{count:10d} {pca_ms:11.3f} {basis_ms:9.3f} {pca_ms / basis_ms:7.0f}x")
+
+    # The same 4 paragraphs placed in two essays with different other paragraphs
+    same_pca = same_basis = total = 0
+    for _ in range(args.repeats):
+        shared = make_vectors(rng, 4, mixing)
+        first = np.vstack([shared, make_vectors(rng, 4, mixing)])
+        second = np.vstack([shared, make_vectors(rng, 6, mixing)])
+        same_pca += int((per_essay_pca(first)[:4].argmax(axis=1) == per_essay_pca(second)[:4].argmax(axis=1)).sum())
+        same_basis += int((basis.project(first)[:4].argmax(axis=1) == basis.project(second)[:4].argmax(axis=1)).sum())
+        total += 4
+    print(f"same dominant feature across essays: per-essay PCA {same_pca / total:.0%}, fixed basis {same_basis / total:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Prompt token check on a sample essay. For each evaluation stage it reports:
+
+- the prompt tokens per call and in total, counted locally;
+- the shared prefix, i.e. the leading tokens that are identical across the calls a
+  provider could serve from its prompt cache (paragraph calls of one criterion,
+  summaries of one essay);
+- the token usage per stage as recorded by the app.
+
+It also compares the compacted paragraph-feedback block of the final summary with
+the indented JSON it replaces, and shows what an over-budget prompt leaves out.
+
+Run from src/backend:
+    python -m benchmarks.bench_prompts --paragraphs 12 --criteria 5
+"""
+
+import argparse
+import json
+import os
+from collections import defaultdict
+
+os.environ.setdefault("LLM_CACHE_PATH", "")
+os.environ.setdefault("MODEL_WARMUP", "lazy")
+os.environ.setdefault("PARAGRAPH_REUSE", "0")  # the same paragraphs are graded repeatedly
+
+import app
+from benchmarks.bench_evaluation import make_meta_result
+from benchmarks.stub_openai import StubOpenAI, make_rubric
+from benchmarks.synthetic import make_essay
+from prompts import count_tokens
+
+
+class RecordingStub(StubOpenAI):
+    def __init__(self):
+        super().__init__()
+        self.prompts = []
+
+    def _create(self, model, messages, **params):
+        self.prompts.append((model, "".join(message["content"] for message in messages)))
+        return super()._create(model, messages, **params)
+
+
+def shared_prefix_tokens(texts, model):
+    return count_tokens(os.path.commonprefix(texts), model) if len(texts) > 1 else 0
+
+
+def stage_of(prompt):
+    if "paragraph-by-paragraph evaluations" in prompt:
+        return "summary"
+    if "### Paragraphs to Evaluate" in prompt:
+        return "multi_criterion"
+    return "paragraph"
+
+
+def report(mode, meta_result, sections):
+    stub = RecordingStub()
+    app.token_usage.reset()
+    results = app.evaluate_rubric(sections, meta_result, stub, mode)
+
+    groups = defaultdict(list)
+    for model, prompt in stub.prompts:
+        stage = stage_of(prompt)
+        # Paragraph calls can only share a prefix with calls for the same criterion
+        criterion = next((s["Name"] for s in sections if f"Criterion:\n{s['Name']} " in prompt), "") if stage == "paragraph" else ""
+        groups[(stage, criterion)].append((model, prompt))
+
+    print(f"\n{mode}:")
+    by_stage = defaultdict(lambda: {"calls": 0, "tokens": 0, "prefix": []})
+    for (stage, _), calls in groups.items():
+        model = calls[0][0]
+        totals = by_stage[stage]
+        totals["calls"] += len(calls)
+        totals["tokens"] += sum(count_tokens(prompt, model) for _, prompt in calls)
+        totals["prefix"].append(shared_prefix_tokens([prompt for _, prompt in calls], model))
+    for stage, totals in by_stage.items():
+        print(f"  {stage:16} {totals['calls']:4d} calls  {totals['tokens']:7d} prompt tokens  "
+              f"{totals['tokens'] // totals['calls']:5d} per call  shared prefix {min(totals['prefix'])}-{max(totals['prefix'])} tokens")
+    print(f"  recorded usage: {json.dumps(app.token_usage.stats())}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=12)
+    parser.add_argument("--criteria", type=int, default=5)
+    args = parser.parse_args()
+
+    meta_result = make_meta_result(make_essay(args.paragraphs, seed=7))
+    sections = make_rubric(args.criteria)["Criteria"]
+
+    results = report("per_criterion", meta_result, sections)
+    report("multi_criterion", meta_result, sections)
+
+    # The summary's paragraph feedback: indented JSON (before) vs compact lines (now)
+    compiled = app.compile_criterion(sections[0])
+    feedback = [app.evaluate_paragraph(compiled, meta_result, idx, StubOpenAI()) for idx in range(args.paragraphs)]
+    legacy = count_tokens(json.dumps(feedback, indent=2), "gpt-4")
+    compact = count_tokens("\n".join(line + suggestions for _, line, suggestions in app.compact_paragraph_feedback(feedback)), "gpt-4")
+    print(f"\nsummary feedback block: {legacy} tokens as indented JSON, {compact} compacted ({1 - compact / legacy:.0%} fewer)")
+
+    # An over-budget summary prompt loses its lowest-value context first
+    app.PROMPT_TOKEN_BUDGETS = {"gpt-4": 1200}
+    params = app.criterion_summary_request(compiled, meta_result, feedback)
+    print(f"summary under a 1200-token gpt-4 budget: {app.count_message_tokens(params['messages'], 'gpt-4')} prompt tokens")
+    print(f"criteria graded: {len(results)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Incremental re-grading check: grades a synthetic essay, then resubmits edited
+drafts with previous_analysis_id. Each resubmission is run once and compared with
+a full run, by LLM calls per stage and wall time (stubbed LLM with fixed latency).
+The edits are one changed sentence, one inserted paragraph and one deleted
+paragraph.
+
+The LLM response cache is on (in a temporary file), as in production, so the
+unchanged rubric is not parsed again.
+
+Feedback is only reused for paragraphs whose prompt is unchanged, dominant
+features included. Run with the offline projection basis (PROJECTION_BASIS_PATH)
+for savings representative of production; with the per-essay PCA fallback the
+features shift with each edit and most paragraphs are graded again.
+
+Run from src/backend:
+    python -m benchmarks.bench_revisions --paragraphs 12 --criteria 4
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("LLM_CACHE_PATH", os.path.join(tempfile.mkdtemp(), "llm_cache.sqlite3"))
+os.environ.setdefault("CHAT_DB_PATH", ":memory:")
+os.environ.setdefault("MODEL_WARMUP", "lazy")
+os.environ.setdefault("PARAGRAPH_REUSE", "0")  # the same paragraphs are graded repeatedly
+
+import app
+from benchmarks.stub_openai import StubOpenAI, default_responder
+from benchmarks.synthetic import make_essay, make_paragraph, make_rubric_text
+
+
+def edit_sentence(paragraphs, idx):
+    edited = list(paragraphs)
+    edited[idx] = edited[idx].rstrip(".") + ", which the final section returns to."
+    return edited
+
+
+def insert_paragraph(paragraphs, idx):
+    return paragraphs[:idx] + [make_paragraph(random.Random(99))] + paragraphs[idx:]
+
+
+def delete_paragraph(paragraphs, idx):
+    return paragraphs[:idx] + paragraphs[idx + 1:]
+
+
+def grade(paragraphs, rubric_text, criteria, mode, latency, previous_analysis_id=None):
+    app.client = StubOpenAI(lambda messages, model: default_responder(messages, model, criteria), latency=latency)
+    app.token_usage.reset()
+    start = time.perf_counter()
+    response = app.run_analysis("\n\n".join(paragraphs), rubric_text, mode, previous_analysis_id=previous_analysis_id)
+    elapsed = time.perf_counter() - start
+    calls = {stage: totals["calls"] for stage, totals in app.token_usage.stats().items() if totals["calls"]}
+    return response, sum(calls.values()), calls, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=12)
+    parser.add_argument("--criteria", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.02, help="stub seconds per LLM call")
+    args = parser.parse_args()
+
+    draft = make_essay(args.paragraphs, seed=5)
+    rubric_text = make_rubric_text(args.criteria)
+    middle = args.paragraphs // 2
+    edits = {
+        "one sentence changed": edit_sentence(draft, middle),
+        "paragraph inserted": insert_paragraph(draft, middle),
+        "paragraph deleted": delete_paragraph(draft, middle),
+    }
+
+    for mode in ("per_criterion", "multi_criterion"):
+        first, _, _, _ = grade(draft, rubric_text, args.criteria, mode, args.latency)
+        print(f"\n{mode}: {args.paragraphs} paragraphs x {args.criteria} criteria")
+        for name, revised in edits.items():
+            _, full_calls, full_stages, full_seconds = grade(revised, rubric_text, args.criteria, mode, args.latency)
+            response, calls, stages, seconds = grade(revised, rubric_text, args.criteria, mode, args.latency, first["analysis_id"])
+            all_graded = len(response["results"]) == args.criteria
+            print(f"  {name:<22} full {full_calls:3d} calls {full_seconds:6.2f}s   incremental {calls:3d} calls "
+                  f"{seconds:6.2f}s ({calls / full_calls:.0%} of the calls)   all criteria graded: {all_graded}")
+            print(f"  {'':<22} full {full_stages}")
+            print(f"  {'':<22} incremental {stages}  re-graded paragraphs {response['revision']['reevaluated']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Rubric library check: stores a synthetic rubric once with POST /rubrics, then grades
+the same essays through POST /analyze twice, once with the rubric file uploaded each
+time and once with its rubric_id. It compares LLM calls per essay by stage and wall
+time per essay. The LLM is stubbed with a fixed latency, and the response cache is off,
+so every upload pays for its rubric parse, as it would for a rubric it has not seen.
+
+Run from src/backend:
+    python -m benchmarks.bench_rubric_library --essays 5 --criteria 4
+"""
+
+import argparse
+import io
+import os
+import tempfile
+import time
+
+os.environ.setdefault("LLM_CACHE_PATH", "")
+os.environ.setdefault("CHAT_DB_PATH", ":memory:")
+os.environ.setdefault("RUBRICS_DB_PATH", os.path.join(tempfile.mkdtemp(), "rubrics.sqlite3"))
+os.environ.setdefault("MODEL_WARMUP", "lazy")
+os.environ.setdefault("PARAGRAPH_REUSE", "0")  # the same paragraphs are graded repeatedly
+
+import app
+from benchmarks.stub_openai import StubOpenAI, default_responder
+from benchmarks.synthetic import make_corpus, make_rubric_text
+
+
+def upload(text, name):
+    return io.BytesIO(text.encode("utf-8")), name
+
+
+def grade_all(client, essays, rubric_fields):
+    """Seconds per essay and LLM calls by stage per essay."""
+    app.token_usage.reset()
+    start = time.perf_counter()
+    for essay_text in essays:
+        response = client.post("/analyze", content_type="multipart/form-data", data={
+            "essay": upload(essay_text, "essay.txt"), **rubric_fields(),
+        })
+        assert response.status_code == 200 and "error" not in response.get_json(), response.get_json()
+    seconds = (time.perf_counter() - start) / len(essays)
+    calls = {stage: totals["calls"] / len(essays) for stage, totals in app.token_usage.stats().items() if totals["calls"]}
+    return seconds, calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays", type=int, default=5)
+    parser.add_argument("--criteria", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub seconds per LLM call")
+    args = parser.parse_args()
+
+    app.client = StubOpenAI(lambda messages, model: default_responder(messages, model, args.criteria), latency=args.latency)
+    client = app.app.test_client()
+    rubric_text = make_rubric_text(args.criteria)
+    essays = make_corpus(args.essays, "small", seed=1)
+
+    start = time.perf_counter()
+    created = client.post("/rubrics", content_type="multipart/form-data", data={
+        "rubric": upload(rubric_text, "rubric.txt"), "name": "Benchmark rubric",
+    }).get_json()
+    print(f"POST /rubrics: {time.perf_counter() - start:.2f}s, rubric {created['rubric_id']} "
+          f"version {created['version']} with {len(created['criteria'])} criteria")
+
+    grade_all(client, essays[:1], lambda: {"rubric_id": created["rubric_id"]})  # loads the models
+    for name, fields in (
+        ("rubric file", lambda: {"rubric": upload(rubric_text, "rubric.txt")}),
+        ("rubric_id", lambda: {"rubric_id": created["rubric_id"]}),
+    ):
+        seconds, calls = grade_all(client, essays, fields)
+        print(f"{name:<12} {seconds:6.2f}s per essay   {sum(calls.values()):5.1f} LLM calls per essay {calls}")
+
+
+if __name__ == "__main__":
+    main()
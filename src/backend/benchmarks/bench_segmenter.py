@@ -0,0 +1,88 @@
+"""
+Compares paragraph boundaries from the local segmenter (and optionally the GPT-4o
+split) against the known paragraphs of synthetic topical essays. Each essay is
+laid out four ways:
+- blank_lines: paragraphs separated by blank lines
+- docx: one paragraph per line
+- pdf: hard-wrapped lines and page breaks, no paragraph breaks
+- unstructured: a single run of text
+
+Boundaries are compared as sentence indices. The script reports precision,
+recall and F1 (exact match, or within one sentence with --tolerance 1), plus
+milliseconds per essay.
+
+Run from src/backend:
+    python -m benchmarks.bench_segmenter --essays 20 [--gpt]
+"""
+
+import argparse
+import statistics
+import textwrap
+import time
+
+import app
+from benchmarks.synthetic import make_topical_essay
+from segmenter import split_sentences
+
+
+def layout(paragraphs, style):
+    if style == "blank_lines":
+        return "\n\n".join(paragraphs)
+    if style == "docx":
+        return "\n".join(paragraphs)
+    if style == "pdf":
+        lines = textwrap.wrap(" ".join(paragraphs), width=80)
+        pages = [lines[i:i + 40] for i in range(0, len(lines), 40)]
+        return "\n\n".join("\n".join(page) for page in pages)
+    return " ".join(paragraphs)
+
+
+def boundaries(paragraphs):
+    """Sentence indices where paragraphs 2..N begin."""
+    points, total = set(), 0
+    for paragraph in paragraphs[:-1]:
+        total += len(split_sentences(paragraph))
+        points.add(total)
+    return points
+
+
+def score(predicted, expected, tolerance):
+    hits = sum(any(abs(p - e) <= tolerance for e in expected) for p in predicted)
+    found = sum(any(abs(p - e) <= tolerance for p in predicted) for e in expected)
+    precision = hits / len(predicted) if predicted else 1.0
+    recall = found / len(expected) if expected else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+
+def report(name, rows):
+    precision, recall, f1, ms = (statistics.mean(column) for column in zip(*rows))
+    print(f"{name:24} P {precision:.2f}  R {recall:.2f}  F1 {f1:.2f}  {ms:8.1f} ms/essay")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays", type=int, default=20)
+    parser.add_argument("--tolerance", type=int, default=0, help="sentences a boundary may be off by")
+    parser.add_argument("--gpt", action="store_true", help="also run the GPT-4o split (makes API calls)")
+    args = parser.parse_args()
+
+    essays = [make_topical_essay(4 + seed % 5, seed=seed) for seed in range(args.essays)]
+    app.get_minilm()  # keep model loading out of the timings
+
+    for style in ("blank_lines", "docx", "pdf", "unstructured"):
+        methods = {"local": app.split_paragraphs_local}
+        if args.gpt:
+            methods["gpt"] = lambda text: app.split_paragraphs_gpt(text, use_cache=False)
+        for name, split in methods.items():
+            rows = []
+            for paragraphs in essays:
+                start = time.perf_counter()
+                predicted = split(layout(paragraphs, style)) or []
+                elapsed = (time.perf_counter() - start) * 1000
+                rows.append((*score(boundaries(predicted), boundaries(paragraphs), args.tolerance), elapsed))
+            report(f"{style}/{name}", rows)
+
+
+if __name__ == "__main__":
+    main()
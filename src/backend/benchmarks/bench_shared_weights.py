@@ -0,0 +1,94 @@
+"""
+Reports per-worker resident memory with private vs shared (memory-mapped) encoder
+weights. Each worker is a fresh interpreter that imports app, loads both models
+and encodes one paragraph so every weight page has been touched. RSS and PSS are
+then read from /proc/<pid>/smaps_rollup (Linux only). PSS splits each shared page
+between the processes mapping it, so total PSS is the box's real footprint.
+
+Run from src/backend:
+    python -m benchmarks.bench_shared_weights --workers 1 4 8
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.synthetic import make_essay
+
+
+def child():
+    import app
+
+    paragraphs = make_essay(3, seed=1)
+    app.longformer_embed_paragraphs(paragraphs, use_cache=False)
+    app.get_minilm().encode(paragraphs)
+    print("ready", flush=True)
+    sys.stdin.readline()  # stay resident until the parent has measured us
+
+
+def memory_kb(pid):
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0] in ("Rss:", "Pss:"):
+                fields[parts[0][:-1]] = int(parts[1])
+    return fields
+
+
+def run_workers(count, env, backend_dir):
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.bench_shared_weights", "--child"],
+            cwd=backend_dir, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+        )
+        for _ in range(count)
+    ]
+    try:
+        for worker in workers:
+            for line in worker.stdout:
+                if line.strip() == "ready":
+                    break
+            else:
+                raise RuntimeError(f"worker {worker.pid} exited with {worker.wait()}")
+        return [memory_kb(worker.pid) for worker in workers]
+    finally:
+        for worker in workers:
+            worker.stdin.close()
+            worker.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    weights_dir = tempfile.mkdtemp(prefix="shared-weights-")
+    base_env = {**os.environ, "MODEL_WARMUP": "lazy", "EMBEDDING_CACHE_DIR": "", "LLM_CACHE_PATH": ""}
+    base_env.pop("SHARED_WEIGHTS_DIR", None)
+    try:
+        # Export the weights once so the measured runs only map them
+        run_workers(1, {**base_env, "SHARED_WEIGHTS_DIR": weights_dir}, backend_dir)
+
+        print(f"{'mode':8} {'workers':>7} {'RSS/worker MB':>14} {'PSS/worker MB':>14} {'total PSS MB':>13}")
+        for mode, env in (("private", base_env), ("shared", {**base_env, "SHARED_WEIGHTS_DIR": weights_dir})):
+            for count in args.workers:
+                usage = run_workers(count, env, backend_dir)
+                rss = sum(u["Rss"] for u in usage) / 1024
+                pss = sum(u["Pss"] for u in usage) / 1024
+                print(f"{mode:8} {count:7d} {rss / count:14.1f} {pss / count:14.1f} {pss:13.1f}")
+    finally:
+        shutil.rmtree(weights_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
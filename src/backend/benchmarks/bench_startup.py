@@ -0,0 +1,75 @@
+"""
+Measures backend cold start in fresh interpreters: how long `import app` takes,
+when /test (liveness) first answers, and when /ready reports every model loaded.
+
+Run from src/backend:
+    python -m benchmarks.bench_startup --runs 3
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ["torch", "transformers", "sentence_transformers", "sklearn", "pdfplumber", "PyPDF2", "docx"]
+
+
+def child(timeout):
+    start = time.perf_counter()
+    import app
+    imported = time.perf_counter() - start
+    heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    client = app.app.test_client()
+    client.get('/test')
+    live = time.perf_counter() - start
+
+    while client.get('/ready').status_code != 200:
+        if time.perf_counter() - start > timeout:
+            break
+        time.sleep(0.05)
+    ready = time.perf_counter() - start
+
+    print(json.dumps({
+        "import_seconds": imported,
+        "live_seconds": live,
+        "ready_seconds": ready,
+        "heavy_modules_after_import": heavy,
+        "models": app.model_registry.status(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.timeout)
+        return
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_startup", "--child", "--timeout", str(args.timeout)],
+            cwd=backend_dir, env={**os.environ, "MODEL_WARMUP": "background"},
+            capture_output=True, text=True, check=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    for field in ("import_seconds", "live_seconds", "ready_seconds"):
+        values = [run[field] for run in runs]
+        print(f"{field:16} median {statistics.median(values):7.2f}s  min {min(values):7.2f}s  max {max(values):7.2f}s")
+    print("heavy modules imported by `import app`:", runs[-1]["heavy_modules_after_import"] or "none")
+    for name, status in runs[-1]["models"].items():
+        print(f"  {name}: {status['state']}, loaded in {status['load_seconds'] or 0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
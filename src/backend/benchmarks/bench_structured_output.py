@@ -0,0 +1,101 @@
+"""
+Structured-output check with injected faults. The stubbed LLM wraps a share of its
+JSON replies in a markdown fence or prose, cuts some off mid-string (finish_reason
+"length"), and drops the score from others. Essays are graded in both evaluation
+modes. For each stage the check reports how many replies plain json.loads would
+have lost (a paid call wasted, a score: None hole), how many were parsed, extracted
+or repaired, the extra repair calls, and the replies that still failed. Replies
+without a score are never repaired (the repair model cannot know the grade), so
+they always count as failed.
+
+Run from src/backend:
+    python -m benchmarks.bench_structured_output --essays 5 --fault-rate 0.2
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+from collections import Counter
+
+os.environ.setdefault("LLM_CACHE_PATH", "")
+os.environ.setdefault("CHAT_DB_PATH", ":memory:")
+os.environ.setdefault("MODEL_WARMUP", "lazy")
+os.environ.setdefault("PARAGRAPH_REUSE", "0")  # every paragraph gets its own call
+
+import app
+import telemetry
+from benchmarks.bench_evaluation import make_meta_result
+from benchmarks.stub_openai import StubOpenAI, default_responder, make_rubric
+from benchmarks.synthetic import make_essay
+
+FAULTS = ("fence", "prose", "truncated", "no_score")
+
+
+def inject(content, fault):
+    if fault == "fence":
+        return f"```json\n{content}\n```"
+    if fault == "prose":
+        return f"Here is the evaluation you asked for:\n{content}\nLet me know if you need anything else."
+    if fault == "truncated":
+        return content[:int(len(content) * 0.7)], "length"
+    value = json.loads(content)
+    for item in value.get("evaluations", [value]):
+        item.pop("score", None)
+    return json.dumps(value)
+
+
+def faulty_responder(rate, seed, criteria, injected):
+    rng = random.Random(seed)
+
+    def respond(messages, model):
+        content = default_responder(messages, model, criteria)
+        prompt = messages[-1]["content"]
+        if "was meant to be a single JSON object" in prompt or not content.startswith("{") or rng.random() >= rate:
+            return content
+        fault = rng.choice(FAULTS if '"score"' in content else FAULTS[:3])
+        injected[fault] += 1
+        return inject(content, fault)
+    return respond
+
+
+def parse_counts():
+    counts = Counter()
+    for line in telemetry.render_metrics().splitlines():
+        match = re.match(r'llm_structured_outputs_total\{stage="(\w+)",result="(\w+)"\} (\S+)', line)
+        if match:
+            counts[match.group(1), match.group(2)] += float(match.group(3))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays", type=int, default=5)
+    parser.add_argument("--paragraphs", type=int, default=8)
+    parser.add_argument("--criteria", type=int, default=4)
+    parser.add_argument("--fault-rate", type=float, default=0.2)
+    args = parser.parse_args()
+
+    sections = make_rubric(args.criteria)["Criteria"]
+    for mode in ("per_criterion", "multi_criterion"):
+        injected = Counter()
+        stub = StubOpenAI(faulty_responder(args.fault_rate, 0, args.criteria, injected))
+        before = parse_counts()
+        app.token_usage.reset()
+        for seed in range(args.essays):
+            app.evaluate_rubric(sections, make_meta_result(make_essay(args.paragraphs, seed=seed)), stub, mode)
+        counts = parse_counts() - before
+        calls = {stage: totals["calls"] for stage, totals in app.token_usage.stats().items() if totals["calls"]}
+
+        print(f"\n{mode}: {args.essays} essays x {args.paragraphs} paragraphs x {args.criteria} criteria, "
+              f"faults injected {dict(injected)}")
+        for stage in sorted({stage for stage, _ in counts}):
+            results = {result: int(counts[stage, result]) for result in ("ok", "extracted", "repaired", "failed")}
+            lost_before = results["extracted"] + results["repaired"] + results["failed"]
+            print(f"  {stage:<16} {calls.get(stage, 0):4d} calls  {results}  "
+                  f"lost with json.loads: {lost_before}  repair calls: {calls.get(stage + '_repair', 0)}  lost now: {results['failed']}")
+
+
+if __name__ == "__main__":
+    main()
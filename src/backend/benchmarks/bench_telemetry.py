@@ -0,0 +1,85 @@
+"""
+Telemetry overhead check. Grades a sample essay with a stubbed LLM (no latency), so
+nearly all of the time is pipeline bookkeeping. It runs once with logging at WARNING,
+where spans only update metrics, and once at DEBUG, where every span also writes its
+JSON log line. It also times a bare span, then prints the stage and LLM series
+from GET /metrics.
+
+Run from src/backend:
+    python -m benchmarks.bench_telemetry --paragraphs 12 --criteria 5 --repeats 5
+"""
+
+import argparse
+import io
+import logging
+import os
+import time
+
+os.environ.setdefault("LLM_CACHE_PATH", "")
+os.environ.setdefault("CHAT_DB_PATH", ":memory:")
+os.environ.setdefault("MODEL_WARMUP", "lazy")
+os.environ.setdefault("PARAGRAPH_REUSE", "0")  # the same paragraphs are graded repeatedly
+
+import app
+import telemetry
+from benchmarks.bench_evaluation import make_meta_result
+from benchmarks.stub_openai import StubOpenAI, make_rubric
+from benchmarks.synthetic import make_essay
+
+
+def time_grading(level, meta_result, sections, repeats):
+    """Best-of-`repeats` seconds to grade the essay, and the log bytes written, at `level`."""
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    root = logging.getLogger()
+    root.addHandler(handler)
+    previous = root.level
+    root.setLevel(level)
+    try:
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            with app.llm_scheduler.request_context(), telemetry.span("analysis"):
+                app.evaluate_rubric(sections, meta_result, StubOpenAI())
+            best = min(best, time.perf_counter() - start)
+    finally:
+        root.setLevel(previous)
+        root.removeHandler(handler)
+    return best, len(stream.getvalue())
+
+
+def time_span(iterations=100000):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with telemetry.span("bench"):
+            pass
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=12)
+    parser.add_argument("--criteria", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    meta_result = make_meta_result(make_essay(args.paragraphs, seed=3))
+    sections = make_rubric(args.criteria)["Criteria"]
+    app.evaluate_rubric(sections, meta_result, StubOpenAI())  # warm up the scheduler workers
+
+    logging.getLogger().handlers[0].setLevel(logging.CRITICAL)  # keep the DEBUG lines off the console
+    for name, level in (("WARNING", logging.WARNING), ("DEBUG", logging.DEBUG)):
+        seconds, log_bytes = time_grading(level, meta_result, sections, args.repeats)
+        print(f"log level {name:<8} {seconds * 1000:8.1f} ms per essay   {log_bytes:>8} log bytes")
+    print(f"bare span: {time_span() * 1e6:.2f} us")
+
+    app.client = StubOpenAI()
+    metrics = app.app.test_client().get("/metrics").get_data(as_text=True)
+    print("\nGET /metrics (stage and LLM series):")
+    for line in metrics.splitlines():
+        if 'stage="bench"' not in line and line.startswith(("essay_stage_seconds_count", "essay_stage_seconds_sum", "llm_tokens_total", "llm_cost_usd_total")):
+            print(" ", line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Local OpenAI-compatible mock server for offline load tests.
+
+Serves POST /v1/chat/completions with the canned, prompt-shaped replies from
+stub_openai, after a configurable delay. The delay is `latency` plus or minus up
+to `jitter` seconds, drawn uniformly. A `rate_limit` fraction of requests is
+answered with a 429 and a Retry-After header, as the API does when over its
+limits. Rubric prompts are answered with a `criteria`-criterion rubric. Draws
+come from a seeded generator, so a run can be repeated. GET /stats returns the
+call counts. Point the backend at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+Run from src/backend:
+    python -m benchmarks.mock_openai_server --port 8765 --latency 0.5 --jitter 0.2 --rate-limit 0.05
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.stub_openai import default_responder, estimate_tokens, make_completion
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self._send(200, self.server.stats())
+        else:
+            self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        model = body.get("model")
+        delay, rate_limited = self.server.draw()
+        if rate_limited:
+            self.server.count_call(model, rate_limited=True)
+            self._send(429, {"error": {
+                "message": f"Rate limit reached for {model} (mock)",
+                "type": "requests",
+                "code": "rate_limit_exceeded",
+            }}, headers={"Retry-After": f"{self.server.retry_after:g}"})
+            return
+
+        time.sleep(delay)
+        messages = body.get("messages", [])
+        prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+        completion = make_completion(default_responder(messages, model, self.server.criteria), model, prompt_tokens)
+        self.server.count_call(model)
+        self._send(200, completion.model_dump(mode="json"))
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=0.0, jitter=0.0, rate_limit=0.0, retry_after=0.1, criteria=4, seed=0):
+        super().__init__(address, MockOpenAIHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.criteria = criteria
+        self.calls = 0
+        self.rate_limited = 0
+        self.calls_by_model = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """(delay in seconds, whether to answer 429) for the next request."""
+        with self._lock:
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            return delay, self._random.random() < self.rate_limit
+
+    def count_call(self, model=None, rate_limited=False):
+        with self._lock:
+            if rate_limited:
+                self.rate_limited += 1
+            else:
+                self.calls += 1
+                self.calls_by_model[model] += 1
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "rate_limited": self.rate_limited, "calls_by_model": dict(self.calls_by_model)}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_in_thread(port=0, latency=0.0, **options):
+    """Starts a server on a background thread and returns it (call .shutdown() to stop)."""
+    server = MockOpenAIServer(("127.0.0.1", port), latency=latency, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds added to each delay")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After seconds sent with a 429")
+    parser.add_argument("--criteria", type=int, default=4, help="criteria in the parsed-rubric reply")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(
+        ("127.0.0.1", args.port), latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit,
+        retry_after=args.retry_after, criteria=args.criteria, seed=args.seed,
+    )
+    print(f"Mock OpenAI server on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Offline stand-in for the OpenAI client.
+
+StubOpenAI exposes `client.chat.completions.create(...)`, returns real
+ChatCompletion objects with canned content shaped like the prompts in app.py,
+and records every call so benchmarks can count calls and prompt tokens.
+"""
+
+import json
+import re
+import threading
+import time
+import uuid
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+from openai.types.chat.chat_completion_chunk import Choice as ChunkChoice, ChoiceDelta
+from openai.types.completion_usage import CompletionUsage
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def make_completion(content, model, prompt_tokens=0, finish_reason="stop"):
+    completion_tokens = estimate_tokens(content)
+    return ChatCompletion(
+        id=f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        object="chat.completion",
+        created=int(time.time()),
+        model=model,
+        choices=[Choice(index=0, finish_reason=finish_reason, message=ChatCompletionMessage(role="assistant", content=content))],
+        usage=CompletionUsage(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        ),
+    )
+
+
+def make_chunks(content, model, prompt_tokens=0, words_per_chunk=1):
+    """The ChatCompletionChunk sequence of a streamed reply, ending with a usage-only chunk."""
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    words = content.split(" ")
+    pieces = [" ".join(words[i:i + words_per_chunk]) + " " for i in range(0, len(words), words_per_chunk)]
+    pieces[-1] = pieces[-1].rstrip(" ")
+    for i, piece in enumerate(pieces):
+        yield ChatCompletionChunk(
+            id=completion_id, object="chat.completion.chunk", created=created, model=model,
+            choices=[ChunkChoice(index=0, delta=ChoiceDelta(content=piece), finish_reason="stop" if i == len(pieces) - 1 else None)],
+        )
+    completion_tokens = estimate_tokens(content)
+    yield ChatCompletionChunk(
+        id=completion_id, object="chat.completion.chunk", created=created, model=model, choices=[],
+        usage=CompletionUsage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                              total_tokens=prompt_tokens + completion_tokens),
+    )
+
+
+def make_rubric(num_criteria=4, levels=4):
+    return {
+        "Criteria": [
+            {
+                "Name": f"Criterion {c + 1}",
+                "Scores": [
+                    {"Score": f"Level {v}", "Description": f"Meets criterion {c + 1} at level {v}.", "Value": v}
+                    for v in range(levels, 0, -1)
+                ],
+            }
+            for c in range(num_criteria)
+        ]
+    }
+
+
+def close_json(text):
+    """Closes the strings, arrays and objects left open in cut-off JSON, dropping a dangling member."""
+    for _ in range(10):
+        stack, in_string, escaped = [], False, False
+        for char in text:
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in "{[":
+                stack.append("}" if char == "{" else "]")
+            elif char in "}]":
+                stack.pop()
+        closed = text + ('"' if in_string else "") + "".join(reversed(stack))
+        try:
+            return json.loads(closed)
+        except ValueError:
+            text = text[:text.rfind(",")] if "," in text else "{"
+    return {}
+
+
+def repair_reply(prompt):
+    """What the repair model returns: the object in the text, closed if it was cut off, otherwise unchanged."""
+    text = prompt.split("### Text:\n", 1)[-1].strip()
+    text = re.sub(r"```\s*$", "", text[text.find("{"):] if "{" in text else "{").strip()
+    try:
+        value = json.JSONDecoder().raw_decode(text)[0]
+    except ValueError:
+        value = close_json(text)
+    return json.dumps(value)
+
+
+def default_responder(messages, model, num_criteria=4):
+    """Picks a canned reply from the shape of the last user prompt."""
+    prompt = messages[-1]["content"]
+
+    if "was meant to be a single JSON object" in prompt:
+        return repair_reply(prompt)
+
+    if "essay grading rubric" in prompt:
+        return json.dumps(make_rubric(num_criteria))
+
+    if "split it into logical paragraphs" in prompt:
+        essay = prompt.split("Essay:", 1)[-1].strip()
+        paragraphs = [" ".join(p.split()) for p in re.split(r"\n\s*\n", essay) if p.strip()]
+        return "\n".join(f"{i + 1}. {p}" for i, p in enumerate(paragraphs))
+
+    if "running summary of a conversation" in prompt:
+        return "The student asked about evidence and structure; the assistant suggested stronger analysis of quotes."
+
+    if "main theme" in prompt:
+        return "The essay explores how memory and language shape identity."
+
+    if "paragraph-by-paragraph evaluations" in prompt:
+        criterion = re.search(r"### Grading Criterion:\s*(.+)", prompt)
+        return json.dumps({
+            "criterion": criterion.group(1) if criterion else "Unknown",
+            "summary_feedback": "The essay meets this criterion with room to sharpen its evidence.",
+        })
+
+    if "### Paragraphs to Evaluate" in prompt:
+        criteria = re.findall(r"#### Criterion: (.+?) \(score between", prompt)
+        paragraphs = [int(n) for n in re.findall(r"#### Paragraph (\d+)", prompt)]
+        return json.dumps({
+            "evaluations": [
+                {
+                    "paragraph": paragraph,
+                    "criterion": criterion,
+                    "score": 3,
+                    "feedback": "Clear point, but the evidence needs more analysis.",
+                    "suggestions": ["Explain how the quoted line supports the claim."],
+                }
+                for paragraph in paragraphs for criterion in criteria
+            ]
+        })
+
+    match = re.search(r"Paragraph (\d+) to Evaluate", prompt)
+    if match:
+        criterion = re.search(r"### Grading Criterion:\s*(.+?)(?: \(score between|$)", prompt, re.MULTILINE)
+        return json.dumps({
+            "paragraph": int(match.group(1)),
+            "criterion": criterion.group(1) if criterion else "Unknown",
+            "score": 3,
+            "feedback": "Clear point, but the evidence needs more analysis.",
+            "suggestions": ["Explain how the quoted line supports the claim."],
+        })
+
+    if messages[0]["role"] == "system":
+        return ("Your second paragraph makes a clear claim, but the quotation needs more analysis. "
+                "Try explaining how the quote supports your point before moving on, for example by "
+                "naming the technique the author uses and what it shows about the character.")
+
+    return "Stub reply."
+
+
+class StubOpenAI:
+    def __init__(self, responder=default_responder, latency=0.0, prefill_latency_per_1k=0.0, token_latency=0.0):
+        """
+        Each call waits `latency` plus `prefill_latency_per_1k` per 1,000 prompt tokens before
+        its first token, and `token_latency` per generated chunk after that.
+        """
+        self.responder = responder
+        self.latency = latency
+        self.prefill_latency_per_1k = prefill_latency_per_1k
+        self.token_latency = token_latency
+        self.calls = []
+        self._lock = threading.Lock()
+
+        class _Completions:
+            create = self._create
+
+        class _Chat:
+            completions = _Completions()
+
+        self.chat = _Chat()
+
+    def _create(self, model, messages, **params):
+        prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        with self._lock:
+            self.calls.append({"model": model, "prompt_tokens": prompt_tokens, "params": params})
+        delay = self.latency + self.prefill_latency_per_1k * prompt_tokens / 1000
+        if delay:
+            time.sleep(delay)
+        content = self.responder(messages, model)
+        # A responder can return (content, finish_reason), e.g. to fake a reply cut off at max_tokens
+        content, finish_reason = content if isinstance(content, tuple) else (content, "stop")
+        if params.get("stream"):
+            return self._stream(make_chunks(content, model, prompt_tokens))
+        if self.token_latency:
+            time.sleep(self.token_latency * len(content.split(" ")))
+        return make_completion(content, model, prompt_tokens=prompt_tokens, finish_reason=finish_reason)
+
+    def _stream(self, chunks):
+        for chunk in chunks:
+            if self.token_latency and chunk.choices:
+                time.sleep(self.token_latency)
+            yield chunk
+
+    def call_count(self, model=None):
+        with self._lock:
+            return sum(1 for call in self.calls if model is None or call["model"] == model)
+
+    def prompt_tokens(self):
+        with self._lock:
+            return sum(call["prompt_tokens"] for call in self.calls)
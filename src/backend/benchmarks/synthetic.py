@@ -0,0 +1,77 @@
+"""Synthetic essays for offline benchmarks (no real student text required)."""
+
+import random
+
+WORDS = (
+    "the author argues that history shapes identity while memory resists erasure "
+    "through language culture family land resilience colonization voice community "
+    "evidence suggests a deeper tension between tradition and change as characters "
+    "struggle to reconcile loss with hope and the narrative builds toward a moment "
+    "of clarity where the reader understands how power silence and courage connect"
+).split()
+
+
+# Distinct vocabularies so consecutive paragraphs of a topical essay really shift topic
+TOPICS = [
+    "ocean tide coral reef fish whale current salt wave shore harbor sailor storm".split(),
+    "election vote senate law court policy citizen campaign ballot congress rights".split(),
+    "harvest farm soil wheat rain drought tractor orchard cattle seed field barn".split(),
+    "orbit planet telescope galaxy rocket astronaut comet star gravity moon launch".split(),
+    "melody rhythm guitar choir concert violin chord song drum rehearsal stage".split(),
+    "factory wage worker union strike machine labor shift steel railway industry".split(),
+    "disease vaccine doctor hospital patient fever clinic nurse medicine virus cure".split(),
+    "forest trail river mountain camp canyon wolf pine snow valley hiker cabin".split(),
+]
+
+
+def make_sentence(rng, min_words=8, max_words=22, vocabulary=WORDS):
+    words = [rng.choice(vocabulary) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + "."
+
+
+def make_paragraph(rng, min_sentences=3, max_sentences=9):
+    return " ".join(make_sentence(rng) for _ in range(rng.randint(min_sentences, max_sentences)))
+
+
+def make_essay(num_paragraphs=12, seed=0):
+    """Returns a list of paragraphs of varied length."""
+    rng = random.Random(seed)
+    return [make_paragraph(rng) for _ in range(num_paragraphs)]
+
+
+def make_topical_essay(num_paragraphs=6, seed=0, min_sentences=3, max_sentences=8):
+    """Returns a list of paragraphs, each about a different topic than the one before."""
+    rng = random.Random(seed)
+    paragraphs, topic = [], None
+    for _ in range(num_paragraphs):
+        topic = rng.choice([t for t in range(len(TOPICS)) if t != topic])
+        vocabulary = TOPICS[topic] * 6 + WORDS  # mostly topic words, some shared essay language
+        sentences = rng.randint(min_sentences, max_sentences)
+        paragraphs.append(" ".join(make_sentence(rng, vocabulary=vocabulary) for _ in range(sentences)))
+    return paragraphs
+
+
+def make_essays(count, min_paragraphs=5, max_paragraphs=15, seed=0):
+    rng = random.Random(seed)
+    return [make_essay(rng.randint(min_paragraphs, max_paragraphs), seed=seed + i) for i in range(count)]
+
+
+# Paragraph-count ranges of the corpus' essay sizes
+ESSAY_SIZES = {"small": (4, 6), "medium": (8, 12), "large": (16, 24)}
+
+
+def make_corpus(count, size="medium", seed=0):
+    """`count` essay texts (paragraphs separated by blank lines) of one of the ESSAY_SIZES."""
+    low, high = ESSAY_SIZES[size]
+    return ["\n\n".join(essay) for essay in make_essays(count, low, high, seed)]
+
+
+def make_rubric_text(num_criteria=4, levels=4, seed=0):
+    """A rubric document as a teacher would upload it: one block per criterion, best level first."""
+    rng = random.Random(seed)
+    blocks = []
+    for c in range(num_criteria):
+        lines = [f"Criterion {c + 1}: {make_sentence(rng, 3, 6)}"]
+        lines += [f"  Level {v} ({v} points): {make_sentence(rng, 8, 16)}" for v in range(levels, 0, -1)]
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
@@ -0,0 +1,233 @@
+"""
+Server-side chat sessions about an analysis result.
+
+Each finished analysis (essay text and criterion results) is stored once, under
+the analysis ID returned with the result. A chat session points at an analysis,
+so a turn only sends the new message.
+
+Prompts are built in a fixed order. The instructions, essay and feedback come
+first and are byte-identical on every turn of a session, so the provider's
+prompt cache can reuse that prefix. Next comes a running summary of older
+turns, then the most recent turns verbatim. Once the unsummarized history grows
+past `max_messages`, the oldest turns are folded into the summary, leaving the
+newest `keep_messages`.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+CHAT_INSTRUCTIONS = """You are an expert essay evaluator assistant providing personalized feedback.
+
+Your task is to:
+1. Provide helpful, concise explanations about the feedback
+2. If asked about specific parts of the essay, reference both the feedback and relevant essay content
+3. Give specific, actionable advice based on the feedback context
+4. When suggesting improvements, provide examples of better phrasing or structure
+5. Be encouraging but honest about areas that need improvement
+6. Focus on helping the student understand how to implement the feedback
+
+Keep responses clear, specific, and directly related to the student's question.
+"""
+
+
+def chat_system_prompt(essay_text, feedback):
+    """The per-session system prompt: shared instructions first, then this session's essay and feedback."""
+    if not isinstance(feedback, str):
+        feedback = json.dumps(feedback, separators=(",", ":"))
+    return f"""{CHAT_INSTRUCTIONS}
+ESSAY CONTEXT:
+{essay_text}
+
+FEEDBACK CONTEXT:
+{feedback}
+"""
+
+
+class ChatStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS analyses ("
+            " id TEXT PRIMARY KEY, essay_text TEXT NOT NULL, results TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_state (id TEXT PRIMARY KEY, state TEXT NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chat_sessions ("
+            " id TEXT PRIMARY KEY, analysis_id TEXT NOT NULL, summary TEXT NOT NULL DEFAULT '',"
+            " summarized_through INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chat_messages ("
+            " session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL,"
+            " created REAL NOT NULL, PRIMARY KEY (session_id, seq))"
+        )
+
+    def save_analysis(self, essay_text, results, state=None):
+        """Stores an analysis; `state` is its grading state, kept for re-grading revisions (see revisions.py)."""
+        analysis_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "INSERT INTO analyses (id, essay_text, results, created) VALUES (?, ?, ?, ?)",
+                (analysis_id, essay_text, json.dumps(results), time.time()),
+            )
+            if state is not None:
+                self._db.execute("INSERT INTO analysis_state (id, state) VALUES (?, ?)", (analysis_id, json.dumps(state)))
+            self._db.execute("COMMIT")
+        return analysis_id
+
+    def get_analysis(self, analysis_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT essay_text, results FROM analyses WHERE id = ?", (analysis_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"id": analysis_id, "essay_text": row[0], "results": json.loads(row[1])}
+
+    def get_analysis_state(self, analysis_id):
+        with self._lock:
+            row = self._db.execute("SELECT state FROM analysis_state WHERE id = ?", (analysis_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def create_session(self, analysis_id):
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO chat_sessions (id, analysis_id, created, updated) VALUES (?, ?, ?, ?)",
+                (session_id, analysis_id, now, now),
+            )
+        return session_id
+
+    def get_session(self, session_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT analysis_id, summary, summarized_through FROM chat_sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"id": session_id, "analysis_id": row[0], "summary": row[1], "summarized_through": row[2]}
+
+    def add_messages(self, session_id, messages):
+        """Appends (role, content) pairs to the session's history."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN")
+            for role, content in messages:
+                self._db.execute(
+                    "INSERT INTO chat_messages (session_id, seq, role, content, created) VALUES"
+                    " (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM chat_messages WHERE session_id = ?), ?, ?, ?)",
+                    (session_id, session_id, role, content, now),
+                )
+            self._db.execute("UPDATE chat_sessions SET updated = ? WHERE id = ?", (now, session_id))
+            self._db.execute("COMMIT")
+
+    def messages(self, session_id, after=0):
+        """Messages with seq > `after`, as dicts with seq, role and content."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, role, content FROM chat_messages WHERE session_id = ? AND seq > ? ORDER BY seq",
+                (session_id, after),
+            ).fetchall()
+        return [{"seq": seq, "role": role, "content": content} for seq, role, content in rows]
+
+    def set_summary(self, session_id, summary, through):
+        """Replaces the session's summary, which now covers messages up to seq `through`."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE chat_sessions SET summary = ?, summarized_through = ? WHERE id = ? AND summarized_through < ?",
+                (summary, through, session_id, through),
+            )
+
+    def purge(self, older_than):
+        """Deletes sessions last used, and analyses created, before the `older_than` timestamp."""
+        with self._lock:
+            stale = "SELECT id FROM chat_sessions WHERE updated < ?"
+            self._db.execute(f"DELETE FROM chat_messages WHERE session_id IN ({stale})", (older_than,))
+            self._db.execute("DELETE FROM chat_sessions WHERE updated < ?", (older_than,))
+            self._db.execute(
+                "DELETE FROM analyses WHERE created < ? AND id NOT IN (SELECT analysis_id FROM chat_sessions)",
+                (older_than,),
+            )
+            self._db.execute("DELETE FROM analysis_state WHERE id NOT IN (SELECT id FROM analyses)")
+
+
+class ChatSessions:
+    """
+    Builds each turn's prompt from the store and keeps the history bounded. Folding old
+    turns into the summary is done by `summarize(previous_summary, messages)`, which
+    runs after a turn, off the response path.
+    """
+
+    def __init__(self, store, summarize, max_messages=12, keep_messages=6, retention_seconds=7 * 24 * 3600):
+        self.store = store
+        self.summarize = summarize
+        self.max_messages = max_messages
+        self.keep_messages = keep_messages
+        self.retention_seconds = retention_seconds
+        self._summarizing = set()
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+    def start(self, analysis_id):
+        """Opens a session on a stored analysis. Returns None if there is no such analysis."""
+        if self.store.get_analysis(analysis_id) is None:
+            return None
+        self._purge_now_and_then()
+        return self.store.create_session(analysis_id)
+
+    def prompt(self, session, user_message):
+        """Chat messages for the next turn: system prompt, summary, recent turns, then the new message."""
+        analysis = self.store.get_analysis(session["analysis_id"])
+        messages = [{"role": "system", "content": chat_system_prompt(analysis["essay_text"], analysis["results"])}]
+        if session["summary"]:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{session['summary']}"})
+        messages.extend(
+            {"role": message["role"], "content": message["content"]}
+            for message in self.store.messages(session["id"], session["summarized_through"])
+        )
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    def record_turn(self, session_id, user_message, response):
+        """Saves a finished turn. Returns True if the history is now due to be summarized."""
+        self.store.add_messages(session_id, [("user", user_message), ("assistant", response)])
+        session = self.store.get_session(session_id)
+        return len(self.store.messages(session_id, session["summarized_through"])) > self.max_messages
+
+    def compact(self, session_id):
+        """Folds all but the newest `keep_messages` unsummarized messages into the summary."""
+        with self._lock:
+            if session_id in self._summarizing:
+                return
+            self._summarizing.add(session_id)
+        try:
+            session = self.store.get_session(session_id)
+            pending = self.store.messages(session_id, session["summarized_through"])
+            fold = pending[:len(pending) - self.keep_messages]
+            if fold:
+                summary = self.summarize(session["summary"], fold)
+                self.store.set_summary(session_id, summary, fold[-1]["seq"])
+        finally:
+            with self._lock:
+                self._summarizing.discard(session_id)
+
+    def _purge_now_and_then(self):
+        now = time.time()
+        if self.retention_seconds and now - self._last_purge > 3600:
+            self._last_purge = now
+            self.store.purge(now - self.retention_seconds)
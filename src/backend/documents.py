@@ -0,0 +1,149 @@
+"""
+Document-to-text conversion straight from upload bytes.
+
+Uploads are read from the request stream in chunks up to a byte limit and
+converted in memory; nothing is written to disk, so concurrent uploads that
+share a filename cannot collide. PDFs over a page limit are rejected. Large
+PDFs have their pages extracted in parallel by a pool of worker processes,
+because pdfplumber is pure Python and threads would only take turns holding
+the GIL.
+"""
+
+import io
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt')
+
+
+class UploadRejected(ValueError):
+    """An upload over the size or page limits."""
+
+
+def too_large(name, max_bytes):
+    return UploadRejected(f"{name} is larger than the {max_bytes / (1024 * 1024):g} MB upload limit")
+
+
+def read_limited(stream, max_bytes, name="upload", chunk_size=1024 * 1024):
+    """Reads a file-like object to bytes, raising UploadRejected as soon as it passes `max_bytes`."""
+    chunks, total = [], 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if max_bytes and total > max_bytes:
+            raise too_large(name, max_bytes)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def read_archive(data, max_bytes, max_files, max_total_bytes=None):
+    """
+    Returns [(filename, bytes)] for the supported documents in a .zip, in name order.
+    Folders, hidden files (e.g. __MACOSX/) and other file types are skipped. Each member
+    is read within `max_bytes`, and all of them together within `max_total_bytes`,
+    whatever sizes their headers claim.
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile as e:
+        raise UploadRejected(f"Not a valid .zip archive: {e}")
+
+    with archive:
+        members = [
+            member for member in archive.infolist()
+            if not member.is_dir()
+            and not any(part.startswith(('.', '__MACOSX')) for part in member.filename.split('/'))
+            and os.path.splitext(member.filename)[1].lower() in SUPPORTED_EXTENSIONS
+        ]
+        if max_files and len(members) > max_files:
+            raise UploadRejected(f"Archive has {len(members)} documents; the limit is {max_files}")
+        files, total = [], 0
+        for member in sorted(members, key=lambda member: member.filename):
+            limit = max_bytes
+            if max_total_bytes:
+                remaining = max_total_bytes - total
+                limit = min(limit, remaining) if limit else remaining
+            with archive.open(member) as stream:
+                try:
+                    content = read_limited(stream, limit, member.filename)
+                except UploadRejected:
+                    if limit != max_bytes:
+                        raise UploadRejected(f"Archive expands to more than {max_total_bytes / (1024 * 1024):g} MB")
+                    raise
+            total += len(content)
+            files.append((member.filename, content))
+        return files
+
+
+def extract_pdf_pages(data, start, stop):
+    """Text of pages [start, stop) of the PDF in `data`. Runs in the worker processes."""
+    import pdfplumber
+
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        return [(page.extract_text() or "").strip() for page in pdf.pages[start:stop]]
+
+
+class DocumentConverter:
+    def __init__(self, max_bytes=20 * 1024 * 1024, max_pages=200, parallel_min_pages=8, workers=None):
+        self.max_bytes = max_bytes
+        self.max_pages = max_pages
+        self.parallel_min_pages = parallel_min_pages
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # Spawned, not forked: the server process has model and scheduler threads running
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def convert_stream(self, filename, stream):
+        """Reads an upload stream (within the byte limit) and returns its text."""
+        return self.convert(filename, read_limited(stream, self.max_bytes, filename or "upload"))
+
+    def convert(self, filename, data):
+        """Converts the bytes of a .pdf, .docx or .txt file to text."""
+        extension = os.path.splitext(filename or "")[1].lower()
+        if extension == '.pdf':
+            return self.convert_pdf(data)
+        if extension == '.docx':
+            return self.convert_docx(data)
+        if extension == '.txt':
+            return data.decode('utf-8')
+        return f"Unsupported file format: {extension}"
+
+    def convert_pdf(self, data):
+        """Extract text from a PDF while preserving structure (pages separated by blank lines)."""
+        import pdfplumber
+
+        with pdfplumber.open(io.BytesIO(data)) as pdf:
+            page_count = len(pdf.pages)
+            if self.max_pages and page_count > self.max_pages:
+                raise UploadRejected(f"PDF has {page_count} pages; the limit is {self.max_pages}")
+            if page_count < self.parallel_min_pages or self.workers < 2:
+                pages = [(page.extract_text() or "").strip() for page in pdf.pages]
+            else:
+                pages = None
+
+        if pages is None:
+            # Contiguous page ranges, a couple per worker, so each worker parses the file only a few times
+            step = max(1, -(-page_count // (self.workers * 2)))
+            ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+            pool = self._get_pool()
+            futures = [pool.submit(extract_pdf_pages, data, start, stop) for start, stop in ranges]
+            pages = [text for future in futures for text in future.result()]
+
+        return "\n\n".join(text for text in pages if text)  # Keep paragraphs separate
+
+    def convert_docx(self, data):
+        from docx import Document
+
+        doc = Document(io.BytesIO(data))
+        return '\n'.join(paragraph.text for paragraph in doc.paragraphs)
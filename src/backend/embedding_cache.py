@@ -0,0 +1,184 @@
+"""
+Content-addressed cache for paragraph embeddings.
+
+Entries are keyed by model name + a hash of the normalized paragraph text, so a
+resubmitted essay only re-encodes the paragraphs that actually changed.
+
+Two tiers:
+- an in-process LRU of float32 vectors
+- an optional on-disk tier: one memory-mapped float16 array per model, with a
+  SQLite index mapping keys to slots and least-recently-used eviction at a size cap
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_text(text):
+    """Normalizes unicode and whitespace so cosmetic differences share a cache entry."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def embedding_key(model_name, text):
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model_name}:{digest}"
+
+
+class DiskEmbeddingStore:
+    """Float16 vectors in a per-model memmap; slot allocation and LRU order live in SQLite."""
+
+    def __init__(self, directory, max_entries):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._arrays = {}
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS models (model TEXT PRIMARY KEY, dim INTEGER NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, model TEXT NOT NULL, slot INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (model, last_used)")
+
+    def _array(self, model_name, dim):
+        array = self._arrays.get(model_name)
+        if array is None:
+            filename = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name) + ".f16"
+            path = os.path.join(self.directory, filename)
+            mode = "r+" if os.path.exists(path) else "w+"
+            array = np.memmap(path, dtype=np.float16, mode=mode, shape=(self.max_entries, dim))
+            self._arrays[model_name] = array
+        return array
+
+    def _dim(self, model_name):
+        row = self._db.execute("SELECT dim FROM models WHERE model = ?", (model_name,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, model_name, key):
+        with self._lock:
+            row = self._db.execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            return np.asarray(self._array(model_name, self._dim(model_name))[row[0]], dtype=np.float32)
+
+    def put(self, model_name, key, vector):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                dim = self._dim(model_name)
+                if dim is None:
+                    dim = len(vector)
+                    self._db.execute("INSERT INTO models (model, dim) VALUES (?, ?)", (model_name, dim))
+
+                row = self._db.execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    slot = row[0]
+                else:
+                    count = self._db.execute("SELECT COUNT(*) FROM entries WHERE model = ?", (model_name,)).fetchone()[0]
+                    if count < self.max_entries:
+                        slot = count
+                    else:
+                        # Evict the least recently used entry and reuse its slot
+                        victim, slot = self._db.execute(
+                            "SELECT key, slot FROM entries WHERE model = ? ORDER BY last_used LIMIT 1", (model_name,)
+                        ).fetchone()
+                        self._db.execute("DELETE FROM entries WHERE key = ?", (victim,))
+
+                array = self._array(model_name, dim)
+                array[slot] = np.asarray(vector, dtype=np.float16)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (key, model, slot, last_used) VALUES (?, ?, ?, ?)",
+                    (key, model_name, slot, time.time()),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class EmbeddingCache:
+    """In-process LRU in front of an optional DiskEmbeddingStore, with per-model hit/miss counters."""
+
+    def __init__(self, max_entries=4096, disk_dir=None, disk_max_entries=100_000):
+        self.max_entries = max_entries
+        self.disk = DiskEmbeddingStore(disk_dir, disk_max_entries) if disk_dir else None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def _count(self, model_name, field, amount=1):
+        counters = self._counters.setdefault(model_name, {"hits": 0, "disk_hits": 0, "misses": 0})
+        counters[field] += amount
+
+    def get(self, model_name, text):
+        key = embedding_key(model_name, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self._count(model_name, "hits")
+                return vector
+
+        vector = self.disk.get(model_name, key) if self.disk is not None else None
+        with self._lock:
+            if vector is None:
+                self._count(model_name, "misses")
+                return None
+            self._count(model_name, "disk_hits")
+            self._remember(key, vector)
+        return vector
+
+    def put(self, model_name, text, vector):
+        key = embedding_key(model_name, text)
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+        if self.disk is not None:
+            self.disk.put(model_name, key, vector)
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self.disk) if self.disk is not None else None,
+                "models": {name: dict(counters) for name, counters in self._counters.items()},
+            }
+
+
+def embed_with_cache(cache, model_name, texts, encode_fn):
+    """
+    Returns an (N, dim) array of embeddings for `texts`, calling `encode_fn` once with
+    only the distinct texts that are not already cached.
+    """
+    if cache is None:
+        return np.asarray(encode_fn(list(texts)), dtype=np.float32)
+
+    vectors = [cache.get(model_name, text) for text in texts]
+    missing = list(OrderedDict.fromkeys(texts[i] for i, vector in enumerate(vectors) if vector is None))
+    if missing:
+        encoded = dict(zip(missing, np.asarray(encode_fn(missing), dtype=np.float32)))
+        for text, vector in encoded.items():
+            cache.put(model_name, text, vector)
+        vectors = [encoded[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+    return np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
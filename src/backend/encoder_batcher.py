@@ -0,0 +1,149 @@
+"""
+Cross-request micro-batching for the encoders.
+
+Concurrent analyses would otherwise each run their own small forward passes on the
+shared Longformer and MiniLM models, from many threads at once, and contend for the
+same torch thread pool. Instead, each model gets one batcher. Callers submit the
+paragraphs they need encoded and wait on a Future. A single worker thread per model
+takes everything queued, up to `max_batch_size` texts, runs it as one encode call and
+hands each caller back its own rows.
+
+When the worker is idle, the first request waits at most `max_wait` seconds for
+others to join its batch. While a batch is running, new requests queue up and form
+the next one, so under load batches fill without any added wait. Texts that appear
+in several requests of one batch are encoded once.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+batch_texts = telemetry.registry.histogram(
+    "encoder_batch_texts", "Distinct texts per encoder micro-batch.", ("model",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+batch_requests = telemetry.registry.histogram(
+    "encoder_batch_requests", "Caller requests merged into each encoder micro-batch.", ("model",),
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+batch_wait_seconds = telemetry.registry.histogram(
+    "encoder_batch_wait_seconds", "Time encoder requests spent queued before their batch started.", ("model",),
+)
+
+
+class EncoderBatcher:
+    def __init__(self, name, encode, max_batch_size=64, max_wait=0.005):
+        """
+        `encode(texts)` returns one embedding row per text; it is only ever called from
+        this batcher's worker thread.
+        """
+        self.name = name
+        self._encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._pending = deque()  # (future, texts, enqueued_at)
+        self._pending_texts = 0
+        self._condition = threading.Condition()
+        self._worker = None
+        self._stats = {
+            "requests": 0, "batches": 0, "texts": 0, "encoded_texts": 0, "failed_batches": 0,
+            "max_batch_texts": 0, "wait_seconds_total": 0.0, "encode_seconds_total": 0.0,
+        }
+
+    def encode(self, texts):
+        """Embeddings of `texts` as an (N, dim) array, encoded together with other callers' texts."""
+        return self.submit(texts).result()
+
+    def submit(self, texts):
+        """Queues `texts` for the next batch and returns a Future for their embeddings."""
+        future = Future()
+        texts = list(texts)
+        with self._condition:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._work, name=f"encoder-batcher-{self.name}", daemon=True)
+                self._worker.start()
+            self._pending.append((future, texts, time.monotonic()))
+            self._pending_texts += len(texts)
+            self._stats["requests"] += 1
+            self._condition.notify()
+        return future
+
+    def _take_batch(self):
+        """Waits for work, then up to max_wait for the batch to fill. Caller holds the condition."""
+        while not self._pending:
+            self._condition.wait()
+        deadline = self._pending[0][2] + self.max_wait
+        while self._pending_texts < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._condition.wait(remaining)
+
+        batch, size = [], 0
+        # A request is never split; one larger than max_batch_size runs as a batch of its own
+        while self._pending and (not batch or size + len(self._pending[0][1]) <= self.max_batch_size):
+            future, texts, enqueued_at = self._pending.popleft()
+            self._pending_texts -= len(texts)
+            if future.set_running_or_notify_cancel():
+                batch.append((future, texts, enqueued_at))
+                size += len(texts)
+        return batch
+
+    def _work(self):
+        while True:
+            with self._condition:
+                batch = self._take_batch()
+            if batch:
+                self._run(batch)
+
+    def _run(self, batch):
+        started = time.monotonic()
+        unique = list(dict.fromkeys(text for _, texts, _ in batch for text in texts))
+        try:
+            embeddings = np.asarray(self._encode(unique), dtype=np.float32) if unique else None
+        except Exception as error:
+            with self._condition:
+                self._stats["failed_batches"] += 1
+            if len(batch) > 1:
+                # Retry each request alone, so one bad input only fails its own caller
+                logger.warning("Encoder batch of %d requests failed (%s); retrying them one by one", len(batch), error)
+                for item in batch:
+                    self._run([item])
+            else:
+                batch[0][0].set_exception(error)
+            return
+        encode_seconds = time.monotonic() - started
+
+        rows = {text: i for i, text in enumerate(unique)}
+        for future, texts, _ in batch:
+            future.set_result(embeddings[[rows[text] for text in texts]] if texts else np.zeros((0, 0), dtype=np.float32))
+
+        wait_seconds = [started - enqueued_at for _, _, enqueued_at in batch]
+        for seconds in wait_seconds:
+            batch_wait_seconds.observe(seconds, model=self.name)
+        batch_texts.observe(len(unique), model=self.name)
+        batch_requests.observe(len(batch), model=self.name)
+        with self._condition:
+            self._stats["batches"] += 1
+            self._stats["texts"] += sum(len(texts) for _, texts, _ in batch)
+            self._stats["encoded_texts"] += len(unique)
+            self._stats["max_batch_texts"] = max(self._stats["max_batch_texts"], len(unique))
+            self._stats["wait_seconds_total"] += sum(wait_seconds)
+            self._stats["encode_seconds_total"] += encode_seconds
+        logger.debug("%s: encoded %d texts for %d requests in %.3fs", self.name, len(unique), len(batch), encode_seconds)
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats, queued_requests=len(self._pending), queued_texts=self._pending_texts)
+        stats["avg_batch_requests"] = stats["requests"] / stats["batches"] if stats["batches"] else 0.0
+        stats["avg_batch_texts"] = stats["encoded_texts"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
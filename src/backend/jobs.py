@@ -0,0 +1,334 @@
+"""
+Background analysis jobs persisted in SQLite.
+
+Submitting a job stores its inputs and returns an ID at once; a small pool of
+worker threads runs the analysis. Every progress event, the pipeline output
+(meta result) and each finished criterion are written to the database as they
+land. Clients can poll for them or stream them. After a restart, queued and
+running jobs are picked up again. Completed stages are not redone, so only the
+unfinished criteria are evaluated.
+
+Several processes (uvicorn --workers) may share one database. A worker claims a
+job atomically before running it and holds a lease on it, renewed while it runs;
+other processes only take over a running job once its lease has expired.
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when the queue is at capacity."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Job queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class JobStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, params TEXT NOT NULL, meta_result TEXT,"
+            " result TEXT, error TEXT, created REAL NOT NULL, updated REAL NOT NULL,"
+            " owner TEXT, lease REAL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease", "REAL")):
+            if column not in columns:  # databases created before leases
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS job_criteria ("
+            " job_id TEXT NOT NULL, seq INTEGER NOT NULL, criterion TEXT, result TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, seq))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            " job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, data TEXT NOT NULL,"
+            " created REAL NOT NULL, PRIMARY KEY (job_id, seq))"
+        )
+
+    def create(self, params):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, params, created, updated) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(params), now, now),
+            )
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, params, meta_result, result, error, created, updated FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job_id, status, params, meta_result, result, error, created, updated = row
+        return {
+            "id": job_id,
+            "status": status,
+            "params": json.loads(params),
+            "meta_result": json.loads(meta_result) if meta_result else None,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created": created,
+            "updated": updated,
+        }
+
+    def set_status(self, job_id, status, owner, result=None, error=None, event=None):
+        """
+        Records a job's outcome, and its final `event` ((name, data)), if `owner` still
+        holds it; both are written in one transaction so event streams never see one
+        without the other. Returns False, changing nothing, when another worker has since
+        claimed the job (this worker's lease expired).
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._db.execute(
+                    "UPDATE jobs SET status = ?, result = COALESCE(?, result), error = ?, updated = ? WHERE id = ? AND owner = ?",
+                    (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, owner),
+                )
+                owned = cursor.rowcount == 1
+                if owned and event is not None:
+                    self._insert_event(job_id, *event)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return owned
+
+    def claim(self, job_id, owner, lease_seconds):
+        """
+        Marks a job running under `owner` until now + `lease_seconds`, if it is queued or its
+        lease has expired. Returns False if another worker holds it or it has finished.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, lease = ?, updated = ? WHERE id = ?"
+                " AND (status = 'queued' OR (status = 'running' AND COALESCE(lease, 0) < ?))",
+                (owner, now + lease_seconds, now, job_id, now),
+            )
+        return cursor.rowcount == 1
+
+    def renew(self, owner, lease_seconds):
+        """Extends the lease on every job `owner` is running."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET lease = ? WHERE owner = ? AND status = 'running'",
+                (time.time() + lease_seconds, owner),
+            )
+
+    def save_meta_result(self, job_id, meta_result):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET meta_result = ?, updated = ? WHERE id = ?",
+                (json.dumps(meta_result), time.time(), job_id),
+            )
+
+    def add_criterion(self, job_id, result):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO job_criteria (job_id, seq, criterion, result) VALUES"
+                " (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM job_criteria WHERE job_id = ?), ?, ?)",
+                (job_id, job_id, result.get("criterion"), json.dumps(result)),
+            )
+
+    def criteria(self, job_id):
+        """Finished criterion results in completion order."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT result FROM job_criteria WHERE job_id = ? ORDER BY seq", (job_id,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def add_event(self, job_id, event, data):
+        with self._lock:
+            self._insert_event(job_id, event, data)
+
+    def _insert_event(self, job_id, event, data):
+        self._db.execute(
+            "INSERT INTO job_events (job_id, seq, event, data, created) VALUES"
+            " (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?), ?, ?, ?)",
+            (job_id, job_id, event, json.dumps(data), time.time()),
+        )
+
+    def events(self, job_id, after=0):
+        """Events with seq > `after`, as dicts with seq, event and data."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, event, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after),
+            ).fetchall()
+        return [{"seq": seq, "event": event, "data": json.loads(data)} for seq, event, data in rows]
+
+    def unfinished(self):
+        """Queued jobs and running jobs whose lease has expired (their worker is gone)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM jobs WHERE status = 'queued'"
+                " OR (status = 'running' AND COALESCE(lease, 0) < ?) ORDER BY created",
+                (time.time(),),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def purge(self, older_than):
+        """Deletes finished jobs last updated before the `older_than` timestamp."""
+        with self._lock:
+            stale = "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND updated < ?"
+            self._db.execute(f"DELETE FROM job_events WHERE job_id IN ({stale})", (older_than,))
+            self._db.execute(f"DELETE FROM job_criteria WHERE job_id IN ({stale})", (older_than,))
+            self._db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?", (older_than,))
+
+
+class JobQueue:
+    """
+    Runs `runner(job, store)` for each job on `workers` threads. At most `max_queued`
+    jobs may wait for a worker; beyond that submit() raises QueueFull. Jobs are run
+    under a lease of `lease_seconds`, renewed every third of that while they run; the
+    same pass picks up jobs whose worker (in any process) stopped renewing.
+    """
+
+    def __init__(self, store, runner, workers=2, max_queued=32, retention_seconds=24 * 3600, lease_seconds=120):
+        self.store = store
+        self.runner = runner
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention_seconds = retention_seconds
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex  # this process, in the jobs table
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._queued = 0
+        self._running = 0
+        self._pending = set()  # job IDs in self._queue
+        self._avg_seconds = None  # moving average of job duration, for Retry-After
+        self._stats = {"submitted": 0, "resumed": 0, "completed": 0, "failed": 0, "rejected": 0, "skipped": 0}
+
+    def start(self):
+        """Starts the workers and the lease keeper, which re-queues jobs left unfinished. Idempotent."""
+        with self._lock:
+            if self._threads:
+                return
+            self.store.purge(time.time() - self.retention_seconds)
+            self._resume()
+            for index in range(self.workers):
+                worker = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+                self._threads.append(worker)
+                worker.start()
+            keeper = threading.Thread(target=self._keep_leases, name="job-leases", daemon=True)
+            self._threads.append(keeper)
+            keeper.start()
+
+    def _resume(self):
+        """Queues unclaimed and abandoned jobs not already waiting here. Caller holds the lock."""
+        for job_id in self.store.unfinished():
+            if job_id not in self._pending:
+                self._pending.add(job_id)
+                self._queued += 1
+                self._stats["resumed"] += 1
+                self._queue.put(job_id)
+
+    def _keep_leases(self):
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            try:
+                self.store.renew(self.owner, self.lease_seconds)
+                with self._lock:
+                    self._resume()
+            except Exception as e:
+                logger.error("Job lease renewal failed: %s", e)
+
+    def submit(self, params):
+        self.start()
+        with self._lock:
+            if self._queued >= self.max_queued:
+                self._stats["rejected"] += 1
+                raise QueueFull(self.retry_after())
+            job_id = self.store.create(params)
+            self._pending.add(job_id)
+            self._queued += 1
+            self._stats["submitted"] += 1
+        self._queue.put(job_id)
+        return job_id
+
+    def retry_after(self):
+        """Seconds until a queue slot is likely to free up (a worker finishing its job). Caller holds the lock."""
+        if self._avg_seconds is None:
+            return 30
+        return max(1, round(self._avg_seconds / self.workers))
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                self._pending.discard(job_id)
+                self._queued -= 1
+                self._running += 1
+            started = time.monotonic()
+
+            try:
+                # Another process may have submitted, or already be running, the same job
+                if not self.store.claim(job_id, self.owner, self.lease_seconds):
+                    with self._lock:
+                        self._stats["skipped"] += 1
+                    continue
+                job = self.store.get(job_id)
+                try:
+                    result = self.runner(job, self.store)
+                except Exception as e:
+                    logger.exception("Job %s failed: %s", job_id, e)
+                    outcome = "failed"
+                    owned = self.store.set_status(job_id, "failed", self.owner, error=str(e),
+                                                  event=("error", {"success": False, "error": str(e)}))
+                else:
+                    outcome = "completed"
+                    owned = self.store.set_status(job_id, "done", self.owner, result=result, event=("done", result))
+                if not owned:
+                    # The lease lapsed and another worker took the job over; its outcome stands
+                    logger.warning("Job %s was claimed by another worker; dropping this run's result", job_id)
+                    with self._lock:
+                        self._stats["skipped"] += 1
+                    continue
+
+                elapsed = time.monotonic() - started
+                with self._lock:
+                    self._stats[outcome] += 1
+                    self._avg_seconds = elapsed if self._avg_seconds is None else 0.8 * self._avg_seconds + 0.2 * elapsed
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "workers": self.workers,
+                "max_queued": self.max_queued,
+                "queued": self._queued,
+                "running": self._running,
+                "avg_job_seconds": self._avg_seconds,
+            }
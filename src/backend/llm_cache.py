@@ -0,0 +1,85 @@
+"""
+Persistent cache for repeatable (low-temperature) chat completion responses.
+
+Responses are keyed by a hash of the model, messages and every other request
+parameter, and stored as JSON in SQLite. Entries expire after a TTL, and the
+least recently used entries are evicted once the stored bytes exceed a cap.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    def __init__(self, path, ttl_seconds=7 * 24 * 3600, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_used)")
+
+    @staticmethod
+    def key(params):
+        """Stable hash of the request parameters (model, messages, temperature, ...)."""
+        payload = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+            value, created = row
+            if now - created > self.ttl_seconds:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._counters["expired"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._counters["hits"] += 1
+        return json.loads(value)
+
+    def put(self, key, value, model=None):
+        payload = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, value, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, payload, len(payload), now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._counters["evicted"] += 1
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            return {**self._counters, "entries": entries, "bytes": size}
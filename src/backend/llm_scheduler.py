@@ -0,0 +1,330 @@
+"""
+Process-wide scheduler for LLM calls.
+
+All OpenAI work runs on one bounded pool of worker threads (the concurrency cap),
+fed from per-request queues that are served round-robin, so one large essay cannot
+starve the others. Each call waits on per-model token buckets (requests/min and
+tokens/min) and is retried with jittered exponential backoff on 429s, 5xx and
+connection errors.
+
+Tasks submitted to the scheduler must not block on other scheduler futures;
+`call()` made from inside a task runs inline on the current worker.
+
+Async code uses `acall()` instead. Its calls wait in the same queues, but a worker
+that dequeues one only grants it a slot and moves on: the call then runs (and waits
+on the token buckets) on the caller's event loop, holding the slot but no thread.
+Streamed calls (`stream()`) are granted a slot the same way and keep it until the
+stream is read to the end or closed. All calls therefore share one concurrency cap
+and one fair queue.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Refills `rate_per_minute` units per minute up to one minute of burst."""
+
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        """Takes `amount` units (possibly going into debt) and returns how long the caller must wait."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+def parse_limits(spec):
+    """Parses "gpt-4o=500,gpt-4o-mini=5000" into {"gpt-4o": 500, "gpt-4o-mini": 5000}."""
+    limits = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            model, value = item.split("=", 1)
+            limits[model.strip()] = float(value)
+    return limits
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return status == 429 or (isinstance(status, int) and status >= 500)
+
+
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency=16, requests_per_minute=None, tokens_per_minute=None,
+                 max_retries=5, base_delay=0.5, max_delay=30.0):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._request_buckets = {model: TokenBucket(rate) for model, rate in (requests_per_minute or {}).items()}
+        self._token_buckets = {model: TokenBucket(rate) for model, rate in (tokens_per_minute or {}).items()}
+
+        self._queues = OrderedDict()  # request id -> deque of (future, task, enqueued_at); task None = slot grant
+        self._slots_in_use = 0
+        self._condition = threading.Condition()
+        self._local = threading.local()
+        self._workers = []
+        self._stats = {
+            "submitted": 0, "completed": 0, "failed": 0, "retries": 0, "in_flight": 0,
+            "wait_seconds_total": 0.0, "wait_seconds_max": 0.0, "rate_limit_wait_seconds_total": 0.0,
+        }
+
+    # Request scoping
+
+    @contextmanager
+    def request_context(self, request_id=None):
+        """Tags work submitted from this thread with `request_id` for fair queuing."""
+        previous = getattr(self._local, "request_id", None)
+        self._local.request_id = request_id or uuid.uuid4().hex
+        try:
+            yield self._local.request_id
+        finally:
+            self._local.request_id = previous
+
+    def current_request_id(self):
+        """The request ID work from this thread is tagged with, or None outside a request."""
+        return getattr(self._local, "request_id", None)
+
+    def on_worker(self):
+        return getattr(self._local, "is_worker", False)
+
+    # Queueing
+
+    def submit(self, task, request_id=None):
+        """Queues a zero-argument callable and returns a Future for its result."""
+        return self._enqueue(task, request_id)
+
+    def _enqueue(self, task, request_id):
+        future = Future()
+        request_id = request_id or getattr(self._local, "request_id", None) or "default"
+        with self._condition:
+            self._ensure_workers()
+            self._queues.setdefault(request_id, deque()).append((future, task, time.monotonic()))
+            self._stats["submitted"] += 1
+            self._condition.notify()
+        return future
+
+    def _ensure_workers(self):
+        while len(self._workers) < self.max_concurrency:
+            worker = threading.Thread(target=self._work, name=f"llm-worker-{len(self._workers)}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _next(self):
+        """Round-robin across request queues. Caller holds the condition."""
+        request_id, queue = next(iter(self._queues.items()))
+        item = queue.popleft()
+        if queue:
+            self._queues.move_to_end(request_id)
+        else:
+            del self._queues[request_id]
+        return request_id, item
+
+    def _work(self):
+        self._local.is_worker = True
+        while True:
+            with self._condition:
+                while not self._queues or self._slots_in_use >= self.max_concurrency:
+                    self._condition.wait()
+                request_id, (future, task, enqueued_at) = self._next()
+                waited = time.monotonic() - enqueued_at
+                self._stats["wait_seconds_total"] += waited
+                self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+                self._stats["in_flight"] += 1
+                self._slots_in_use += 1
+
+            if not future.set_running_or_notify_cancel():
+                self._release_slot()
+                continue
+
+            if task is None:
+                # Slot grant for acall(): the caller's coroutine runs the call and releases the slot
+                future.set_result(None)
+                continue
+
+            # Work chained from this task (e.g. in done-callbacks) stays in the same request's queue
+            self._local.request_id = request_id
+            try:
+                result = task()
+            except BaseException as error:
+                self._release_slot("failed")
+                future.set_exception(error)
+            else:
+                self._release_slot("completed")
+                future.set_result(result)
+            finally:
+                self._local.request_id = None
+
+    def _release_slot(self, outcome=None):
+        with self._condition:
+            self._stats["in_flight"] -= 1
+            self._slots_in_use -= 1
+            if outcome:
+                self._stats[outcome] += 1
+            self._condition.notify()
+
+    # Rate limiting and retries
+
+    def call(self, fn, model=None, estimated_tokens=0):
+        """
+        Runs one LLM call under the model's rate limits, retrying transient failures.
+        From outside the scheduler it is queued and waited on; from inside a task it runs inline.
+        """
+        if not self.on_worker():
+            return self.submit(lambda: self.call(fn, model, estimated_tokens)).result()
+        return self._call_inline(fn, model, estimated_tokens)
+
+    def _call_inline(self, fn, model, estimated_tokens):
+        attempt = 0
+        while True:
+            self._wait_for_capacity(model, estimated_tokens)
+            try:
+                return fn()
+            except Exception as error:
+                if attempt >= self.max_retries or not is_retryable(error):
+                    raise
+                delay = self._retry_delay(error, attempt)
+                attempt += 1
+                with self._condition:
+                    self._stats["retries"] += 1
+                time.sleep(delay)
+
+    def _retry_delay(self, error, attempt):
+        delay = retry_after_seconds(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))  # full jitter
+        return delay
+
+    def stream(self, fn, model=None, estimated_tokens=0, request_id=None):
+        """
+        Generator for a streamed LLM call: `fn()` returns an iterator (e.g. a streamed
+        completion), opened under the model's rate limits with retries, whose items are
+        yielded. The call holds a concurrency slot, granted through the queues like
+        acall()'s, until the iterator is exhausted or this generator is closed.
+        """
+        if self.on_worker():
+            # The task running this already holds a slot
+            yield from self._drain(self._call_inline(fn, model, estimated_tokens))
+            return
+
+        grant = self._enqueue(None, request_id)
+        try:
+            grant.result()
+        except BaseException:
+            if not grant.cancel():
+                self._release_slot()
+            raise
+        outcome = "failed"
+        try:
+            yield from self._drain(self._call_inline(fn, model, estimated_tokens))
+            outcome = "completed"
+        except GeneratorExit:
+            outcome = "completed"  # the reader stopped early
+            raise
+        finally:
+            self._release_slot(outcome)
+
+    @staticmethod
+    def _drain(iterator):
+        try:
+            yield from iterator
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    async def acall(self, coroutine_fn, model=None, estimated_tokens=0, request_id=None):
+        """
+        Async counterpart of call(): `coroutine_fn()` returns an awaitable for one LLM call.
+        The call is queued under `request_id` like any other, but only for a slot; the
+        rate-limit waits, the call and its retries all run on this event loop.
+        """
+        grant = self._enqueue(None, request_id)
+        try:
+            await asyncio.wrap_future(grant)
+        except asyncio.CancelledError:
+            # A grant that could not be cancelled was already given a slot
+            if not grant.cancel():
+                self._release_slot()
+            raise
+
+        attempt = 0
+        try:
+            while True:
+                wait = self._reserve_capacity(model, estimated_tokens)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                try:
+                    result = await coroutine_fn()
+                except Exception as error:
+                    if attempt >= self.max_retries or not is_retryable(error):
+                        raise
+                    attempt += 1
+                    with self._condition:
+                        self._stats["retries"] += 1
+                    await asyncio.sleep(self._retry_delay(error, attempt - 1))
+                else:
+                    break
+        except BaseException:
+            self._release_slot("failed")
+            raise
+        self._release_slot("completed")
+        return result
+
+    def _reserve_capacity(self, model, estimated_tokens):
+        """Takes one request and `estimated_tokens` from the model's buckets; returns the wait in seconds."""
+        wait = 0.0
+        if model in self._request_buckets:
+            wait = max(wait, self._request_buckets[model].reserve(1))
+        if model in self._token_buckets and estimated_tokens:
+            wait = max(wait, self._token_buckets[model].reserve(estimated_tokens))
+        if wait > 0:
+            with self._condition:
+                self._stats["rate_limit_wait_seconds_total"] += wait
+        return wait
+
+    def _wait_for_capacity(self, model, estimated_tokens):
+        wait = self._reserve_capacity(model, estimated_tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    def stats(self):
+        with self._condition:
+            started = self._stats["completed"] + self._stats["failed"] + self._stats["in_flight"]
+            return {
+                **self._stats,
+                "max_concurrency": self.max_concurrency,
+                "queue_depth": sum(len(queue) for queue in self._queues.values()),
+                "queued_requests": len(self._queues),
+                "wait_seconds_avg": self._stats["wait_seconds_total"] / started if started else 0.0,
+            }
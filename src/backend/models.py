@@ -0,0 +1,69 @@
+"""
+Lazy registry for the encoder models.
+
+Each model is loaded once, either on its first use or by a background warmup
+that starts after the server is already answering health checks. The registry
+records load state and timings so readiness can be reported separately from
+liveness.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._locks = {}
+        self._status = {}
+        self._lock = threading.Lock()
+        self._warmup_thread = None
+
+    def register(self, name, loader):
+        """Registers a zero-argument `loader` whose return value is cached as model `name`."""
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+        self._status[name] = {"state": "not_loaded", "load_seconds": None, "error": None}
+
+    def get(self, name):
+        """Returns model `name`, loading it first if needed. Concurrent callers wait for one load."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._locks[name]:
+            if name not in self._models:
+                self._status[name].update(state="loading", error=None)
+                start = time.perf_counter()
+                try:
+                    self._models[name] = self._loaders[name]()
+                except Exception as e:
+                    self._status[name].update(state="failed", error=str(e))
+                    raise
+                self._status[name].update(state="ready", load_seconds=time.perf_counter() - start)
+        return self._models[name]
+
+    def warmup(self, names=None):
+        """Loads `names` (default: every registered model) in order; failures are recorded, not raised."""
+        for name in names or list(self._loaders):
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error("Failed to load model %s: %s", name, e)
+
+    def start_warmup(self, names=None):
+        """Runs warmup() on a background thread, once per process."""
+        with self._lock:
+            if self._warmup_thread is None:
+                self._warmup_thread = threading.Thread(target=self.warmup, args=(names,), name="model-warmup", daemon=True)
+                self._warmup_thread.start()
+
+    def is_ready(self):
+        return all(name in self._models for name in self._loaders)
+
+    def status(self):
+        return {name: dict(status) for name, status in self._status.items()}
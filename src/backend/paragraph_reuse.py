@@ -0,0 +1,134 @@
+"""
+Reuse of paragraph feedback across essays by embedding similarity.
+
+Class sets repeat themselves: shared prompts, quoted passages, boilerplate intros,
+the same essay submitted twice. Each graded paragraph's MiniLM embedding and its
+evaluation are kept in an index per criterion, keyed by the criterion's content (so
+an edited rubric or criterion starts a fresh index). A new paragraph whose cosine
+similarity to an already graded one reaches the threshold gets that paragraph's
+evaluation instead of an LLM call.
+
+Each index is a flat matrix of normalized embeddings, searched with one batched dot
+product per essay. Indexes are bounded: past `max_entries` rows, an index drops its
+least recently used rows, and past `max_indexes` criteria, the least recently used
+index is dropped. At the default bound of 5000 rows an exact search for a 12-paragraph
+essay takes about 3 ms per criterion on one CPU core, small next to one LLM call, so no
+approximate index is needed.
+"""
+
+import copy
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import telemetry
+
+lookups = telemetry.registry.counter(
+    "paragraph_reuse_lookups_total", "Paragraph evaluations looked up in the similarity index, by result (hit, miss).", ("result",)
+)
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class FeedbackIndex:
+    """Normalized embeddings of graded paragraphs and their evaluations, for one criterion."""
+
+    def __init__(self, dim, max_entries):
+        self.max_entries = max_entries
+        self.vectors = np.zeros((min(max_entries, 256), dim), dtype=np.float32)
+        self.feedback = []
+        self.last_used = np.zeros(len(self.vectors), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.feedback)
+
+    def search(self, vectors):
+        """(row, similarity) of the nearest entry for each of the (normalized) `vectors`."""
+        if not self.feedback:
+            return np.full(len(vectors), -1), np.full(len(vectors), -np.inf)
+        similarities = vectors @ self.vectors[:len(self.feedback)].T
+        rows = similarities.argmax(axis=1)
+        return rows, similarities[np.arange(len(vectors)), rows]
+
+    def add(self, vector, feedback, clock):
+        if len(self.feedback) < self.max_entries:
+            row = len(self.feedback)
+            if row == len(self.vectors):
+                grown = min(self.max_entries, 2 * len(self.vectors))
+                self.vectors = np.resize(self.vectors, (grown, self.vectors.shape[1]))
+                self.last_used = np.resize(self.last_used, grown)
+            self.feedback.append(feedback)
+        else:
+            row = int(self.last_used.argmin())  # evict the least recently used entry
+            self.feedback[row] = feedback
+        self.vectors[row] = vector
+        self.last_used[row] = clock
+
+
+class ParagraphReuse:
+    def __init__(self, threshold=0.97, max_entries=5000, max_indexes=64):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_indexes = max_indexes
+        self._indexes = OrderedDict()  # criterion key -> FeedbackIndex
+        self._lock = threading.Lock()
+        self._clock = 0
+        self._stats = {"hits": 0, "misses": 0, "added": 0, "evicted_indexes": 0}
+
+    def lookup(self, key, vectors, indices):
+        """
+        {paragraph index: evaluation} for the paragraphs in `indices` whose embedding
+        (row of `vectors`) is within the threshold of an already graded paragraph.
+        """
+        if not indices:
+            return {}
+        queries = normalize_rows(np.asarray(vectors)[indices])
+        found = {}
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                rows, similarities = index.search(queries)
+                self._clock += 1
+                for idx, row, similarity in zip(indices, rows, similarities):
+                    if similarity >= self.threshold:
+                        index.last_used[row] = self._clock
+                        found[idx] = index.feedback[row]
+            self._stats["hits"] += len(found)
+            self._stats["misses"] += len(indices) - len(found)
+        lookups.inc(len(found), result="hit")
+        lookups.inc(len(indices) - len(found), result="miss")
+
+        reused = {}
+        for idx, feedback in found.items():
+            reused[idx] = copy.deepcopy(feedback)
+            reused[idx]["paragraph"] = idx + 1
+        return reused
+
+    def add(self, key, vector, feedback):
+        """Indexes one graded paragraph; evaluations without a score (errors) are not kept."""
+        if not isinstance(feedback, dict) or feedback.get("score") is None:
+            return
+        vector = normalize_rows([vector])[0]
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = FeedbackIndex(len(vector), self.max_entries)
+                if len(self._indexes) > self.max_indexes:
+                    self._indexes.popitem(last=False)
+                    self._stats["evicted_indexes"] += 1
+            self._indexes.move_to_end(key)
+            self._clock += 1
+            index.add(vector, copy.deepcopy(feedback), self._clock)
+            self._stats["added"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, indexes=len(self._indexes), entries=sum(len(index) for index in self._indexes.values()))
+        looked_up = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / looked_up if looked_up else 0.0
+        return stats
@@ -0,0 +1,77 @@
+"""
+Fixed projection basis for the structured summary's "dominant features".
+
+The basis is fitted once, offline, on paragraph vectors from a reference corpus,
+and stored as a small .npz file (mean and principal axes). At request time,
+reducing an essay is a single matrix multiply. Component k then means the same
+thing in every essay and every request.
+
+Refit from a directory of essays (.txt, .docx, .pdf), run from src/backend:
+    python projection.py --essays-dir path/to/essays --output projection_basis.npz
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+
+class ProjectionBasis:
+    def __init__(self, mean, components, model=None):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)  # (k, dim), orthonormal rows
+        self.model = model
+
+    @property
+    def dim(self):
+        return self.components.shape[1]
+
+    def project(self, vectors):
+        return (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.components.T
+
+    def save(self, path):
+        np.savez(path, mean=self.mean, components=self.components, model=np.array(self.model or ""))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["mean"], data["components"], str(data["model"]) or None)
+
+
+def fit_basis(vectors, n_components=5, model=None):
+    """Principal axes of `vectors` (n, dim). Signs are fixed so each axis' largest loading is positive."""
+    vectors = np.asarray(vectors, dtype=np.float64)
+    if len(vectors) < n_components:
+        raise ValueError(f"Need at least {n_components} vectors to fit {n_components} components, got {len(vectors)}")
+    mean = vectors.mean(axis=0)
+    _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+    components = vt[:n_components]
+    signs = np.sign(components[np.arange(n_components), np.abs(components).argmax(axis=1)])
+    return ProjectionBasis(mean, components * signs[:, None], model)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays-dir", required=True)
+    parser.add_argument("--output", default="projection_basis.npz")
+    parser.add_argument("--components", type=int, default=5)
+    args = parser.parse_args()
+
+    import app
+
+    vectors = []
+    for filename in sorted(os.listdir(args.essays_dir)):
+        if os.path.splitext(filename)[1].lower() not in (".txt", ".docx", ".pdf"):
+            continue
+        paragraphs = app.split_paragraphs(app.convert_to_text(os.path.join(args.essays_dir, filename)))
+        if paragraphs:
+            vectors.extend(app.combined_paragraph_vectors(paragraphs))
+            print(f"{filename}: {len(paragraphs)} paragraphs")
+
+    basis = fit_basis(vectors, args.components, model=app.longformer_name)
+    basis.save(args.output)
+    print(f"Fitted {args.components} components on {len(vectors)} paragraph vectors -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
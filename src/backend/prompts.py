@@ -0,0 +1,180 @@
+"""
+Token-aware prompt building.
+
+Tokens are counted locally with tiktoken (pinned in requirements.txt); without
+it, or offline before its encoding files are cached, they are estimated as
+characters / 4. Counts are memoized by text hash, so the
+same prompt is tokenized once however many times a call is priced and recorded.
+
+A PromptBuilder assembles a prompt from sections in the order they are added.
+Callers add the static parts first (instructions, rubric, theme), so that calls
+which differ only in their paragraph share a long identical prefix the
+provider's prompt cache can reuse. Every model has a prompt budget. When a
+prompt is over it, optional sections are dropped (lowest value first), then
+trimmable sections are cut down.
+
+TokenUsage totals prompt, cached and completion tokens per pipeline stage.
+"""
+
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Context windows of the models the pipeline calls; unknown models are assumed to be large
+MODEL_CONTEXT_WINDOWS = {"gpt-4": 8192, "gpt-4o": 128000, "gpt-4o-mini": 128000}
+
+REQUIRED = None  # priority of sections that are never dropped
+
+TOKEN_COUNT_CACHE_SIZE = 4096
+_token_counts = OrderedDict()  # (model, len, hash) of a text -> its token count
+_token_counts_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:  # the encoding files are downloaded on first use
+        logger.warning("Could not load the tiktoken encoding for %s, estimating tokens instead: %s", model, e)
+        return None
+
+
+def count_tokens(text, model="gpt-4o"):
+    encoding = get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    key = (model, len(text), hash(text))
+    with _token_counts_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            return count
+    count = len(encoding.encode(text, disallowed_special=()))
+    with _token_counts_lock:
+        _token_counts[key] = count
+        if len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return count
+
+
+def count_message_tokens(messages, model="gpt-4o"):
+    """Prompt tokens of a chat request: the content plus a few tokens of framing per message."""
+    return sum(count_tokens(message.get("content") or "", model) + 4 for message in messages) + 3
+
+
+def truncate_to_tokens(text, max_tokens, model="gpt-4o"):
+    """Cuts `text` to at most `max_tokens` tokens, marking the cut with "..."."""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text if len(text) <= max_tokens * 4 else text[:max(0, max_tokens * 4 - 3)] + "..."
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max(0, max_tokens - 1)]) + "..."
+
+
+def prompt_budget(model, max_tokens=0, budgets=None):
+    """
+    Prompt tokens allowed for `model`: its context window less the completion allowance,
+    capped by `budgets[model]` when given.
+    """
+    budget = MODEL_CONTEXT_WINDOWS.get(model, 128000) - (max_tokens or 0)
+    if budgets and model in budgets:
+        budget = min(budget, budgets[model])
+    return budget
+
+
+class PromptBuilder:
+    def __init__(self, model, budget=None):
+        self.model = model
+        self.budget = budget
+        self.dropped = []  # names of the sections left out or cut to fit the budget
+        self._sections = []
+
+    def add(self, text, priority=REQUIRED, trim=False, name=None):
+        """
+        Appends a section. Optional sections (`priority` set) are dropped, lowest priority
+        first, when over budget; `trim=True` sections may then be cut down.
+        """
+        self._sections.append({"text": text, "priority": priority, "trim": trim, "name": name or text[:40]})
+        return self
+
+    def render(self):
+        return "".join(section["text"] for section in self._sections)
+
+    def section_tokens(self, section):
+        if "tokens" not in section:
+            section["tokens"] = count_tokens(section["text"], self.model)
+        return section["tokens"]
+
+    def tokens(self):
+        """The prompt's tokens, as the sum of its sections' (each counted once)."""
+        return sum(self.section_tokens(section) for section in self._sections)
+
+    def build(self, overhead=0):
+        """The prompt text, fitted to the budget less `overhead` tokens (e.g. the system message)."""
+        if self.budget is None:
+            return self.render()
+        limit = self.budget - overhead
+
+        for section in sorted((s for s in self._sections if s["priority"] is not None), key=lambda s: s["priority"]):
+            if self.tokens() <= limit:
+                break
+            self._sections.remove(section)
+            self.dropped.append(section["name"])
+
+        trimmable = sorted((s for s in self._sections if s["trim"]), key=lambda s: s["priority"] or 0)
+        for section in trimmable:
+            excess = self.tokens() - limit
+            if excess <= 0:
+                break
+            section["text"] = truncate_to_tokens(section["text"], self.section_tokens(section) - excess, self.model)
+            del section["tokens"]
+            self.dropped.append(f"{section['name']} (trimmed)")
+
+        if self.dropped:
+            logger.info("Prompt over the %s budget of %d tokens; left out: %s", self.model, limit, ", ".join(self.dropped))
+        return self.render()
+
+
+class TokenUsage:
+    """Per-stage totals of calls, prompt/cached/completion tokens and local prompt estimates."""
+
+    FIELDS = ("calls", "cache_hits", "prompt_tokens", "cached_tokens", "completion_tokens", "estimated_prompt_tokens")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = defaultdict(lambda: dict.fromkeys(self.FIELDS, 0))
+
+    def record(self, stage, usage=None, estimated_prompt_tokens=0, cache_hit=False):
+        """Adds one call's `usage` (a CompletionUsage, or None when the provider sent none)."""
+        details = getattr(usage, "prompt_tokens_details", None)
+        with self._lock:
+            totals = self._stages[stage or "other"]
+            if cache_hit:
+                totals["cache_hits"] += 1
+                return
+            totals["calls"] += 1
+            totals["estimated_prompt_tokens"] += estimated_prompt_tokens
+            if usage is not None:
+                totals["prompt_tokens"] += usage.prompt_tokens or 0
+                totals["completion_tokens"] += usage.completion_tokens or 0
+                totals["cached_tokens"] += (getattr(details, "cached_tokens", None) or 0)
+
+    def stats(self):
+        with self._lock:
+            return {stage: dict(totals) for stage, totals in self._stages.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
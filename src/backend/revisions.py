@@ -0,0 +1,166 @@
+"""
+Incremental re-grading of revised essays.
+
+Every analysis saves its grading state next to its result: the paragraphs, the
+theme, each criterion's rubric section, its per-paragraph feedback and the
+inputs of its final summary. A resubmission that names its previous analysis is
+aligned with it paragraph by paragraph. Paragraphs are matched exactly by a
+hash of their normalized text, and similar ones are paired as revisions. Those
+whose text changed, and those whose previous paragraph changed (the coherence
+context of a paragraph is its predecessor), are evaluated again.
+
+The other paragraphs keep their feedback only while their prompt is unchanged:
+each graded paragraph's prompt key (a hash of everything its evaluation prompt
+says about it but its number: theme, dominant feature, coherence issue, previous
+paragraph and text) is saved, and feedback is reused only when the new key
+matches. The dominant features come from the Longformer projection. With the
+offline basis (projection.py) they are stable across drafts; with the per-essay
+PCA fallback an edit can change them throughout the essay, and most paragraphs
+are then graded again. A criterion's final summary is requested again only when
+its inputs differ, not counting the dominant features, which it only uses as
+low-priority context.
+"""
+
+import copy
+import difflib
+import hashlib
+import json
+
+STATE_VERSION = 2
+
+
+def normalize(paragraph):
+    return " ".join(paragraph.split())
+
+
+def paragraph_hash(paragraph):
+    return hashlib.sha256(normalize(paragraph).encode("utf-8")).hexdigest()[:16]
+
+
+def content_key(value):
+    """Stable hash of any JSON-serializable value (rubric sections, summary requests)."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def align_paragraphs(old, new, min_similarity=0.6):
+    """
+    Matches the paragraphs of `new` to those of `old`. Returns one (old index or None,
+    kind) pair per new paragraph, where kind is "same" (identical up to whitespace),
+    "revised" (paired with a similar old paragraph) or "new".
+    """
+    old_hashes = [paragraph_hash(p) for p in old]
+    new_hashes = [paragraph_hash(p) for p in new]
+    matches = [(None, "new")] * len(new)
+
+    matcher = difflib.SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(new_end - new_start):
+                matches[new_start + offset] = (old_start + offset, "same")
+        elif tag == "replace":
+            # Pair each new paragraph in the block with the most similar unpaired old one, in order
+            candidates = list(range(old_start, old_end))
+            for j in range(new_start, new_end):
+                scored = [(difflib.SequenceMatcher(None, normalize(old[i]), normalize(new[j])).ratio(), i) for i in candidates]
+                if scored:
+                    similarity, i = max(scored)
+                    if similarity >= min_similarity:
+                        matches[j] = (i, "revised")
+                        candidates = [c for c in candidates if c > i]
+    return matches
+
+
+class RevisionPlan:
+    """How a resubmission relates to its previous analysis, and what must be graded again."""
+
+    def __init__(self, old_paragraphs, new_paragraphs, min_similarity=0.6):
+        self.matches = align_paragraphs(old_paragraphs, new_paragraphs, min_similarity)
+        self.removed = sorted(set(range(len(old_paragraphs))) - {i for i, _ in self.matches if i is not None})
+        self.reevaluate = set()
+        for j, (i, kind) in enumerate(self.matches):
+            previous_unchanged = (i == 0) if j == 0 else (
+                i is not None and i > 0 and self.matches[j - 1] == (i - 1, "same")
+            )
+            if kind != "same" or not previous_unchanged:
+                self.reevaluate.add(j)
+
+    @property
+    def changed_share(self):
+        return len(self.reevaluate) / len(self.matches) if self.matches else 1.0
+
+    def reused(self, j):
+        """Index of the previous paragraph whose feedback paragraph `j` keeps, or None."""
+        return None if j in self.reevaluate else self.matches[j][0]
+
+    def summary(self):
+        kinds = [kind for _, kind in self.matches]
+        return {
+            "unchanged": kinds.count("same"),
+            "revised": kinds.count("revised"),
+            "added": kinds.count("new"),
+            "removed": len(self.removed),
+            "reevaluated": sorted(j + 1 for j in self.reevaluate),
+        }
+
+
+class Revision:
+    """Serves the reusable parts of a previous analysis' state to a new grading run."""
+
+    def __init__(self, state, plan):
+        self.state = state
+        self.plan = plan
+
+    def reusable_feedback(self, criterion_name, section, prompt_keys):
+        """
+        {new paragraph index: feedback} kept from the previous run of this criterion, for
+        the paragraphs whose prompt key (`prompt_keys`, one per new paragraph) is unchanged.
+        """
+        previous = self.state["criteria"].get(criterion_name)
+        previous_keys = self.state.get("prompt_keys")
+        if previous is None or previous_keys is None or previous["section"] != content_key(section):
+            return {}
+        reused = {}
+        for j in range(len(self.plan.matches)):
+            i = self.plan.reused(j)
+            if i is None or i >= len(previous_keys) or previous_keys[i] != prompt_keys[j]:
+                continue
+            if i < len(previous["feedback"]) and previous["feedback"][i] is not None:
+                feedback = copy.deepcopy(previous["feedback"][i])
+                if isinstance(feedback, dict):
+                    feedback["paragraph"] = j + 1
+                reused[j] = feedback
+        return reused
+
+    def reusable_summary(self, criterion_name, summary_key):
+        previous = self.state["criteria"].get(criterion_name)
+        if previous is not None and previous["summary_key"] == summary_key:
+            return previous["final_summary"]
+        return None
+
+
+class GradingRecord:
+    """Collects the grading state of one analysis as its criteria finish (thread-safe per criterion)."""
+
+    def __init__(self, meta_result, mode, prompt_keys):
+        self.meta_result = meta_result
+        self.mode = mode
+        self.prompt_keys = prompt_keys  # one per paragraph, see Revision.reusable_feedback
+        self.criteria = {}
+
+    def add_criterion(self, name, section, feedback, summary_key, final_summary):
+        self.criteria[name] = {
+            "section": content_key(section),
+            "feedback": feedback,
+            "summary_key": summary_key,
+            "final_summary": final_summary,
+        }
+
+    def state(self):
+        return {
+            "version": STATE_VERSION,
+            "mode": self.mode,
+            "paragraphs": self.meta_result["paragraphs"],
+            "theme": self.meta_result["gpt_summary"],
+            "prompt_keys": self.prompt_keys,
+            "criteria": self.criteria,
+        }
@@ -0,0 +1,163 @@
+"""
+Rubric library persisted in SQLite.
+
+A rubric is uploaded (or posted as structured JSON) once, parsed and validated,
+and stored under a stable ID. Uploading it again creates a new version. Versions
+are immutable: analyses name a rubric ID and optionally a version, and get the
+latest version otherwise. Each version stores its validated "Criteria" JSON and
+every criterion's compiled prompt fragments (formatted rubric, score range). An
+analysis that names a library rubric therefore skips file conversion, the LLM
+rubric parse and criterion compilation.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class RubricInvalid(ValueError):
+    """A rubric whose criteria are missing or malformed."""
+
+
+class RubricNotFound(LookupError):
+    def __init__(self, rubric_id, version=None):
+        super().__init__(f"Unknown rubric {rubric_id}" + (f" version {version}" if version is not None else ""))
+
+
+def validate_criteria(criteria):
+    """
+    Checks a parsed "Criteria" list: at least one criterion, unique non-empty names,
+    and at least one score level per criterion with a description and a numeric Value.
+    """
+    if not isinstance(criteria, list) or not criteria:
+        raise RubricInvalid("The rubric has no criteria")
+    names = set()
+    for position, criterion in enumerate(criteria, 1):
+        name = criterion.get("Name") if isinstance(criterion, dict) else None
+        if not isinstance(name, str) or not name.strip():
+            raise RubricInvalid(f"Criterion {position} has no name")
+        if name.strip().casefold() in names:
+            raise RubricInvalid(f"Criterion name {name!r} is used twice")
+        names.add(name.strip().casefold())
+        scores = criterion.get("Scores")
+        if not isinstance(scores, list) or not scores:
+            raise RubricInvalid(f"Criterion {name!r} has no score levels")
+        for score in scores:
+            if not isinstance(score, dict):
+                raise RubricInvalid(f"Criterion {name!r} has a malformed score level")
+            if score.get("Score") == "Error":
+                # rubric_error_json's placeholder: the parse itself failed
+                raise RubricInvalid(f"The rubric could not be parsed: {score.get('Description')}")
+            if not isinstance(score.get("Value"), (int, float)) or not score.get("Description"):
+                raise RubricInvalid(f"Criterion {name!r} has a score level without a Description or numeric Value")
+
+
+class RubricStore:
+    def __init__(self, path, cache_size=256):
+        self.path = path
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # (rubric_id, version) -> version dict; versions never change
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rubrics ("
+            " id TEXT PRIMARY KEY, name TEXT NOT NULL, latest_version INTEGER NOT NULL,"
+            " created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rubric_versions ("
+            " rubric_id TEXT NOT NULL, version INTEGER NOT NULL, source_text TEXT, criteria TEXT NOT NULL,"
+            " compiled TEXT NOT NULL, created REAL NOT NULL, PRIMARY KEY (rubric_id, version))"
+        )
+
+    def create(self, name, criteria, compiled, source_text=None):
+        """Stores a new rubric as version 1 and returns its ID."""
+        rubric_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "INSERT INTO rubrics (id, name, latest_version, created, updated) VALUES (?, ?, 1, ?, ?)",
+                (rubric_id, name, now, now),
+            )
+            self._insert_version(rubric_id, 1, criteria, compiled, source_text, now)
+            self._db.execute("COMMIT")
+        return rubric_id
+
+    def add_version(self, rubric_id, criteria, compiled, source_text=None):
+        """Stores a new version of an existing rubric and returns its number."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN")
+            row = self._db.execute("SELECT latest_version FROM rubrics WHERE id = ?", (rubric_id,)).fetchone()
+            if row is None:
+                self._db.execute("ROLLBACK")
+                raise RubricNotFound(rubric_id)
+            version = row[0] + 1
+            self._insert_version(rubric_id, version, criteria, compiled, source_text, now)
+            self._db.execute("UPDATE rubrics SET latest_version = ?, updated = ? WHERE id = ?", (version, now, rubric_id))
+            self._db.execute("COMMIT")
+        return version
+
+    def _insert_version(self, rubric_id, version, criteria, compiled, source_text, now):
+        self._db.execute(
+            "INSERT INTO rubric_versions (rubric_id, version, source_text, criteria, compiled, created) VALUES (?, ?, ?, ?, ?, ?)",
+            (rubric_id, version, source_text, json.dumps(criteria), json.dumps(compiled), now),
+        )
+
+    def get(self, rubric_id, version=None):
+        """
+        A version of a rubric (the latest by default) as a dict with id, name, version,
+        criteria and compiled ({criterion name: compiled fragments}). Raises RubricNotFound.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT name, latest_version FROM rubrics WHERE id = ?", (rubric_id,)).fetchone()
+            if row is None:
+                raise RubricNotFound(rubric_id)
+            name, latest = row
+            try:
+                version = latest if version is None else int(version)
+            except (TypeError, ValueError):
+                raise RubricNotFound(rubric_id, version)
+            key = (rubric_id, version)
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return dict(self._cache[key], name=name, latest_version=latest)
+
+            row = self._db.execute(
+                "SELECT criteria, compiled, created FROM rubric_versions WHERE rubric_id = ? AND version = ?", key
+            ).fetchone()
+            if row is None:
+                raise RubricNotFound(rubric_id, version)
+            rubric = {
+                "id": rubric_id,
+                "name": name,
+                "version": version,
+                "latest_version": latest,
+                "criteria": json.loads(row[0]),
+                "compiled": json.loads(row[1]),
+                "created": row[2],
+            }
+            self._cache[key] = rubric
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return rubric
+
+    def list(self):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, name, latest_version, created, updated FROM rubrics ORDER BY updated DESC"
+            ).fetchall()
+        return [
+            {"id": rubric_id, "name": name, "latest_version": latest, "created": created, "updated": updated}
+            for rubric_id, name, latest, created, updated in rows
+        ]
@@ -0,0 +1,162 @@
+"""
+Local paragraph segmentation.
+
+The document's own structure comes first. That means blank-line separated
+blocks (PDF and TXT), or one paragraph per line when every line reads like a
+full paragraph (DOCX). Blocks broken by a page boundary are joined back
+together. Text with no usable structure, and structural blocks that are too
+long, are split at topic shifts: sentence embeddings are compared across a
+sliding window, and boundaries go where similarity dips deepest (TextTiling
+with embeddings).
+"""
+
+import re
+
+import numpy as np
+
+SENTENCE_END = re.compile(r"""[.!?]["'”’)\]]*$""")
+SENTENCE_SPLIT = re.compile(r"""(?<=[.!?])["'”’)\]]*\s+(?=["'“‘(\[]?[A-Z0-9])""")
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_SPLIT.split(text.strip()) if sentence.strip()]
+
+
+def is_heading(line):
+    return len(line.split()) <= 8 and not SENTENCE_END.search(line)
+
+
+def join_lines(lines):
+    """Undoes hard wraps: lines of one block become a single space-separated paragraph."""
+    return re.sub(r"\s+", " ", " ".join(lines)).strip()
+
+
+def structural_paragraphs(text):
+    """
+    Paragraphs taken from the text's own layout, or None when it has none (a single
+    block of hard-wrapped or unbroken text).
+    """
+    blocks = [block for block in re.split(r"\n\s*\n", text.strip()) if block.strip()]
+    if len(blocks) > 1:
+        paragraphs = [join_lines(block.splitlines()) for block in blocks]
+    else:
+        # One paragraph per line (e.g. DOCX) only if lines end like sentences, not mid-sentence like hard wraps
+        lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
+        body = [line for line in lines if not is_heading(line)]
+        if len(body) < 2 or sum(bool(SENTENCE_END.search(line)) for line in body) < 0.8 * len(body):
+            return None
+        paragraphs = lines
+
+    merged = []
+    for paragraph in paragraphs:
+        if merged and (is_heading(merged[-1]) or (not SENTENCE_END.search(merged[-1]) and paragraph[:1].islower())):
+            # Headings stay with the paragraph they introduce; a lowercase start continues across a page break
+            separator = "\n" if is_heading(merged[-1]) else " "
+            merged[-1] = merged[-1] + separator + paragraph
+        else:
+            merged.append(paragraph)
+    return merged
+
+
+def topic_boundaries(embeddings, min_sentences=3, max_sentences=10, window=3):
+    """
+    Returns the sentence indices that start a new paragraph, chosen where the
+    similarity between the `window` sentences on each side dips deepest. Every
+    paragraph gets between `min_sentences` and `max_sentences` sentences where possible.
+    """
+    count = len(embeddings)
+    if count < 2 * min_sentences:
+        return []
+
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+    similarity = np.ones(count)  # similarity[i]: across the gap before sentence i
+    for i in range(1, count):
+        left = embeddings[max(0, i - window):i].mean(axis=0)
+        right = embeddings[i:i + window].mean(axis=0)
+        similarity[i] = float(left @ right) / max(float(np.linalg.norm(left) * np.linalg.norm(right)), 1e-12)
+
+    # Depth of each dip relative to the nearest peaks on both sides
+    depth = np.zeros(count)
+    for i in range(1, count):
+        left_peak = similarity[i]
+        for j in range(i - 1, 0, -1):
+            if similarity[j] < left_peak:
+                break
+            left_peak = similarity[j]
+        right_peak = similarity[i]
+        for j in range(i + 1, count):
+            if similarity[j] < right_peak:
+                break
+            right_peak = similarity[j]
+        depth[i] = (left_peak - similarity[i]) + (right_peak - similarity[i])
+
+    gaps = depth[1:]
+    threshold = gaps.mean() + 0.5 * gaps.std()
+    boundaries = []
+
+    def fits(i):
+        points = sorted([0, count, *boundaries, i])
+        k = points.index(i)
+        return i - points[k - 1] >= min_sentences and points[k + 1] - i >= min_sentences
+
+    for i in sorted(range(1, count), key=lambda i: -depth[i]):
+        if depth[i] >= threshold and fits(i):
+            boundaries.append(i)
+
+    # Split anything still longer than max_sentences at its deepest admissible gap
+    changed = True
+    while changed:
+        changed = False
+        points = sorted([0, count, *boundaries])
+        for start, end in zip(points, points[1:]):
+            if end - start > max_sentences:
+                candidates = [i for i in range(start + min_sentences, end - min_sentences + 1)]
+                if candidates:
+                    boundaries.append(max(candidates, key=lambda i: depth[i]))
+                    changed = True
+                    break
+
+    return sorted(boundaries)
+
+
+def segment_by_topic(text, encode, min_sentences=3, max_sentences=10):
+    sentences = split_sentences(join_lines(text.splitlines()))
+    if len(sentences) <= max_sentences:
+        return [" ".join(sentences)] if sentences else []
+    boundaries = topic_boundaries(encode(sentences), min_sentences, max_sentences)
+    points = [0, *boundaries, len(sentences)]
+    return [" ".join(sentences[start:end]) for start, end in zip(points, points[1:])]
+
+
+def segment_paragraphs(text, encode=None, min_sentences=3, max_sentences=10):
+    """
+    Splits `text` into paragraphs without an LLM.
+
+    Args:
+        encode (callable, optional): Sentence embedder (list of str -> array). Without it,
+            only the document structure is used.
+
+    Returns:
+        tuple: (paragraphs, method) where method is "structure", "topic" or "structure+topic";
+            (None, None) when the text has no structure and no `encode` was given.
+    """
+    blocks = structural_paragraphs(text)
+    if blocks is None:
+        if encode is None:
+            return None, None
+        return segment_by_topic(text, encode, min_sentences, max_sentences), "topic"
+
+    if encode is None:
+        return blocks, "structure"
+
+    paragraphs, split_any = [], False
+    for block in blocks:
+        if len(split_sentences(block)) > 2 * max_sentences:
+            # Structure that leaves a block this long (e.g. one per PDF page) is not paragraph structure
+            paragraphs.extend(segment_by_topic(block, encode, min_sentences, max_sentences))
+            split_any = True
+        else:
+            paragraphs.append(block)
+    return paragraphs, "structure+topic" if split_any else "structure"
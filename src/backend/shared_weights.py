@@ -0,0 +1,90 @@
+"""
+Encoder weights shared between worker processes.
+
+With SHARED_WEIGHTS_DIR set, each model's tensors are exported once to a file in
+that directory. Every worker then memory-maps the file (torch.load(mmap=True))
+and assigns the mapped tensors to its module (load_state_dict(assign=True)). The
+weight pages live once in the OS page cache and are shared by every worker on
+the box, instead of each worker holding a private copy.
+
+    SHARED_WEIGHTS_DIR=/var/cache/essay-weights uvicorn asgi:app --workers 8
+
+The export happens on first load; run `python shared_weights.py` once before
+starting the workers to avoid them racing to write it. Sharing only applies to
+CPU inference, because moving a model to a GPU copies it into device memory,
+and not to the int8 backend, which app.py refuses to combine with it because
+quantizing copies the weights into each worker.
+"""
+
+import logging
+import os
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def weights_path(directory, name):
+    return os.path.join(directory, f"{name}.pt")
+
+
+def export_weights(module, path):
+    """Writes every parameter and buffer (including non-persistent ones) of `module` to `path` atomically."""
+    tensors = dict(module.state_dict())
+    tensors.update((name, buffer) for name, buffer in module.named_buffers() if name not in tensors)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    torch.save({name: tensor.detach().cpu().contiguous() for name, tensor in tensors.items()}, temp_path)
+    os.replace(temp_path, path)
+
+
+def load_shared_weights(module, path):
+    """Replaces `module`'s parameters and buffers with tensors memory-mapped from `path`."""
+    tensors = torch.load(path, mmap=True, weights_only=True, map_location="cpu")
+    state_keys = set(module.state_dict())
+    module.load_state_dict({name: tensors[name] for name in state_keys}, strict=True, assign=True)
+
+    # Non-persistent buffers (e.g. position_ids) are not part of the state dict
+    for name, tensor in tensors.items():
+        if name not in state_keys:
+            owner_name, _, buffer_name = name.rpartition(".")
+            setattr(module.get_submodule(owner_name), buffer_name, tensor)
+
+    missing = [name for name, tensor in [*module.named_parameters(), *module.named_buffers()] if tensor.is_meta]
+    if missing:
+        raise RuntimeError(f"{path} has no weights for {missing[:5]}")
+    return module
+
+
+def load_shared_module(directory, name, load_pretrained, build_empty=None):
+    """
+    Returns module `name` backed by memory-mapped weights in `directory`.
+
+    `load_pretrained()` loads the model normally; it is used to export the weights
+    the first time. `build_empty()` builds the same architecture without loading
+    weights. It runs on the meta device, so no memory is allocated before the
+    mapped tensors are assigned. Without it, `load_pretrained()` is used, and its
+    private copy is released as soon as the mapped tensors replace it.
+    """
+    path = weights_path(directory, name)
+    if not os.path.exists(path):
+        module = load_pretrained()
+        export_weights(module, path)
+        logger.info("Exported %s weights to %s", name, path)
+    elif build_empty is not None:
+        with torch.device("meta"):
+            module = build_empty()
+    else:
+        module = load_pretrained()
+    return load_shared_weights(module, path)
+
+
+if __name__ == "__main__":
+    import app
+
+    if not app.SHARED_WEIGHTS_DIR:
+        raise SystemExit("Set SHARED_WEIGHTS_DIR to the directory the workers will read weights from")
+    app.model_registry.warmup()
+    print(app.model_registry.status())
@@ -0,0 +1,286 @@
+"""
+Structured (JSON) replies from the LLM: schemas, tolerant parsing and repair.
+
+Each JSON reply the pipeline expects has a schema here. Requests to models that
+support Structured Outputs carry it as a strict `json_schema` response format;
+models with only JSON mode get `json_object`; others (gpt-4) get neither and rely
+on the prompt. Replies are parsed tolerantly: a markdown fence or prose around the
+object is stripped, and the result is checked against the schema.
+
+A reply that is not valid JSON (truncated at max_tokens, a broken quote) is not thrown
+away. It is sent with the schema and the problem to a cheap model in one targeted
+repair call, which returns the fixed object. Repair only fixes syntax: the repair
+model never sees the paragraph or the rubric, so a reply that parses but lacks a
+field (a score above all) is never sent, and a repaired reply whose scores are not
+the ones in the original text is rejected. Every parse is counted per stage in
+`llm_structured_outputs_total` by result: ok, extracted (needed tolerant parsing),
+repaired or failed.
+"""
+
+import json
+import logging
+import os
+import re
+
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+parse_results = telemetry.registry.counter(
+    "llm_structured_outputs_total",
+    "JSON replies by stage and parse result (ok, extracted, repaired, failed).",
+    ("stage", "result"),
+)
+
+# Models (by name prefix) that accept a strict json_schema response format, or only JSON mode
+JSON_SCHEMA_MODELS = tuple(filter(None, os.getenv("LLM_JSON_SCHEMA_MODELS", "gpt-4o,gpt-4.1,o1,o3,o4").split(",")))
+JSON_MODE_MODELS = ("gpt-4-turbo", "gpt-4-1106", "gpt-4-0125", "gpt-3.5-turbo")
+# Repair calls go to this model; STRUCTURED_OUTPUT_REPAIR=0 turns them off
+REPAIR_MODEL = os.getenv("STRUCTURED_OUTPUT_REPAIR_MODEL", "gpt-4o-mini")
+REPAIR_ENABLED = os.getenv("STRUCTURED_OUTPUT_REPAIR", "1") == "1"
+REPAIR_MAX_TOKENS = 16000
+
+PARAGRAPH_EVALUATION = {
+    "type": "object",
+    "properties": {
+        "paragraph": {"type": "integer"},
+        "criterion": {"type": "string"},
+        "score": {"type": "number"},
+        "feedback": {"type": "string"},
+        "suggestions": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["paragraph", "criterion", "score", "feedback", "suggestions"],
+    "additionalProperties": False,
+}
+
+SCHEMAS = {
+    "paragraph_evaluation": PARAGRAPH_EVALUATION,
+    "multi_criterion_evaluation": {
+        "type": "object",
+        "properties": {"evaluations": {"type": "array", "items": PARAGRAPH_EVALUATION}},
+        "required": ["evaluations"],
+        "additionalProperties": False,
+    },
+    "criterion_summary": {
+        "type": "object",
+        "properties": {
+            "criterion": {"type": "string"},
+            "summary_feedback": {"type": "string"},
+        },
+        "required": ["criterion", "summary_feedback"],
+        "additionalProperties": False,
+    },
+}
+
+# Strict schemas must require every field; a reply is accepted with just the fields the
+# pipeline cannot do without (a missing "suggestions" list is not worth a repair call)
+ACCEPTED = {
+    "paragraph_evaluation": dict(PARAGRAPH_EVALUATION, required=["score", "feedback"]),
+    "multi_criterion_evaluation": dict(SCHEMAS["multi_criterion_evaluation"], properties={
+        "evaluations": {"type": "array", "items": dict(PARAGRAPH_EVALUATION, required=["paragraph", "criterion", "score", "feedback"])},
+    }),
+    "criterion_summary": dict(SCHEMAS["criterion_summary"], required=["summary_feedback"]),
+}
+
+FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+SCORE = re.compile(r'"score"\s*:\s*(-?\d+(?:\.\d+)?)')
+
+
+class StructuredOutputError(ValueError):
+    """A reply that is not valid JSON for its schema."""
+
+
+class SchemaMismatchError(StructuredOutputError):
+    """A reply that is valid JSON but lacks a field or has one of the wrong type; not repairable."""
+
+
+def response_format(model, name):
+    """The response_format for schema `name` on `model`, or None if the model supports neither kind."""
+    if model.startswith(JSON_SCHEMA_MODELS):
+        return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": SCHEMAS[name]}}
+    if model.startswith(JSON_MODE_MODELS):
+        return {"type": "json_object"}
+    return None
+
+
+def with_response_format(params, name):
+    """Request `params` with the response format for schema `name` added, where the model supports one."""
+    fmt = response_format(params["model"], name)
+    return dict(params, response_format=fmt) if fmt is not None else params
+
+
+def schema_problem(value, schema, path="reply"):
+    """A description of the first way `value` breaks `schema`, or None if it fits."""
+    kind = schema.get("type")
+    if kind == "object":
+        if not isinstance(value, dict):
+            return f"{path} is not an object"
+        for key in schema.get("required", ()):
+            if value.get(key) is None:
+                return f"{path} has no {key!r}"
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                problem = schema_problem(value[key], subschema, f"{path}.{key}")
+                if problem:
+                    return problem
+    elif kind == "array":
+        if not isinstance(value, list):
+            return f"{path} is not an array"
+        for i, item in enumerate(value):
+            problem = schema_problem(item, schema.get("items", {}), f"{path}[{i}]")
+            if problem:
+                return problem
+    elif kind == "string" and not isinstance(value, str):
+        return f"{path} is not a string"
+    elif kind in ("number", "integer"):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return f"{path} is not a number"
+        if kind == "integer" and value != int(value):
+            return f"{path} is not an integer"
+    return None
+
+
+def extract_json(text):
+    """
+    The JSON object in `text`, and "ok" if the text was exactly that object or "extracted"
+    if it had to be found inside a markdown fence or surrounding prose.
+    """
+    text = (text or "").strip()
+    if not text:
+        raise StructuredOutputError("the reply is empty")
+    try:
+        return json.loads(text), "ok"
+    except ValueError:
+        pass
+
+    candidates = [match.group(1) for match in FENCE.finditer(text)] + [text]
+    decoder = json.JSONDecoder()
+    for candidate in candidates:
+        start = candidate.find("{")
+        for _ in range(20):  # a few false starts ("{" inside prose) at most
+            if start < 0:
+                break
+            try:
+                value, _ = decoder.raw_decode(candidate, start)
+                if isinstance(value, dict):
+                    return value, "extracted"
+            except ValueError:
+                pass
+            start = candidate.find("{", start + 1)
+    raise StructuredOutputError("the reply is not valid JSON")
+
+
+def loads(name, text, truncated=False):
+    """Parses and checks a reply against schema `name` (its ACCEPTED fields); returns (value, "ok" or "extracted")."""
+    try:
+        value, result = extract_json(text)
+    except StructuredOutputError:
+        if truncated:
+            raise StructuredOutputError("the reply was cut off at the token limit")
+        raise
+    problem = schema_problem(value, ACCEPTED[name])
+    if problem:
+        raise SchemaMismatchError(problem)
+    return value, result
+
+
+def scores(value):
+    """The scores in a parsed reply, in order."""
+    items = value.get("evaluations", [value]) if isinstance(value, dict) else []
+    return [float(item["score"]) for item in items if isinstance(item, dict) and item.get("score") is not None]
+
+
+def invented_scores(text, value):
+    """True if repaired `value` has scores that are not the ones written in the original `text`."""
+    return scores(value) != [float(score) for score in SCORE.findall(text or "")]
+
+
+def repair_request(name, text, problem):
+    """Chat completion parameters asking the repair model to fix one reply."""
+    prompt = f"""The text below was meant to be a single JSON object matching the JSON schema below, but {problem}.
+
+Return only the corrected JSON object. Keep all of its content and wording. If the text was cut off, finish the last sentence briefly and close the object. Do not add any value that is not in the text.
+
+### JSON schema:
+{json.dumps(SCHEMAS[name])}
+
+### Text:
+{text}
+"""
+    params = {
+        "model": REPAIR_MODEL,
+        "messages": [
+            {"role": "system", "content": "You fix malformed JSON. Reply with the JSON object only."},
+            {"role": "user", "content": prompt},
+        ],
+        "temperature": 0,
+        "max_tokens": min(REPAIR_MAX_TOKENS, len(text) // 3 + 300),  # room for the whole object again
+    }
+    return with_response_format(params, name)
+
+
+def parse_reply(name, stage, response, repair=None):
+    """
+    The JSON value of a chat completion `response` for schema `name`. A reply that is
+    not valid JSON is sent to `repair(params)` (which returns a completion) once.
+    Raises StructuredOutputError if that fails too, or SchemaMismatchError (without a
+    repair call) if the reply parses but does not fit.
+    """
+    value, pending = parse_or_request_repair(name, stage, response, repair is not None)
+    if pending is None:
+        return value
+    error, params = pending
+    try:
+        repaired = repair(params)
+    except Exception as repair_error:
+        raise repair_call_failed(stage, error, repair_error) from repair_error
+    return finish_repair(name, stage, error, response.choices[0].message.content, repaired)
+
+
+async def aparse_reply(name, stage, response, repair=None):
+    """parse_reply for async callers: `repair(params)` is awaited."""
+    value, pending = parse_or_request_repair(name, stage, response, repair is not None)
+    if pending is None:
+        return value
+    error, params = pending
+    try:
+        repaired = await repair(params)
+    except Exception as repair_error:
+        raise repair_call_failed(stage, error, repair_error) from repair_error
+    return finish_repair(name, stage, error, response.choices[0].message.content, repaired)
+
+
+def parse_or_request_repair(name, stage, response, can_repair):
+    """
+    The first half of parse_reply: returns (value, None) for a reply that parses, or
+    (None, (error, repair params)) for one worth a repair call. Raises otherwise.
+    """
+    choice = response.choices[0]
+    try:
+        value, result = loads(name, choice.message.content, choice.finish_reason == "length")
+    except StructuredOutputError as error:
+        if not can_repair or not REPAIR_ENABLED or isinstance(error, SchemaMismatchError):
+            parse_results.inc(stage=stage, result="failed")
+            raise
+        return None, (error, repair_request(name, choice.message.content, error))
+    parse_results.inc(stage=stage, result=result)
+    return value, None
+
+
+def repair_call_failed(stage, error, repair_error):
+    parse_results.inc(stage=stage, result="failed")
+    return StructuredOutputError(f"{error}; the repair call failed: {repair_error}")
+
+
+def finish_repair(name, stage, error, text, repaired):
+    try:
+        value, _ = loads(name, repaired.choices[0].message.content)
+    except StructuredOutputError as repair_error:
+        parse_results.inc(stage=stage, result="failed")
+        raise StructuredOutputError(f"{error}; the repaired reply is still invalid: {repair_error}")
+    if invented_scores(text, value):
+        parse_results.inc(stage=stage, result="failed")
+        raise StructuredOutputError(f"{error}; the repaired reply has scores that are not in the original")
+    logger.info("Repaired a %s reply (%s)", stage, error)
+    parse_results.inc(stage=stage, result="repaired")
+    return value
@@ -0,0 +1,290 @@
+"""
+Tracing spans, LLM token/cost accounting and Prometheus-style metrics.
+
+`span(name)` times a pipeline stage. It adds the duration to the
+`essay_stage_seconds` histogram, keeps the `essay_stage_in_flight` gauge current,
+counts failures, and logs one structured line per span at DEBUG on the
+"telemetry" logger. Spans carry a trace ID, which is the LLM scheduler's request
+ID when one is set, so every stage of one request shares it, across worker threads too.
+
+Metrics live in process memory and are rendered in the Prometheus text format
+by `render_metrics()` (served at GET /metrics).
+"""
+
+import asyncio
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger("telemetry")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# USD per 1M tokens: (input, cached input, output). Override or extend with
+# LLM_PRICES="gpt-4o=2.5/1.25/10,gpt-4o-mini=0.15/0.075/0.6"
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4": (30.00, 30.00, 60.00),
+}
+
+
+def parse_prices(spec):
+    prices = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            model, values = item.split("=", 1)
+            parts = [float(value) for value in values.split("/")]
+            if len(parts) == 2:
+                parts = [parts[0], parts[0], parts[1]]
+            prices[model.strip()] = tuple(parts)
+    return prices
+
+
+MODEL_PRICES.update(parse_prices(os.getenv("LLM_PRICES")))
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name, help, labels=(), callback=None):
+        """With `callback`, the gauge reads {label values tuple: value} from it at render time."""
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self):
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception as e:
+                logger.warning("Gauge %s callback failed: %s", self.name, e)
+                values = {}
+            with self._lock:
+                self._values = dict(values)
+        return super().render()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total:g}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), callback=None):
+        return self._add(Gauge(name, help, labels, callback))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram("essay_stage_seconds", "Duration of pipeline stages.", ("stage",))
+stage_in_flight = registry.gauge("essay_stage_in_flight", "Pipeline stages currently running.", ("stage",))
+stage_errors = registry.counter("essay_stage_errors_total", "Pipeline stages that raised.", ("stage",))
+llm_seconds = registry.histogram("llm_request_seconds", "LLM call latency, including scheduler queueing.", ("model", "stage"))
+llm_tokens = registry.counter("llm_tokens_total", "LLM tokens by model and type (prompt, cached, completion).", ("model", "type"))
+llm_cost = registry.counter("llm_cost_usd_total", "Estimated LLM spend in USD (see MODEL_PRICES).", ("model",))
+llm_response_cache_hits = registry.counter("llm_response_cache_hits_total", "LLM calls served from the response cache.", ("stage",))
+
+
+def render_metrics():
+    return registry.render()
+
+
+def record_llm_usage(model, usage):
+    """Adds one response's token usage, and its estimated cost, to the per-model counters."""
+    if usage is None:
+        return
+    prompt_tokens = usage.prompt_tokens or 0
+    completion_tokens = usage.completion_tokens or 0
+    cached_tokens = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None) or 0
+    llm_tokens.inc(prompt_tokens, model=model, type="prompt")
+    llm_tokens.inc(cached_tokens, model=model, type="cached")
+    llm_tokens.inc(completion_tokens, model=model, type="completion")
+
+    prices = MODEL_PRICES.get(model)
+    if prices is not None:
+        input_price, cached_price, output_price = prices
+        cost = ((prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1e6
+        llm_cost.inc(cost, model=model)
+
+
+# Tracing
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+_current_span = contextvars.ContextVar("span", default=None)
+_trace_id_source = None
+_span_ids = itertools.count(1)  # unique within the process, which is all a trace needs
+
+
+def set_trace_id_source(source):
+    """`source()` supplies the trace ID where none is set in the context (e.g. the scheduler's request ID)."""
+    global _trace_id_source
+    _trace_id_source = source
+
+
+def current_trace_id():
+    trace_id = _trace_id.get()
+    if trace_id is None and _trace_id_source is not None:
+        trace_id = _trace_id_source()
+    return trace_id
+
+
+@contextmanager
+def trace(trace_id=None):
+    """Sets the trace ID for spans in this context (e.g. one asyncio request)."""
+    token = _trace_id.set(trace_id or uuid.uuid4().hex)
+    try:
+        yield _trace_id.get()
+    finally:
+        _trace_id.reset(token)
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Times the enclosed block as pipeline stage `name`. The yielded dict can be given
+    more attributes for the log line (e.g. the method a stage ended up using).
+    """
+    span_id = next(_span_ids)
+    parent = _current_span.get()
+    token = _current_span.set(span_id)
+    stage_in_flight.inc(stage=name)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        error = e
+        stage_errors.inc(stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_in_flight.dec(stage=name)
+        stage_seconds.observe(elapsed, stage=name)
+        _current_span.reset(token)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps({
+                "span": name,
+                "trace": current_trace_id(),
+                "id": span_id,
+                "parent": parent,
+                "ms": round(elapsed * 1000, 2),
+                "error": repr(error) if error is not None else None,
+                **attributes,
+            }, default=str))
+
+
+def traced(name):
+    """Decorator form of `span(name)` for a function or coroutine function."""
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with span(name):
+                    return fn(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,19 @@
+"""
+Fast unit tests for the backend. Models and the OpenAI API are stubbed, so nothing
+is downloaded and no key is needed. Run from src/backend:
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings read when app.py is imported: no background work, no files left behind
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("MODEL_WARMUP", "lazy")
+os.environ.setdefault("LLM_CACHE_PATH", "")
+os.environ.setdefault("CHAT_DB_PATH", ":memory:")
+os.environ.setdefault("JOBS_DB_PATH", ":memory:")
+os.environ.setdefault("RUBRICS_DB_PATH", ":memory:")
+os.environ.setdefault("EMBEDDING_CACHE_DIR", "")
@@ -0,0 +1,39 @@
+import numpy as np
+
+import app
+from benchmarks.bench_evaluation import make_meta_result
+from benchmarks.stub_openai import StubOpenAI, make_rubric
+
+PARAGRAPHS = [f"Paragraph {i} of the essay makes one more point about memory." for i in range(4)]
+
+
+def failing(*args, **kwargs):
+    raise RuntimeError("boom")
+
+
+def test_criterion_resolves_when_result_handling_raises(monkeypatch):
+    monkeypatch.setattr(app, "llm_cache", None)
+    monkeypatch.setattr(app, "paragraph_vectors", lambda meta_result: np.eye(len(PARAGRAPHS), dtype=np.float32))
+    monkeypatch.setattr(app.paragraph_reuse, "lookup", lambda *args: {})
+    monkeypatch.setattr(app.paragraph_reuse, "add", failing)
+    section = make_rubric(1)["Criteria"][0]
+
+    future = app.submit_criterion_evaluation(section, make_meta_result(PARAGRAPHS), StubOpenAI(), on_event=failing)
+
+    assert future.result(timeout=10)["criterion"] == section["Name"]
+
+
+def test_a_failed_paragraph_evaluation_is_recorded_as_an_error(monkeypatch):
+    monkeypatch.setattr(app, "llm_cache", None)
+    monkeypatch.setattr(app, "PARAGRAPH_REUSE", False)
+    monkeypatch.setattr(app, "evaluate_paragraph", failing)
+    events = []
+
+    future = app.submit_criterion_evaluation(
+        make_rubric(1)["Criteria"][0], make_meta_result(PARAGRAPHS), StubOpenAI(),
+        on_event=lambda kind, payload: events.append(payload["feedback"]),
+    )
+
+    future.result(timeout=10)
+    assert sorted(item["paragraph"] for item in events) == [1, 2, 3, 4]
+    assert all(item["score"] is None for item in events)
@@ -0,0 +1,64 @@
+import io
+import zipfile
+
+import pytest
+
+from documents import DocumentConverter, UploadRejected, read_archive, read_limited
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def make_pdf(page_count):
+    """A minimal valid PDF with `page_count` blank pages."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % (3 + i) for i in range(page_count))
+        + b"] /Count %d >>" % page_count,
+    ] + [b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>"] * page_count
+    pdf, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return pdf
+
+
+def test_a_stream_just_over_the_limit_is_rejected():
+    assert read_limited(io.BytesIO(b"x" * 100), 100, chunk_size=7) == b"x" * 100
+    with pytest.raises(UploadRejected, match="essay.txt is larger than"):
+        read_limited(io.BytesIO(b"x" * 101), 100, name="essay.txt", chunk_size=7)
+
+
+def test_an_archive_expanding_past_the_total_limit_is_rejected():
+    data = make_zip({f"essay{i}.txt": b"a" * 400 for i in range(3)})  # compresses to far less than 1200 bytes
+    assert len(read_archive(data, max_bytes=500, max_files=10, max_total_bytes=1200)) == 3
+    with pytest.raises(UploadRejected, match="Archive expands to more than"):
+        read_archive(data, max_bytes=500, max_files=10, max_total_bytes=1000)
+
+
+def test_hidden_files_and_macos_metadata_are_skipped():
+    data = make_zip({
+        "essays/b.txt": b"second",
+        "essays/a.docx": b"first",
+        "essays/.hidden.txt": b"hidden",
+        "__MACOSX/essays/._a.docx": b"resource fork",
+        "essays/notes.md": b"unsupported",
+    })
+    assert read_archive(data, max_bytes=1000, max_files=2) == [("essays/a.docx", b"first"), ("essays/b.txt", b"second")]
+
+
+def test_a_pdf_over_the_page_limit_is_rejected():
+    pytest.importorskip("pdfplumber")
+    converter = DocumentConverter(max_pages=3)
+    assert converter.convert("essay.pdf", make_pdf(3)) == ""
+    with pytest.raises(UploadRejected, match="PDF has 4 pages; the limit is 3"):
+        converter.convert("essay.pdf", make_pdf(4))
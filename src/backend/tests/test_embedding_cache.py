@@ -0,0 +1,70 @@
+import numpy as np
+
+import app
+from embedding_cache import EmbeddingCache, embed_with_cache
+
+
+class CountingEncoder:
+    """An encode_fn that records the texts it is called with and returns a vector per text."""
+
+    def __init__(self, dim=4):
+        self.dim = dim
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(text)] + [i] * (self.dim - 1) for i, text in enumerate(texts)], dtype=np.float32)
+
+    @property
+    def encoded(self):
+        return sum(len(call) for call in self.calls)
+
+
+DRAFT = [f"Paragraph {i} of the first draft, with some words in it." for i in range(6)]
+
+
+def revised(paragraphs, index=3):
+    paragraphs = list(paragraphs)
+    paragraphs[index] += " A sentence added in the revision."
+    return paragraphs
+
+
+def test_revision_encodes_only_the_changed_paragraph():
+    cache, encode = EmbeddingCache(), CountingEncoder()
+    first = embed_with_cache(cache, "model", DRAFT, encode)
+    second = embed_with_cache(cache, "model", revised(DRAFT), encode)
+
+    assert encode.calls[1] == [revised(DRAFT)[3]]
+    assert second.shape == first.shape
+    assert np.array_equal(np.delete(second, 3, axis=0), np.delete(first, 3, axis=0))
+
+
+def test_duplicates_and_whitespace_variants_are_encoded_once():
+    cache, encode = EmbeddingCache(), CountingEncoder()
+    embed_with_cache(cache, "model", ["Same text.", "Same text."], encode)
+    embed_with_cache(cache, "model", ["  Same\n text. "], encode)
+    assert encode.calls == [["Same text."]]
+
+
+def test_models_do_not_share_entries():
+    cache, encode = EmbeddingCache(), CountingEncoder()
+    embed_with_cache(cache, "a", DRAFT, encode)
+    embed_with_cache(cache, "b", DRAFT, encode)
+    assert encode.encoded == 2 * len(DRAFT)
+
+
+def test_without_a_cache_every_text_is_encoded():
+    encode = CountingEncoder()
+    embed_with_cache(None, "model", DRAFT, encode)
+    embed_with_cache(None, "model", DRAFT, encode)
+    assert encode.encoded == 2 * len(DRAFT)
+
+
+def test_longformer_revision_reaches_the_encoder_once(monkeypatch):
+    encode = CountingEncoder()
+    monkeypatch.setattr(app, "embedding_cache", EmbeddingCache())
+    monkeypatch.setattr(app, "encode_longformer_batches", lambda texts, mode: encode(texts))
+
+    app.longformer_embed_paragraphs(DRAFT, mode="bucketed")
+    app.longformer_embed_paragraphs(revised(DRAFT), mode="bucketed")
+    assert encode.calls[1] == [revised(DRAFT)[3]]
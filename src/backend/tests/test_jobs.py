@@ -0,0 +1,90 @@
+import threading
+import time
+
+from jobs import JobQueue, JobStore
+
+
+def test_a_job_is_claimed_by_one_worker_only(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    first, second = JobStore(path), JobStore(path)
+    job_id = first.create({})
+
+    assert first.claim(job_id, "worker-a", 60)
+    assert not second.claim(job_id, "worker-b", 60)
+    assert second.unfinished() == []
+
+
+def test_running_jobs_are_resumed_only_once_their_lease_expires(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.create({})
+    store.claim(job_id, "worker-a", 0.05)
+    assert store.unfinished() == []
+
+    time.sleep(0.1)
+    assert store.unfinished() == [job_id]
+    assert store.claim(job_id, "worker-b", 60)
+
+
+def test_processes_sharing_a_database_run_each_job_once(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    runs, lock = [], threading.Lock()
+
+    def runner(job, store):
+        with lock:
+            runs.append(job["id"])
+        time.sleep(0.05)
+        return {"success": True}
+
+    submitter = JobQueue(JobStore(path), runner)
+    job_ids = [submitter.submit({}) for _ in range(4)]
+    JobQueue(JobStore(path), runner).start()  # a sibling process starting up, re-queueing unfinished jobs
+
+    deadline = time.time() + 5
+    while time.time() < deadline and any(submitter.store.get(job_id)["status"] != "done" for job_id in job_ids):
+        time.sleep(0.02)
+    assert sorted(runs) == sorted(job_ids)
+
+
+def test_only_the_lease_holder_records_the_outcome(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.create({})
+    store.claim(job_id, "worker-a", 60)
+
+    assert not store.set_status(job_id, "done", "worker-b", result={"success": True}, event=("done", {}))
+    assert store.get(job_id)["status"] == "running"
+    assert store.events(job_id) == []
+
+    assert store.set_status(job_id, "done", "worker-a", result={"success": True}, event=("done", {"success": True}))
+    assert store.get(job_id)["status"] == "done"
+    assert [item["event"] for item in store.events(job_id)] == ["done"]
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline and not predicate():
+        time.sleep(0.02)
+
+
+def test_a_failed_job_reports_failure(tmp_path):
+    def runner(job, store):
+        raise ValueError("bad essay")
+
+    queue = JobQueue(JobStore(str(tmp_path / "jobs.sqlite3")), runner)
+    job_id = queue.submit({})
+    wait_for(lambda: queue.store.get(job_id)["status"] == "failed")
+
+    assert queue.store.events(job_id)[-1] == {"seq": 1, "event": "error", "data": {"success": False, "error": "bad essay"}}
+
+
+def test_a_worker_that_lost_its_lease_drops_its_result(tmp_path):
+    def runner(job, store):
+        # Meanwhile the lease lapsed and another worker claimed the job
+        store._db.execute("UPDATE jobs SET owner = 'worker-b' WHERE id = ?", (job["id"],))
+        return {"success": True}
+
+    queue = JobQueue(JobStore(str(tmp_path / "jobs.sqlite3")), runner)
+    job_id = queue.submit({})
+    wait_for(lambda: queue.stats()["skipped"] == 1)
+
+    assert queue.store.get(job_id)["status"] == "running"
+    assert queue.store.events(job_id) == []
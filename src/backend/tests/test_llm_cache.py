@@ -0,0 +1,49 @@
+import app
+from benchmarks.stub_openai import StubOpenAI
+from llm_cache import ResponseCache
+
+ESSAY = "Memory shapes who we are.\n\nLanguage carries memory from one generation to the next."
+
+
+def test_key_ignores_parameter_order():
+    assert ResponseCache.key({"model": "gpt-4o", "temperature": 0}) == ResponseCache.key({"temperature": 0, "model": "gpt-4o"})
+    assert ResponseCache.key({"model": "gpt-4o"}) != ResponseCache.key({"model": "gpt-4o-mini"})
+
+
+def test_round_trip_and_expiry(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    cache.put("k", {"content": "hello"})
+    assert cache.get("k") == {"content": "hello"}
+    assert cache.get("other") is None
+
+    expired = ResponseCache(str(tmp_path / "expired.sqlite3"), ttl_seconds=-1)
+    expired.put("k", {"content": "hello"})
+    assert expired.get("k") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=60)
+    cache.put("a", "x" * 20)
+    cache.put("b", "y" * 20)
+    cache.get("a")
+    cache.put("c", "z" * 20)
+    assert cache.get("a") is not None and cache.get("b") is None
+    assert cache.stats()["evicted"] == 1
+
+
+def test_repeated_theme_request_is_served_from_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "llm_cache", ResponseCache(str(tmp_path / "cache.sqlite3")))
+    stub = StubOpenAI()
+    first = app.create_chat_completion(stub, use_cache=True, stage="theme", **app.essay_theme_request(ESSAY))
+    second = app.create_chat_completion(stub, use_cache=True, stage="theme", **app.essay_theme_request(ESSAY))
+
+    assert stub.call_count() == 1
+    assert second.choices[0].message.content == first.choices[0].message.content
+
+
+def test_truncated_responses_are_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "llm_cache", ResponseCache(str(tmp_path / "cache.sqlite3")))
+    stub = StubOpenAI(lambda messages, model: ("The essay explores", "length"))
+    for _ in range(2):
+        app.create_chat_completion(stub, use_cache=True, stage="theme", **app.essay_theme_request(ESSAY))
+    assert stub.call_count() == 2
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+
+from llm_scheduler import LLMScheduler
+
+
+class ServerError(Exception):
+    status_code = 500
+
+
+def test_async_calls_hold_a_slot_but_no_worker_thread():
+    scheduler = LLMScheduler(max_concurrency=2)
+    running, peak, threads = 0, 0, set()
+
+    async def llm_call():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        threads.add(threading.current_thread())
+        await asyncio.sleep(0.02)
+        running -= 1
+        return "ok"
+
+    async def main():
+        return await asyncio.gather(*(scheduler.acall(llm_call, request_id=f"r{i % 3}") for i in range(8)))
+
+    assert asyncio.run(main()) == ["ok"] * 8
+    assert peak == 2
+    assert threads == {threading.main_thread()}
+    stats = scheduler.stats()
+    assert stats["completed"] == 8 and stats["in_flight"] == 0
+
+
+def test_sync_calls_wait_for_slots_held_by_async_calls():
+    scheduler = LLMScheduler(max_concurrency=1)
+    order = []
+
+    async def main():
+        granted = asyncio.Event()
+
+        async def llm_call():
+            granted.set()
+            await asyncio.sleep(0.05)
+            order.append("async")
+
+        task = asyncio.ensure_future(scheduler.acall(llm_call))
+        await granted.wait()
+        sync = scheduler.submit(lambda: order.append("sync"))
+        await task
+        await asyncio.wrap_future(sync)
+
+    asyncio.run(main())
+    assert order == ["async", "sync"]
+
+
+def test_async_calls_retry_transient_errors_on_the_event_loop():
+    scheduler = LLMScheduler(max_concurrency=1, base_delay=0.0)
+    attempts = []
+
+    async def llm_call():
+        attempts.append(threading.current_thread())
+        if len(attempts) < 3:
+            raise ServerError()
+        return "ok"
+
+    assert asyncio.run(scheduler.acall(llm_call)) == "ok"
+    assert attempts == [threading.main_thread()] * 3
+    assert scheduler.stats()["retries"] == 2
+
+
+def test_a_cancelled_async_call_gives_its_slot_back():
+    scheduler = LLMScheduler(max_concurrency=1)
+
+    async def main():
+        task = asyncio.ensure_future(scheduler.acall(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return await scheduler.acall(lambda: asyncio.sleep(0, "next"))
+
+    assert asyncio.run(main()) == "next"
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_a_stream_holds_its_slot_until_it_is_closed():
+    scheduler = LLMScheduler(max_concurrency=1)
+    stream = scheduler.stream(lambda: iter(range(3)))
+    assert next(stream) == 0
+    assert scheduler.stats()["in_flight"] == 1
+    queued = scheduler.submit(lambda: "after")
+    assert not queued.done()
+
+    stream.close()
+    assert queued.result(timeout=5) == "after"
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_a_stream_read_to_the_end_frees_its_slot():
+    scheduler = LLMScheduler(max_concurrency=1)
+    assert list(scheduler.stream(lambda: iter("abc"))) == ["a", "b", "c"]
+    stats = scheduler.stats()
+    assert stats["completed"] == 1 and stats["in_flight"] == 0
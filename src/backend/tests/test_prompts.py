@@ -0,0 +1,182 @@
+import json
+import os
+
+import pytest
+
+import app
+import prompts
+from benchmarks.bench_evaluation import make_meta_result
+from benchmarks.stub_openai import make_rubric
+from prompts import PromptBuilder, TokenUsage, count_message_tokens, count_tokens, prompt_budget
+
+
+class WordEncoding:
+    """Stand-in for a tiktoken encoding: one token per word, counting encode calls."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, text, disallowed_special=()):
+        self.encoded.append(text)
+        return text.split(" ")
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def encoding(monkeypatch):
+    encoding = WordEncoding()
+    monkeypatch.setattr(prompts, "get_encoding", lambda model: encoding)
+    monkeypatch.setattr(prompts, "_token_counts", type(prompts._token_counts)())
+    return encoding
+
+
+def words(count, word="word"):
+    return " ".join([word] * count)
+
+
+def test_counts_are_memoized(encoding):
+    messages = [{"content": words(5)}, {"content": words(7)}]
+    assert count_message_tokens(messages) == count_message_tokens(messages) == 5 + 7 + 2 * 4 + 3
+    assert len(encoding.encoded) == 2
+
+
+def test_over_budget_drops_lowest_priority_sections_first(encoding):
+    prompt = PromptBuilder("gpt-4o", budget=25)
+    prompt.add(words(10, "static"))
+    prompt.add(words(10, "low"), priority=1, name="low")
+    prompt.add(words(10, "high"), priority=2, name="high")
+    text = prompt.build()
+
+    assert prompt.dropped == ["low"]
+    assert text.startswith("static") and "high" in text and "low" not in text
+
+
+def test_trimmable_sections_are_cut_after_optional_ones_are_dropped(encoding):
+    prompt = PromptBuilder("gpt-4o", budget=12)
+    prompt.add(words(5, "static"))
+    prompt.add(words(10, "optional"), priority=1, name="optional")
+    prompt.add(words(20, "paragraph"), trim=True, name="paragraph")
+    text = prompt.build(overhead=2)
+
+    assert prompt.dropped == ["optional", "paragraph (trimmed)"]
+    assert prompt.tokens() <= 10
+    assert text.startswith("static") and text.endswith("...")
+
+
+def test_each_section_is_tokenized_once_per_build(encoding):
+    prompt = PromptBuilder("gpt-4o", budget=20)
+    for priority in range(1, 6):
+        prompt.add(words(10, f"section{priority}"), priority=priority)
+    prompt.build()
+    assert len(encoding.encoded) == 5
+
+
+def test_without_a_budget_the_prompt_is_unchanged(encoding):
+    prompt = PromptBuilder("gpt-4o").add(words(1000), priority=1)
+    assert prompt.build() == words(1000)
+    assert prompt.dropped == []
+
+
+def test_character_estimate_without_tiktoken(monkeypatch):
+    monkeypatch.setattr(prompts, "get_encoding", lambda model: None)
+    assert count_tokens("x" * 40) == 10
+
+
+def test_prompt_budget():
+    assert prompt_budget("gpt-4", max_tokens=1000) == 8192 - 1000
+    assert prompt_budget("gpt-4o", max_tokens=1000, budgets={"gpt-4o": 6000}) == 6000
+
+
+def test_token_usage_totals_per_stage():
+    class Usage:
+        prompt_tokens, completion_tokens, prompt_tokens_details = 100, 20, None
+
+    usage = TokenUsage()
+    usage.record("paragraph", Usage(), estimated_prompt_tokens=98)
+    usage.record("paragraph", cache_hit=True)
+    assert usage.stats()["paragraph"] == {
+        "calls": 1, "cache_hits": 1, "prompt_tokens": 100, "cached_tokens": 0,
+        "completion_tokens": 20, "estimated_prompt_tokens": 98,
+    }
+
+
+def test_paragraph_prompts_put_the_static_parts_first():
+    meta_result = make_meta_result(["The first paragraph.", "The second paragraph.", "The third paragraph."])
+    compiled = app.compiled_criterion(make_rubric(1)["Criteria"][0], meta_result)
+    first, last = (app.paragraph_evaluation_request(compiled, meta_result, idx)["messages"][-1]["content"] for idx in (0, 2))
+
+    shared = len(os.path.commonprefix([first, last]))
+    assert meta_result["gpt_summary"] in first[:shared]
+    assert "The first paragraph." not in first[:shared]
+
+
+FEEDBACK = [
+    {
+        "paragraph": idx + 1,
+        "criterion": "Thesis",
+        "score": 3 + idx % 3,
+        "feedback": f"Paragraph {idx + 1} supports the claim about memory, but its link to the thesis stays implicit.",
+        "suggestions": [f"Tie the image in paragraph {idx + 1} back to the thesis in one closing sentence."],
+    }
+    for idx in range(8)
+]
+
+
+def baseline_summary_prompt(compiled, meta_result, paragraph_feedback):
+    """The summary prompt before compaction: the same context, with the feedback as indented JSON."""
+    structured_summary = meta_result["structured_summary"]
+    coherence_issues = [issue for issue in structured_summary["coherence_issues"] if issue]
+    return f"""
+You are an expert essay evaluator. Based on the following paragraph-by-paragraph evaluations for the criterion '{compiled["name"]}', write a final overall score and detailed summary for the entire essay under this criterion.
+
+### Essay Meta-Summary (Context for Reference):
+- **Theme**: {meta_result["gpt_summary"]}
+- **Dominant Features by Paragraph**: {', '.join(structured_summary['dominant_features'])}
+- **Coherence Issues Noted**: {', '.join(coherence_issues) if coherence_issues else "None"}
+- **Logical Flow (Average Coherence Score)**: {structured_summary['logical_flow']}
+
+### Paragraph Evaluations:
+{json.dumps(paragraph_feedback, indent=2)}
+
+---
+
+### TASK — Follow **strictly and deeply**:
+
+1. **Evaluate how well the essay meets '{compiled["name"]}' using the Scoring Rubric: {compiled["rubric_formatted"]}**. Focus entirely on what the rubric defines for this criterion and analyze how well the essay fulfills that. (DO NOT inclue score in summary)
+2. **Use meta-summary insights (coherence, flow) ONLY if directly relevant to this criterion and scoring rubric**. Avoid addressing unrelated issues (e.g., don’t address organization when grading focus).
+3. Provide **2-3 actionable, deeply text-based suggestions**:
+    - Quote **precise phrases or moments** from at least 2-3 different paragraphs. 
+    - Embed the suggestions as **natural parts of the analysis** (NO lists or bullet points).
+    - For each suggestion:
+        - (a) **Rewrite awkward, vague, or weak phrases fully** (e.g., "The author could write: '___'.").
+        - (b) For weak word choice, give **two vivid, precise alternatives** (e.g., "'important' to 'pivotal' or 'crucial'").
+        - (c) If flow/coherence undermines this criterion (e.g., it makes focus unclear or weakens voice), give a **model transition sentence** to solve it — but **do NOT address flow unless it affects this criterion**.
+4. Avoid vague advice — be **precise, detailed, and fully grounded in essay text and rubric for this criterion**.
+5. **End with a deep, insightful reflection fully tied to this criterion**:
+    - Explicitly connect suggestions to **the essay’s theme**, showing how they strengthen this specific criterion (e.g., how voice, word choice, focus relate to the theme of resilience and colonization).
+    - Explain how **clarity, precision, and emotional/analytical impact on the reader** will improve — but only as relevant to this criterion.
+    - Reflect on how **readers will better understand, engage with, or emotionally connect to the essay** if this criterion is strengthened.
+    - Be **specific and concrete** — avoid generic claims like "this will improve the essay" and **directly tie** to the purpose of the criterion.
+
+--- 
+
+### **Respond ONLY in this JSON (DO NOT inclue score in summary):**
+{{
+    "criterion": "{compiled["name"]}",
+    "summary_feedback": "Detailed, meta-aware analysis following all points above. Concrete examples from essay text required. (Escape all quotes, no line breaks inside this string)."
+}}
+"""
+
+
+def test_summary_prompt_is_smaller_than_the_indented_json_baseline():
+    meta_result = make_meta_result([f"Paragraph {idx + 1} of the sample essay." for idx in range(len(FEEDBACK))])
+    compiled = app.compiled_criterion(make_rubric(1)["Criteria"][0], meta_result)
+    system = "You are a structured essay evaluator based off of meta-summary."
+    baseline = [{"role": "system", "content": system}, {"role": "user", "content": baseline_summary_prompt(compiled, meta_result, FEEDBACK)}]
+
+    request = app.criterion_summary_request(compiled, meta_result, FEEDBACK)
+    assert "Tie the image in paragraph 8" in request["messages"][-1]["content"]  # nothing was trimmed
+
+    assert count_message_tokens(request["messages"], "gpt-4") < count_message_tokens(baseline, "gpt-4")
@@ -0,0 +1,112 @@
+import pytest
+
+import app
+from benchmarks.bench_evaluation import make_meta_result
+from benchmarks.stub_openai import StubOpenAI, default_responder
+from jobs import JobStore
+from revisions import RevisionPlan, align_paragraphs
+
+DRAFT = [
+    "Memory shapes identity in ways we rarely notice.",
+    "The narrator remembers her grandmother's kitchen in vivid detail.",
+    "Language carries those memories from one generation to the next.",
+    "In the end, the essay argues that forgetting is a kind of loss.",
+]
+RUBRIC_TEXT = "Thesis: clear and arguable. Evidence: relevant and analyzed. Organization: logical. Style: precise."
+
+
+def essay(paragraphs):
+    return "\n\n".join(paragraphs)
+
+
+def revise(paragraphs, index, addition=" The revision adds one more sentence here."):
+    paragraphs = list(paragraphs)
+    paragraphs[index] += addition
+    return paragraphs
+
+
+def test_alignment_pairs_same_revised_and_new_paragraphs():
+    new = [DRAFT[0], DRAFT[1] + " An added clause.", "A brand new paragraph about something else entirely.", DRAFT[2], DRAFT[3]]
+    assert align_paragraphs(DRAFT, new) == [(0, "same"), (1, "revised"), (None, "new"), (2, "same"), (3, "same")]
+
+
+def test_a_changed_paragraph_and_its_successor_are_reevaluated():
+    plan = RevisionPlan(DRAFT, revise(DRAFT, 1))
+    assert plan.reevaluate == {1, 2}
+    assert plan.summary()["unchanged"] == 3 and plan.summary()["revised"] == 1
+
+
+def test_removed_paragraphs_are_reported():
+    plan = RevisionPlan(DRAFT, DRAFT[:2] + DRAFT[3:])
+    assert plan.removed == [2]
+    assert plan.reevaluate == {2}  # its new predecessor changed
+
+
+class RecordingStub(StubOpenAI):
+    """The stub client, keeping each call's last prompt."""
+
+    def __init__(self):
+        self.prompts = []
+        super().__init__(self.respond)
+
+    def respond(self, messages, model):
+        self.prompts.append(messages[-1]["content"])
+        return default_responder(messages, model)
+
+    def paragraph_calls(self, since=0):
+        return sum(1 for prompt in self.prompts[since:] if "to Evaluate" in prompt and "### Paragraphs" not in prompt)
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    stub = RecordingStub()
+    monkeypatch.setattr(app, "client", stub)
+    monkeypatch.setattr(app, "llm_cache", None)
+    monkeypatch.setattr(app, "PARAGRAPH_REUSE", False)
+    monkeypatch.setattr(app, "PARAGRAPH_SEGMENTER", "hybrid")  # structure only, no MiniLM
+    monkeypatch.setattr(app, "EVALUATION_MODE", "per_criterion")
+    # No encoder models: the structured summary is canned
+    monkeypatch.setattr(app, "encode_paragraphs_with_longformer", lambda paragraphs: make_meta_result(paragraphs)["structured_summary"])
+    return stub
+
+
+def test_one_paragraph_revision_regrades_one_paragraph_per_criterion(stub):
+    first = app.run_analysis(essay(DRAFT), RUBRIC_TEXT)
+    criteria = len(first["results"])
+    assert stub.paragraph_calls() == criteria * len(DRAFT)
+
+    before = len(stub.prompts)
+    second = app.run_analysis(essay(revise(DRAFT, 3)), RUBRIC_TEXT, previous_analysis_id=first["analysis_id"])
+
+    assert second["revision"]["incremental"] is True
+    assert second["revision"]["reevaluated"] == [4]
+    assert stub.paragraph_calls(before) == criteria
+
+
+def test_job_analyses_can_be_revised_incrementally(stub):
+    store = JobStore(":memory:")
+    job_id = store.create({"essay_text": essay(DRAFT), "rubric_text": RUBRIC_TEXT})
+    result = app.run_analysis_job(store.get(job_id), store)
+
+    revision = app.run_analysis(essay(revise(DRAFT, 3)), RUBRIC_TEXT, previous_analysis_id=result["analysis_id"])
+    assert revision["revision"]["incremental"] is True
+
+
+def test_feedback_is_not_reused_when_a_paragraph_prompt_changes(stub, monkeypatch):
+    first = app.run_analysis(essay(DRAFT), RUBRIC_TEXT)
+    criteria = len(first["results"])
+
+    def shifted_summary(paragraphs):
+        summary = make_meta_result(paragraphs)["structured_summary"]
+        summary["dominant_features"][1] = "Paragraph 2 focuses on feature 7"
+        return summary
+
+    monkeypatch.setattr(app, "encode_paragraphs_with_longformer", shifted_summary)
+    before = len(stub.prompts)
+    second = app.run_analysis(essay(DRAFT), RUBRIC_TEXT, previous_analysis_id=first["analysis_id"])
+
+    assert second["revision"]["incremental"] is True
+    assert stub.paragraph_calls(before) == criteria  # paragraph 2's prompt changed, the text did not
+    # Dominant features are not part of the summary key, and the feedback came back the same
+    assert not any("paragraph-by-paragraph evaluations" in prompt for prompt in stub.prompts[before:])
+
@@ -0,0 +1,66 @@
+import numpy as np
+
+import app
+from benchmarks.stub_openai import StubOpenAI
+from segmenter import segment_paragraphs, structural_paragraphs
+
+
+def sentences(topic, count):
+    return [f"This is sentence {i} about {topic}." for i in range(count)]
+
+
+def topic_encoder(texts):
+    """Sentence embedder that puts each topic on its own axis."""
+    return np.array([[1.0, 0.0] if "rivers" in text else [0.0, 1.0] for text in texts])
+
+
+def test_blank_lines_separate_paragraphs_and_hard_wraps_are_joined():
+    text = "The first paragraph\nwraps onto a second line.\n\nThe second paragraph ends here."
+    assert segment_paragraphs(text) == (["The first paragraph wraps onto a second line.", "The second paragraph ends here."], "structure")
+
+
+def test_one_paragraph_per_line_when_lines_end_like_sentences():
+    text = "The first paragraph is one line.\nThe second one is too.\nSo is the third."
+    assert structural_paragraphs(text) == text.splitlines()
+
+
+def test_headings_stay_with_their_paragraph():
+    text = "Introduction\n\nMemory shapes identity.\n\nA new paragraph starts here."
+    assert structural_paragraphs(text) == ["Introduction\nMemory shapes identity.", "A new paragraph starts here."]
+
+
+def test_paragraphs_broken_by_a_page_boundary_are_joined():
+    text = "Memory shapes who we are in ways we rarely notice, and\n\nlanguage carries it forward.\n\nA new paragraph starts here."
+    assert structural_paragraphs(text) == [
+        "Memory shapes who we are in ways we rarely notice, and language carries it forward.",
+        "A new paragraph starts here.",
+    ]
+
+
+def test_unstructured_text_needs_an_encoder():
+    text = " ".join(sentences("rivers", 6) + sentences("mountains", 6))
+    assert segment_paragraphs(text) == (None, None)
+
+    paragraphs, method = segment_paragraphs(text, topic_encoder, min_sentences=3, max_sentences=8)
+    assert method == "topic"
+    assert paragraphs == [" ".join(sentences("rivers", 6)), " ".join(sentences("mountains", 6))]
+
+
+def test_structured_essays_are_split_without_an_llm_call(monkeypatch):
+    stub = StubOpenAI()
+    monkeypatch.setattr(app, "client", stub)
+    monkeypatch.setattr(app, "PARAGRAPH_SEGMENTER", "hybrid")
+
+    assert app.split_paragraphs("First paragraph here.\n\nSecond paragraph here.", use_cache=False) == [
+        "First paragraph here.", "Second paragraph here.",
+    ]
+    assert stub.call_count() == 0
+
+
+def test_unstructured_essays_fall_back_to_the_llm_in_hybrid_mode(monkeypatch):
+    stub = StubOpenAI()
+    monkeypatch.setattr(app, "client", stub)
+    monkeypatch.setattr(app, "PARAGRAPH_SEGMENTER", "hybrid")
+
+    app.split_paragraphs("one long line of text without any paragraph structure", use_cache=False)
+    assert stub.call_count() == 1
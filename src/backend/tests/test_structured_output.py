@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import pytest
+
+import structured_output
+from benchmarks.stub_openai import make_completion, repair_reply
+from structured_output import SchemaMismatchError, StructuredOutputError, aparse_reply, parse_reply
+
+EVALUATION = {"paragraph": 1, "criterion": "Thesis", "score": 4, "feedback": "Clear and arguable.", "suggestions": []}
+
+
+def reply(content, finish_reason="stop"):
+    return make_completion(content, "gpt-4o", finish_reason=finish_reason)
+
+
+class Repairer:
+    """A repair callable answering like the stub's repair model, counting its calls."""
+
+    def __init__(self, answer=None):
+        self.answer = answer
+        self.calls = 0
+
+    def __call__(self, params):
+        self.calls += 1
+        return reply(self.answer if self.answer is not None else repair_reply(params["messages"][-1]["content"]))
+
+
+@pytest.fixture(autouse=True)
+def repair_enabled(monkeypatch):
+    monkeypatch.setattr(structured_output, "REPAIR_ENABLED", True)
+
+
+def test_fenced_replies_are_extracted_without_repair():
+    repair = Repairer()
+    assert parse_reply("paragraph_evaluation", "test", reply(f"```json\n{json.dumps(EVALUATION)}\n```"), repair) == EVALUATION
+    assert repair.calls == 0
+
+
+def test_truncated_replies_are_repaired():
+    text = json.dumps(EVALUATION)
+    cut = text[:text.index('"suggestions"') + 5]
+    repair = Repairer()
+    value = parse_reply("paragraph_evaluation", "test", reply(cut, "length"), repair)
+    assert value["score"] == 4 and repair.calls == 1
+
+
+def test_a_missing_score_is_never_repaired():
+    repair = Repairer()
+    without_score = {key: value for key, value in EVALUATION.items() if key != "score"}
+    with pytest.raises(SchemaMismatchError):
+        parse_reply("paragraph_evaluation", "test", reply(json.dumps(without_score)), repair)
+    assert repair.calls == 0
+
+
+def test_repairs_that_invent_a_score_are_rejected():
+    text = json.dumps(EVALUATION)
+    cut = text[:text.index('"score"')]  # cut off before the score
+    repair = Repairer(json.dumps(EVALUATION))
+    with pytest.raises(StructuredOutputError, match="not in the original"):
+        parse_reply("paragraph_evaluation", "test", reply(cut, "length"), repair)
+
+
+def test_async_parsing_repairs_the_same_way():
+    text = json.dumps(EVALUATION)
+    cut = text[:text.index('"suggestions"') + 5]
+    repair = Repairer()
+
+    async def arepair(params):
+        return repair(params)
+
+    value = asyncio.run(aparse_reply("paragraph_evaluation", "test", reply(cut, "length"), arepair))
+    assert value["score"] == 4 and repair.calls == 1
+
+
+def test_a_failed_repair_call_is_reported():
+    def repair(params):
+        raise ConnectionError("offline")
+
+    with pytest.raises(StructuredOutputError, match="the repair call failed: offline"):
+        parse_reply("paragraph_evaluation", "test", reply("{not json", "stop"), repair)
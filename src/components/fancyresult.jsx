@@ -18,6 +18,7 @@ const ResultsPage = () => {
   const [chatMessage, setChatMessage] = useState('');
   const [chatHistory, setChatHistory] = useState([]);
   const [isLoading, setIsLoading] = useState(false);
+  const [chatSessionId, setChatSessionId] = useState(null);
   
   // Reference for auto-scrolling chat
   const chatContainerRef = useRef(null);
@@ -40,6 +41,76 @@ const ResultsPage = () => {
     }
   }, [chatHistory]);
 
+  // Extract essay text from rawFeedback if available
+  const getEssayText = () => {
+    // Try to get essay text from different possible locations in the feedback data
+    if (rawFeedback && rawFeedback.essay_text) {
+      return rawFeedback.essay_text;
+    } else if (rawFeedback && rawFeedback.paragraphs) {
+      return rawFeedback.paragraphs.join('\n\n');
+    } else if (rawFeedback && rawFeedback.results && 
+              rawFeedback.results[0] && 
+              Array.isArray(rawFeedback.results[0].paragraphs)) {
+      // If paragraphs are in the first result item
+      return rawFeedback.results[0].paragraphs.join('\n\n');
+    }
+    return "";
+  };
+
+  // Opens the server-side chat session on the first message
+  const getChatSession = async () => {
+    if (chatSessionId) {
+      return chatSessionId;
+    }
+    const payload = rawFeedback && rawFeedback.analysis_id
+      ? { analysis_id: rawFeedback.analysis_id }
+      : { feedback: rawFeedback && rawFeedback.results, essay_text: getEssayText() };
+
+    const response = await fetch('http://127.0.0.1:5000/chat/sessions', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(payload),
+    });
+    const data = await response.json();
+    if (!data.success) {
+      throw new Error(data.error || 'Could not start chat session');
+    }
+    setChatSessionId(data.session_id);
+    return data.session_id;
+  };
+
+  const appendToLastMessage = (text) => {
+    setChatHistory(prev => {
+      const last = prev[prev.length - 1];
+      return [...prev.slice(0, -1), { ...last, message: last.message + text }];
+    });
+  };
+
+  // Reads a Server-Sent Events response, calling onEvent(event, data) for each event
+  const readChatStream = async (response, onEvent) => {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) {
+        break;
+      }
+      buffer += decoder.decode(value, { stream: true });
+      const blocks = buffer.split('\n\n');
+      buffer = blocks.pop();
+      for (const block of blocks) {
+        const event = block.match(/^event: (.*)$/m);
+        const data = block.match(/^data: (.*)$/m);
+        if (event && data) {
+          onEvent(event[1], JSON.parse(data[1]));
+        }
+      }
+    }
+  };
+
   const handleSendMessage = async (e) => {
     e.preventDefault();
     
@@ -55,55 +126,30 @@ const ResultsPage = () => {
       setIsLoading(true);
       
       try {
-        // Extract essay text from rawFeedback if available
-        let essayText = "";
-        
-        // Try to get essay text from different possible locations in the feedback data
-        if (rawFeedback && rawFeedback.essay_text) {
-          essayText = rawFeedback.essay_text;
-        } else if (rawFeedback && rawFeedback.paragraphs) {
-          essayText = rawFeedback.paragraphs.join('\n\n');
-        } else if (rawFeedback && rawFeedback.results && 
-                  rawFeedback.results[0] && 
-                  Array.isArray(rawFeedback.results[0].paragraphs)) {
-          // If paragraphs are in the first result item
-          essayText = rawFeedback.results[0].paragraphs.join('\n\n');
-        }
-        
-        console.log("Essay text extracted:", essayText ? "Yes (length: " + essayText.length + ")" : "No");
-        
-        // Create payload with message, feedback context, chat history, and essay
-        const payload = {
-          message: chatMessage,
-          feedback: JSON.stringify(rawFeedback), // Stringify the full feedback object
-          chatHistory: chatHistory,
-          essay_text: essayText
-        };
-        
-        // Make API call to backend
-        const response = await fetch('http://127.0.0.1:5000/chat', {
+        const sessionId = await getChatSession();
+
+        // Only the new message is sent; the server keeps the essay, feedback and history
+        const response = await fetch(`http://127.0.0.1:5000/chat/sessions/${sessionId}/messages`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
           },
-          body: JSON.stringify(payload),
+          body: JSON.stringify({ message: chatMessage }),
         });
         
         if (!response.ok) {
           throw new Error('Network response was not ok: ' + response.status);
         }
         
-        const data = await response.json();
-        
-        if (data.success) {
-          // Add AI response to chat
-          setChatHistory(prev => [...prev, { user: false, message: data.response }]);
-        } else {
-          setChatHistory(prev => [...prev, { 
-            user: false, 
-            message: "Sorry, I encountered an error: " + (data.error || "Unknown error") 
-          }]);
-        }
+        // Add an empty AI message and fill it in as tokens stream in
+        setChatHistory(prev => [...prev, { user: false, message: '' }]);
+        await readChatStream(response, (event, data) => {
+          if (event === 'token') {
+            appendToLastMessage(data.text);
+          } else if (event === 'error') {
+            appendToLastMessage("Sorry, I encountered an error: " + (data.error || "Unknown error"));
+          }
+        });
       } catch (error) {
         console.error('Error sending message:', error);
         setChatHistory(prev => [...prev, { 